@@ -176,7 +176,8 @@ async def chat_single_message(request: Request):
                 'max_tokens': max_tokens,
                 'temperature': temperature,
                 'system_prompt': system_prompt if system_prompt.strip() else None
-            }
+            },
+            'speculative': response.get('speculative')
         }
         
     except HTTPException:
@@ -204,6 +205,19 @@ async def chat_stream(request: Request):
         if not model_manager.is_model_loaded():
             raise HTTPException(status_code=400, detail="No model is currently loaded")
         
+        # Reject over-length prompts before the stream is opened
+        token_counts = model_manager.count_prompt_tokens(
+            message=message,
+            max_tokens=max_tokens,
+            system_prompt=system_prompt if system_prompt.strip() else None
+        )
+        if token_counts["status"] == "success" and not token_counts["fits"]:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Prompt is {token_counts['prompt_tokens']} tokens; with max_tokens={max_tokens} "
+                       f"it exceeds the model context of {token_counts['max_seq_length']} tokens"
+            )
+        
         async def generate_stream():
             try:
                 # Generate streaming response
@@ -9,7 +9,7 @@ from datetime import datetime
 from models.dataset_models import (
     DatasetCreateRequest, DatasetCreateResponse, DatasetListResponse,
     DatasetPreviewResponse, DatasetUpdateRequest, DatasetUsageResponse,
-    ProcessedDataset
+    DatasetVersionRequest, ProcessedDataset
 )
 from services.dataset_service import dataset_service
 
@@ -26,7 +26,7 @@ async def create_dataset(request: DatasetCreateRequest):
             return DatasetCreateResponse(
                 success=True,
                 dataset_id=result['dataset_id'],
-                message=f"Dataset '{request.name}' created successfully",
+                message=f"Dataset '{request.name}' is being created",
                 dataset=result['dataset']
             )
         else:
@@ -116,25 +116,26 @@ async def preview_dataset(dataset_id: str, limit: int = 10):
 
 @router.get("/{dataset_id}/download")
 async def download_dataset(dataset_id: str):
-    """Download the complete dataset as JSON"""
+    """Download the complete dataset as JSONL, streamed from its stored segments"""
     try:
-        from fastapi.responses import FileResponse
-        import os
+        from fastapi.responses import StreamingResponse
         
         dataset = dataset_service.get_dataset(dataset_id)
         if not dataset:
             raise HTTPException(status_code=404, detail="Dataset not found")
         
-        if not os.path.exists(dataset.file_path):
+        lines = dataset_service.iter_data_lines(dataset_id)
+        if lines is None:
             raise HTTPException(status_code=404, detail="Dataset file not found")
         
         # Track usage
         dataset_service.track_usage(dataset_id)
         
-        return FileResponse(
-            path=dataset.file_path,
-            filename=f"{dataset.name.replace(' ', '_')}.json",
-            media_type='application/json'
+        filename = f"{dataset.name.replace(' ', '_')}.jsonl"
+        return StreamingResponse(
+            lines,
+            media_type='application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
         
     except HTTPException:
@@ -293,24 +294,9 @@ async def get_datasets_overview():
 
 @router.post("/{dataset_id}/duplicate")
 async def duplicate_dataset(dataset_id: str, new_name: str):
-    """Create a copy of an existing dataset"""
+    """Create a copy of an existing dataset (shares the original's data; nothing is copied)"""
     try:
-        # Get original dataset
-        original_dataset = dataset_service.get_dataset(dataset_id)
-        if not original_dataset:
-            raise HTTPException(status_code=404, detail="Original dataset not found")
-        
-        # Create duplicate request
-        duplicate_request = DatasetCreateRequest(
-            name=new_name,
-            description=f"Copy of {original_dataset.name}",
-            source_file_id=original_dataset.source_file_id,
-            column_mapping=original_dataset.column_mapping,
-            tags=original_dataset.tags + ["duplicate"]
-        )
-        
-        # Create the duplicate
-        result = dataset_service.create_dataset(duplicate_request)
+        result = dataset_service.duplicate_dataset(dataset_id, new_name)
         
         if result['success']:
             return {
@@ -320,6 +306,8 @@ async def duplicate_dataset(dataset_id: str, new_name: str):
                 "new_dataset_id": result['dataset_id'],
                 "new_dataset": result['dataset']
             }
+        elif result['error'] == 'Original dataset not found':
+            raise HTTPException(status_code=404, detail=result['error'])
         else:
             raise HTTPException(status_code=400, detail=result['error'])
             
@@ -327,3 +315,47 @@ async def duplicate_dataset(dataset_id: str, new_name: str):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error duplicating dataset: {str(e)}")
+
+
+@router.post("/{dataset_id}/versions", response_model=DatasetCreateResponse)
+async def create_dataset_version(dataset_id: str, request: DatasetVersionRequest):
+    """Derive a new version of a dataset (sampled and/or with appended examples)"""
+    try:
+        result = dataset_service.create_version(dataset_id, request)
+        
+        if result['success']:
+            return DatasetCreateResponse(
+                success=True,
+                dataset_id=result['dataset_id'],
+                message=f"Version {result['dataset'].version} of dataset is being created",
+                dataset=result['dataset']
+            )
+        elif result['error'] == 'Dataset not found':
+            raise HTTPException(status_code=404, detail=result['error'])
+        else:
+            raise HTTPException(status_code=400, detail=result['error'])
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating dataset version: {str(e)}")
+
+
+@router.get("/{dataset_id}/versions")
+async def list_dataset_versions(dataset_id: str):
+    """List all versions in a dataset's lineage, oldest first"""
+    try:
+        versions = dataset_service.list_versions(dataset_id)
+        if versions is None:
+            raise HTTPException(status_code=404, detail="Dataset not found")
+        
+        return {
+            "success": True,
+            "dataset_id": dataset_id,
+            "versions": versions
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing dataset versions: {str(e)}")
@@ -65,7 +65,11 @@ async def deploy_model(request: DeploymentRequest, background_tasks: BackgroundT
             dtype=config_dict.get("dtype", "auto"),
             trust_remote_code=config_dict.get("trust_remote_code", False),
             enforce_eager=config_dict.get("enforce_eager", False),
-            disable_log_stats=config_dict.get("disable_log_stats", True)
+            disable_log_stats=config_dict.get("disable_log_stats", True),
+            speculative_method=config_dict.get("speculative_method"),
+            speculative_model=config_dict.get("speculative_model"),
+            num_speculative_tokens=config_dict.get("num_speculative_tokens", 5),
+            prompt_lookup_max=config_dict.get("prompt_lookup_max", 4)
         )
         
         # Deploy model
@@ -112,7 +116,11 @@ async def list_deployments():
                     "dtype": deployment.config.dtype,
                     "trust_remote_code": deployment.config.trust_remote_code,
                     "enforce_eager": deployment.config.enforce_eager,
-                    "disable_log_stats": deployment.config.disable_log_stats
+                    "disable_log_stats": deployment.config.disable_log_stats,
+                    "speculative_method": deployment.config.speculative_method,
+                    "speculative_model": deployment.config.speculative_model,
+                    "num_speculative_tokens": deployment.config.num_speculative_tokens,
+                    "prompt_lookup_max": deployment.config.prompt_lookup_max
                 }
             }
             deployment_list.append(deployment_dict)
@@ -152,7 +160,11 @@ async def get_deployment_status(deployment_id: str):
             "dtype": deployment.config.dtype,
             "trust_remote_code": deployment.config.trust_remote_code,
             "enforce_eager": deployment.config.enforce_eager,
-            "disable_log_stats": deployment.config.disable_log_stats
+            "disable_log_stats": deployment.config.disable_log_stats,
+            "speculative_method": deployment.config.speculative_method,
+            "speculative_model": deployment.config.speculative_model,
+            "num_speculative_tokens": deployment.config.num_speculative_tokens,
+            "prompt_lookup_max": deployment.config.prompt_lookup_max
         }
     )
 
@@ -2,29 +2,39 @@
 API routes for enhanced file management with manual column mapping support.
 """
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from typing import Optional, List
-import pandas as pd
-import tempfile
 import os
 import shutil
-import uuid
-import base64
-import json
+import binascii
 from datetime import datetime
 
 from models.file_models import (
     ColumnMappingRequest, ColumnMappingResponse,
     MappedPreviewRequest, MappedPreviewResponse,
     ProcessedFileResponse, TrainingExample,
-    FileUploadResponse, FileListResponse, FilePreviewResponse
+    FileUploadResponse, FileListResponse, FilePreviewResponse,
+    UploadSessionRequest, UploadCompleteRequest, UploadSessionResponse
 )
 from services.column_mapping_service import column_mapping_service
-from file_manager import file_manager
+from file_manager import file_manager, UPLOAD_CHUNK_SIZE
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
+ALLOWED_EXTENSIONS = ['.csv', '.json', '.jsonl', '.xlsx', '.xls', '.pkl', '.pickle']
+
+
+def check_file_extension(filename: str):
+    """Reject filenames whose extension is not a supported data format"""
+    file_extension = os.path.splitext(filename)[1].lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File must be one of: {', '.join(ALLOWED_EXTENSIONS)}. Got: {file_extension}"
+        )
+
 
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
@@ -64,24 +74,16 @@ async def handle_file_upload_multipart(request: Request):
             raise HTTPException(status_code=400, detail="File must have a filename")
         
         # Validate file type
-        allowed_extensions = ['.csv', '.json', '.jsonl', '.xlsx', '.xls', '.pkl', '.pickle']
-        file_extension = os.path.splitext(data_file.filename)[1].lower()
+        check_file_extension(data_file.filename)
         
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File must be one of: {', '.join(allowed_extensions)}. Got: {file_extension}"
-            )
-        
-        # Read file content
-        file_content = await data_file.read()
-        
-        # Upload file with enhanced column info
-        result = await upload_file_with_column_info(
-            file_content=file_content,
+        # Copy the spooled upload to storage chunk by chunk (off the event loop)
+        result = await run_in_threadpool(
+            file_manager.upload_file_stream,
+            data_file.file,
             original_filename=data_file.filename,
             display_name=display_name
         )
+        result = await run_in_threadpool(add_column_info, result)
         
         if result['success']:
             return FileUploadResponse(
@@ -114,28 +116,20 @@ async def handle_file_upload_base64(request: Request):
         if not original_filename:
             raise HTTPException(status_code=400, detail="original_filename is required")
         
-        # Decode base64 content
-        try:
-            file_content = base64.b64decode(file_content_b64)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
-        
         # Validate file type
-        allowed_extensions = ['.csv', '.json', '.jsonl', '.xlsx', '.xls', '.pkl', '.pickle']
-        file_extension = os.path.splitext(original_filename)[1].lower()
+        check_file_extension(original_filename)
         
-        if file_extension not in allowed_extensions:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File must be one of: {', '.join(allowed_extensions)}. Got: {file_extension}"
+        # Decode base64 content straight to disk (off the event loop)
+        try:
+            result = await run_in_threadpool(
+                file_manager.upload_base64_file,
+                file_content_b64,
+                original_filename=original_filename,
+                display_name=display_name
             )
-        
-        # Upload file with enhanced column info
-        result = await upload_file_with_column_info(
-            file_content=file_content,
-            original_filename=original_filename,
-            display_name=display_name
-        )
+        except (binascii.Error, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
+        result = await run_in_threadpool(add_column_info, result)
         
         if result['success']:
             return FileUploadResponse(
@@ -153,122 +147,137 @@ async def handle_file_upload_base64(request: Request):
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
 
 
-async def upload_file_with_column_info(
-    file_content: bytes,
-    original_filename: str,
-    display_name: Optional[str] = None
-) -> dict:
-    """Upload file and get basic column information"""
+@router.post("/uploads", response_model=UploadSessionResponse)
+async def create_upload_session(request: UploadSessionRequest):
+    """Start a resumable chunked upload
+    
+    Send the file with PUT /uploads/{upload_id}?offset=N (raw bytes), check
+    progress with GET /uploads/{upload_id} to resume after an interruption,
+    then finish with POST /uploads/{upload_id}/complete.
+    """
+    check_file_extension(request.original_filename)
+    state = file_manager.create_upload_session(
+        original_filename=request.original_filename,
+        display_name=request.display_name,
+        total_size=request.total_size
+    )
+    return UploadSessionResponse(**state)
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(upload_id: str):
+    """Get the state of a chunked upload (received_bytes is the offset to resume from)"""
+    state = file_manager.get_upload_session(upload_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return UploadSessionResponse(**state)
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Append the raw request body to an upload, starting at ``offset``
     
-    # Create temporary file for analysis
-    temp_dir = tempfile.mkdtemp()
-    file_extension = os.path.splitext(original_filename)[1].lower()
-    temp_file_path = os.path.join(temp_dir, f"upload_{uuid.uuid4().hex}{file_extension}")
+    The body is streamed to disk as it arrives, buffering at most one chunk.
+    Disk writes run in the thread pool, off the event loop.
+    """
+    state = await run_in_threadpool(file_manager.get_upload_session, upload_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Upload session not found")
     
     try:
-        # Write content to temp file
-        with open(temp_file_path, "wb") as f:
-            f.write(file_content)
-        
-        # Load data for basic analysis
-        data = load_data_file(temp_file_path)
+        buffer = bytearray()
+        async for piece in request.stream():
+            buffer.extend(piece)
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                state = await run_in_threadpool(file_manager.append_upload_chunk, upload_id, offset, bytes(buffer))
+                offset += len(buffer)
+                buffer.clear()
+        if buffer:
+            state = await run_in_threadpool(file_manager.append_upload_chunk, upload_id, offset, bytes(buffer))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return UploadSessionResponse(**state)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=FileUploadResponse)
+async def complete_upload(upload_id: str, request: Optional[UploadCompleteRequest] = None):
+    """Verify a chunked upload (optionally against a SHA-256) and register the file"""
+    state = await run_in_threadpool(file_manager.get_upload_session, upload_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    
+    # Hashing, storing and sampling the file run in the thread pool, off the event loop
+    result = await run_in_threadpool(
+        file_manager.complete_upload, upload_id, expected_sha256=request.sha256 if request else None
+    )
+    result = await run_in_threadpool(add_column_info, result)
+    if not result['success']:
+        raise HTTPException(status_code=400, detail=result['error'])
+    
+    return FileUploadResponse(
+        success=True,
+        file_id=result['file_id'],
+        message=f"File '{state['original_filename']}' uploaded successfully",
+        metadata=result['metadata']
+    )
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    """Discard a chunked upload and its partial data"""
+    if not file_manager.abort_upload(upload_id):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return {"success": True, "message": f"Upload {upload_id} aborted"}
+
+
+@router.post("/storage/gc")
+async def collect_storage_garbage():
+    """Delete stored file contents that no file or training session references"""
+    result = file_manager.collect_garbage()
+    return {"success": True, **result}
+
+
+def add_column_info(result: dict) -> dict:
+    """Add column types and statistics of a stored upload to its metadata
+    
+    Computed from the validation sample (the first rows only), so an
+    upload never parses the whole file; the background scan reads it once.
+    """
+    if not result.get('success'):
+        return result
+    
+    file_id = result['file_id']
+    try:
+        data = file_manager.load_sample(result['file_path'])
         
         # Get column information
         column_info = column_mapping_service.get_column_info(data)
-        
-        # Use existing file manager for upload
-        result = file_manager.upload_file(
-            file_content=file_content,
-            original_filename=original_filename,
-            display_name=display_name
-        )
-        
-        if result['success']:
-            # Enhance metadata with column information
-            file_id = result['file_id']
-            enhanced_metadata = result['metadata'].copy()
-            
-            # Add column information to validation details
-            validation_details = enhanced_metadata.get('validation_details', {})
-            validation_details.update({
-                'column_types': {
-                    col: info.get('data_type', 'object')
-                    for col, info in column_info['column_info'].items()
-                },
-                'column_stats': column_info['column_info']
-            })
-            
-            enhanced_metadata['validation_details'] = validation_details
-            
-            # Update file metadata in storage
-            file_manager.update_file_metadata(file_id, {
-                'validation_details': validation_details
-            })
-            
-            result['metadata'] = enhanced_metadata
-        
-        return result
-        
-    finally:
-        # Clean up temp file
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-
-
-def load_data_file(file_path: str) -> pd.DataFrame:
-    """Load data from file into DataFrame"""
-    file_extension = os.path.splitext(file_path)[1].lower()
+    except Exception as e:
+        # Unreadable data is not kept
+        file_manager.delete_file(file_id)
+        return {'success': False, 'error': f"Could not read file data: {str(e)}"}
     
-    if file_extension == '.csv':
-        return pd.read_csv(file_path)
-    elif file_extension == '.json':
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Convert complex nested objects to JSON strings before creating DataFrame
-        def serialize_complex_objects(obj):
-            if isinstance(obj, list):
-                return [serialize_complex_objects(item) for item in obj]
-            elif isinstance(obj, dict):
-                return {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in obj.items()}
-            else:
-                return obj
-        
-        if isinstance(data, list):
-            # Process each record to handle nested objects
-            processed_data = [serialize_complex_objects(record) for record in data]
-            return pd.DataFrame(processed_data)
-        elif isinstance(data, dict):
-            # Check if it's a dict with list values (columnar format)
-            if data and all(isinstance(v, list) for v in data.values()):
-                return pd.DataFrame(data)
-            else:
-                # Single object, wrap in list and process
-                processed_data = [serialize_complex_objects(data)]
-                return pd.DataFrame(processed_data)
-        else:
-            raise ValueError("Invalid JSON format")
-    elif file_extension == '.jsonl':
-        data = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    data.append(pd.read_json(line, typ='series').to_dict())
-        return pd.DataFrame(data)
-    elif file_extension in ['.xlsx', '.xls']:
-        # Read Excel file, using first sheet by default
-        return pd.read_excel(file_path, sheet_name=0)
-    elif file_extension in ['.pkl', '.pickle']:
-        # Read pickle file using pandas
-        df = pd.read_pickle(file_path)
-        # Ensure it's a DataFrame
-        if not isinstance(df, pd.DataFrame):
-            raise ValueError("Pickle file must contain a pandas DataFrame")
-        return df
-    else:
-        raise ValueError(f"Unsupported file format: {file_extension}")
+    # Enhance metadata with column information
+    enhanced_metadata = result['metadata'].copy()
+    
+    # Merge column information into the stored validation details (the
+    # background statistics pass may be updating them at the same time)
+    validation_details = file_manager.merge_validation_details(file_id, {
+        'column_types': {
+            col: info.get('data_type', 'object')
+            for col, info in column_info['column_info'].items()
+        },
+        'column_stats': column_info['column_info'],
+        'column_stats_rows': len(data)
+    })
+    if validation_details is not None:
+        enhanced_metadata['validation_details'] = validation_details
+    
+    result['metadata'] = enhanced_metadata
+    return result
 
 
 @router.get("/{file_id}/column-info")
@@ -286,7 +295,7 @@ async def get_file_column_info(file_id: str):
             raise HTTPException(status_code=404, detail="File not found on disk")
         
         # Load data and get column info
-        data = load_data_file(file_path)
+        data = file_manager.load_dataframe(file_path)
         column_info = column_mapping_service.get_column_info(data)
         
         return {
@@ -316,7 +325,7 @@ async def validate_column_mapping(file_id: str, request: ColumnMappingRequest):
             raise HTTPException(status_code=404, detail="File not found on disk")
         
         # Load data and validate mapping
-        data = load_data_file(file_path)
+        data = file_manager.load_dataframe(file_path)
         validation_result = column_mapping_service.validate_mapping(data, request.column_mapping)
         
         return {
@@ -346,7 +355,7 @@ async def save_column_mapping(file_id: str, request: ColumnMappingRequest):
             raise HTTPException(status_code=404, detail="File not found on disk")
         
         # Load data and validate mapping
-        data = load_data_file(file_path)
+        data = file_manager.load_dataframe(file_path)
         validation_result = column_mapping_service.validate_mapping(data, request.column_mapping)
         
         if not validation_result['is_valid']:
@@ -408,7 +417,7 @@ async def preview_mapped_data(file_id: str, request: MappedPreviewRequest):
             raise HTTPException(status_code=404, detail="File not found on disk")
         
         # Load data
-        data = load_data_file(file_path)
+        data = file_manager.load_dataframe(file_path)
         
         # Apply mapping and get preview
         preview_result = column_mapping_service.preview_mapping(
@@ -445,7 +454,7 @@ async def process_complete_file(file_id: str, request: ColumnMappingRequest):
             raise HTTPException(status_code=404, detail="File not found on disk")
         
         # Load data
-        data = load_data_file(file_path)
+        data = file_manager.load_dataframe(file_path)
         
         # Validate mapping first
         validation_result = column_mapping_service.validate_mapping(data, request.column_mapping)
@@ -455,11 +464,10 @@ async def process_complete_file(file_id: str, request: ColumnMappingRequest):
                 detail=f"Invalid column mapping: {'; '.join(validation_result['issues'])}"
             )
         
-        # Process the entire file
-        processed_examples = column_mapping_service.apply_mapping(data, request.column_mapping)
-        
-        # Get processing statistics
-        processing_stats = column_mapping_service.get_processing_stats(data, request.column_mapping)
+        # Process the entire file, getting processing statistics from the same pass
+        mapped = column_mapping_service.map_data(data, request.column_mapping)
+        processed_examples = mapped.examples()
+        processing_stats = mapped.stats
         
         # Update file usage statistics
         file_manager.update_file_metadata(file_id, {
@@ -541,22 +549,34 @@ async def remove_file_mapping(file_id: str):
 async def list_files(
     filter_by: Optional[str] = None,
     sort_by: Optional[str] = "upload_date",
-    sort_desc: Optional[bool] = True
+    sort_desc: Optional[bool] = True,
+    tag: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: Optional[int] = Query(None, ge=1, le=1000)
 ):
     """List all uploaded files"""
     try:
+        # Filtered, sorted and paginated in the metadata store
+        start_idx = (page - 1) * page_size if page_size else 0
         files = file_manager.list_files(
             filter_by=filter_by,
             sort_by=sort_by,
-            sort_desc=sort_desc
+            sort_desc=sort_desc,
+            tag=tag,
+            limit=page_size,
+            offset=start_idx
         )
         
+        total_files = file_manager.count_files(filter_by=filter_by, tag=tag) if page_size else len(files)
         storage_stats = file_manager.get_storage_stats()
         
         return FileListResponse(
             files=files,
-            total=len(files),
-            storage_stats=storage_stats
+            total=total_files,
+            storage_stats=storage_stats,
+            page=page,
+            page_size=page_size,
+            has_more=start_idx + len(files) < total_files
         )
         
     except Exception as e:
@@ -5,12 +5,15 @@ API routes for prediction functionality.
 from fastapi import APIRouter, HTTPException, Query
 from typing import Optional, List
 from datetime import datetime
+import asyncio
+import json
 
 from models.prediction_models import (
     StartPredictionRequest, PredictionJobResponse, ModelListResponse,
     PredictionStatusResponse, PredictionResultsResponse, PredictionJobsListResponse,
     MappingValidationRequest, MappingValidationResponse, ModelStatsResponse,
     CancelJobRequest, CancelJobResponse, DeleteJobResponse,
+    PauseJobResponse, ResumeJobResponse,
     PredictionOverviewResponse, ModelInfo, PredictionJob
 )
 from services.prediction_service import prediction_service
@@ -53,6 +56,25 @@ async def get_model_details(model_id: str):
         raise HTTPException(status_code=500, detail=f"Error getting model details: {str(e)}")
 
 
+@router.put("/models/{model_id}/constrained-decoding")
+async def set_model_constrained_decoding(model_id: str, enabled: bool):
+    """Opt a model in to (or out of) decoding predictions under its output schema"""
+    try:
+        model = prediction_service.set_constrained_decoding(model_id, enabled)
+        if not model:
+            raise HTTPException(status_code=404, detail="Model not found")
+        
+        return {
+            "success": True,
+            "model": model
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating model: {str(e)}")
+
+
 @router.post("/start", response_model=PredictionJobResponse)
 async def start_prediction(request: StartPredictionRequest):
     """Start a new prediction job"""
@@ -115,17 +137,12 @@ async def get_prediction_results(
         if job.status != "completed":
             raise HTTPException(status_code=400, detail="Prediction job is not completed yet")
         
-        # Load results if not already loaded
-        if not job.results:
-            job.results = prediction_service._load_job_results(job_id)
-        
-        # Paginate results
+        # Read only the requested page from the results file
         start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        paginated_results = job.results[start_idx:end_idx] if job.results else []
-        
-        total_results = len(job.results) if job.results else 0
-        has_more = end_idx < total_results
+        paginated_results, total_results = prediction_service.get_prediction_results(
+            job_id, offset=start_idx, limit=page_size
+        )
+        has_more = start_idx + page_size < total_results
         
         return PredictionResultsResponse(
             success=True,
@@ -146,82 +163,78 @@ async def get_prediction_results(
 @router.get("/jobs/{job_id}/download")
 async def download_prediction_results(
     job_id: str,
-    format: str = Query("csv", regex="^(csv|json)$")
+    format: str = Query("csv", regex="^(csv|json|ndjson|parquet)$")
 ):
-    """Download prediction results as CSV or JSON"""
+    """Download prediction results as CSV, JSON, NDJSON or Parquet
+    
+    Results are read from disk and encoded incrementally, so memory use
+    does not grow with the number of rows.
+    """
     try:
         from fastapi.responses import StreamingResponse
-        import io
-        import csv
-        import json
+        from itertools import chain
+        from services import result_export
         
-        job = prediction_service.get_prediction_job(job_id)
+        job = prediction_service.get_prediction_job(job_id, include_results=False)
         if not job:
             raise HTTPException(status_code=404, detail="Prediction job not found")
         
         if job.status != "completed":
             raise HTTPException(status_code=400, detail="Prediction job is not completed yet")
         
-        # Load results if not already loaded
-        if not job.results:
-            job.results = prediction_service._load_job_results(job_id)
-        
-        if not job.results:
+        result_lines = prediction_service.iter_job_result_lines(job_id)
+        first_line = next(result_lines, None)
+        if first_line is None:
             raise HTTPException(status_code=404, detail="No results found for this job")
+        result_lines = chain([first_line], result_lines)
+        
+        def results():
+            for line in result_lines:
+                yield json.loads(line)
+        
+        filename = f"prediction_results_{job_id}"
         
         if format == "csv":
-            # Generate CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            headers = ["row_index", "prediction", "confidence", "processing_time_ms"]
-            # Add input data columns
-            if job.results:
-                input_keys = list(job.results[0].input_data.keys())
-                headers.extend([f"input_{key}" for key in input_keys])
-            writer.writerow(headers)
-            
-            # Write data
-            for result in job.results:
-                row = [
-                    result.row_index,
-                    json.dumps(result.prediction) if isinstance(result.prediction, dict) else str(result.prediction),
-                    result.confidence or "",
-                    result.processing_time_ms or ""
-                ]
-                # Add input data
-                for key in input_keys:
-                    row.append(result.input_data.get(key, ""))
-                writer.writerow(row)
-            
-            output.seek(0)
-            
             return StreamingResponse(
-                io.BytesIO(output.getvalue().encode()),
+                result_export.iter_csv(results()),
                 media_type="text/csv",
-                headers={"Content-Disposition": f"attachment; filename=prediction_results_{job_id}.csv"}
+                headers={"Content-Disposition": f"attachment; filename={filename}.csv"}
             )
         
-        else:  # JSON format
-            results_data = {
-                "job_id": job_id,
-                "job_name": job.job_name,
-                "model_id": job.model_id,
-                "created_at": job.created_at.isoformat(),
-                "completed_at": job.completed_at.isoformat() if job.completed_at else None,
-                "total_results": len(job.results),
-                "results": [result.dict() for result in job.results]
-            }
-            
-            json_str = json.dumps(results_data, indent=2, default=str)
+        if format == "ndjson":
+            return StreamingResponse(
+                result_export.iter_ndjson(result_lines),
+                media_type="application/x-ndjson",
+                headers={"Content-Disposition": f"attachment; filename={filename}.ndjson"}
+            )
+        
+        if format == "parquet":
+            if not result_export.PYARROW_AVAILABLE:
+                raise HTTPException(status_code=400, detail="Parquet export requires pyarrow to be installed")
             
+            # The Parquet footer needs every row group first; build the file off the event loop
+            loop = asyncio.get_event_loop()
+            parquet_path = await loop.run_in_executor(None, result_export.write_parquet, results())
             return StreamingResponse(
-                io.BytesIO(json_str.encode()),
-                media_type="application/json",
-                headers={"Content-Disposition": f"attachment; filename=prediction_results_{job_id}.json"}
+                result_export.iter_file(parquet_path, delete=True),
+                media_type="application/vnd.apache.parquet",
+                headers={"Content-Disposition": f"attachment; filename={filename}.parquet"}
             )
         
+        # JSON format
+        job_fields = {
+            "job_id": job_id,
+            "job_name": job.job_name,
+            "model_id": job.model_id,
+            "created_at": job.created_at.isoformat(),
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None
+        }
+        return StreamingResponse(
+            result_export.iter_json(job_fields, result_lines),
+            media_type="application/json",
+            headers={"Content-Disposition": f"attachment; filename={filename}.json"}
+        )
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -237,23 +250,21 @@ async def get_prediction_jobs(
 ):
     """Get list of prediction jobs with optional filtering"""
     try:
+        # Paginate in the job store
+        start_idx = (page - 1) * page_size
         jobs = prediction_service.get_prediction_jobs(
             status=status,
             model_id=model_id,
-            limit=page_size * 10  # Get more to handle pagination
+            limit=page_size,
+            offset=start_idx
         )
         
-        # Paginate
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        paginated_jobs = jobs[start_idx:end_idx]
-        
-        total_jobs = len(jobs)
-        has_more = end_idx < total_jobs
+        total_jobs = prediction_service.count_prediction_jobs(status=status, model_id=model_id)
+        has_more = start_idx + len(jobs) < total_jobs
         
         return PredictionJobsListResponse(
             success=True,
-            jobs=paginated_jobs,
+            jobs=jobs,
             total=total_jobs,
             page=page,
             page_size=page_size,
@@ -284,6 +295,46 @@ async def cancel_prediction_job(job_id: str, request: CancelJobRequest = None):
         raise HTTPException(status_code=500, detail=f"Error cancelling prediction job: {str(e)}")
 
 
+@router.post("/jobs/{job_id}/pause", response_model=PauseJobResponse)
+async def pause_prediction_job(job_id: str):
+    """Pause a running prediction job after its current batch"""
+    try:
+        success = prediction_service.pause_prediction_job(job_id)
+        if not success:
+            raise HTTPException(status_code=400, detail="Cannot pause this job")
+        
+        return PauseJobResponse(
+            success=True,
+            message="Prediction job will pause after the current batch",
+            job_id=job_id
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error pausing prediction job: {str(e)}")
+
+
+@router.post("/jobs/{job_id}/resume", response_model=ResumeJobResponse)
+async def resume_prediction_job(job_id: str):
+    """Resume a paused prediction job from its checkpoint"""
+    try:
+        success = prediction_service.resume_prediction_job(job_id)
+        if not success:
+            raise HTTPException(status_code=400, detail="Cannot resume this job")
+        
+        return ResumeJobResponse(
+            success=True,
+            message="Prediction job resumed",
+            job_id=job_id
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error resuming prediction job: {str(e)}")
+
+
 @router.delete("/jobs/{job_id}", response_model=DeleteJobResponse)
 async def delete_prediction_job(job_id: str):
     """Delete a prediction job and its results"""
@@ -332,45 +383,9 @@ async def get_model_prediction_stats(model_id: str):
         if not model:
             raise HTTPException(status_code=404, detail="Model not found")
         
-        # Get jobs for this model
-        jobs = prediction_service.get_prediction_jobs(model_id=model_id, limit=1000)
-        
-        # Calculate statistics
-        completed_jobs = [job for job in jobs if job.status == "completed"]
-        total_predictions = sum(job.total_rows for job in completed_jobs)
-        
-        # Calculate averages
-        avg_confidence = None
-        avg_processing_time = None
-        
-        if completed_jobs:
-            confidences = []
-            processing_times = []
-            
-            for job in completed_jobs:
-                if job.results:
-                    for result in job.results:
-                        if result.confidence is not None:
-                            confidences.append(result.confidence)
-                        if result.processing_time_ms is not None:
-                            processing_times.append(result.processing_time_ms)
-            
-            if confidences:
-                avg_confidence = sum(confidences) / len(confidences)
-            if processing_times:
-                avg_processing_time = sum(processing_times) / len(processing_times)
-        
-        success_rate = len(completed_jobs) / len(jobs) if jobs else 0.0
-        recent_jobs = jobs[:5]  # Most recent 5 jobs
-        
+        # Aggregates come from the rollups kept up to date as jobs change
         from models.prediction_models import ModelPredictionStats
-        stats = ModelPredictionStats(
-            total_predictions=total_predictions,
-            avg_confidence=avg_confidence,
-            avg_processing_time=avg_processing_time,
-            success_rate=success_rate,
-            recent_jobs=recent_jobs
-        )
+        stats = ModelPredictionStats(**prediction_service.get_model_prediction_stats(model_id))
         
         return ModelStatsResponse(
             success=True,
@@ -388,45 +403,9 @@ async def get_model_prediction_stats(model_id: str):
 async def get_prediction_overview():
     """Get overview of all prediction activity"""
     try:
-        jobs = prediction_service.get_prediction_jobs(limit=1000)
-        
-        total_jobs = len(jobs)
-        active_jobs = len([job for job in jobs if job.status in ["pending", "running"]])
-        completed_jobs = len([job for job in jobs if job.status == "completed"])
-        failed_jobs = len([job for job in jobs if job.status == "failed"])
-        
-        total_predictions = sum(job.total_rows for job in jobs if job.status == "completed")
-        
-        # Calculate average processing time
-        avg_processing_time = None
-        processing_times = []
-        
-        for job in jobs:
-            if job.status == "completed" and job.results:
-                for result in job.results:
-                    if result.processing_time_ms is not None:
-                        processing_times.append(result.processing_time_ms)
-        
-        if processing_times:
-            avg_processing_time = sum(processing_times) / len(processing_times)
-        
-        # Count unique models used
-        models_used = len(set(job.model_id for job in jobs))
-        
-        # Recent activity (last 10 jobs)
-        recent_activity = jobs[:10]
-        
+        # Aggregates come from the rollups kept up to date as jobs change
         from models.prediction_models import PredictionOverview
-        overview = PredictionOverview(
-            total_jobs=total_jobs,
-            active_jobs=active_jobs,
-            completed_jobs=completed_jobs,
-            failed_jobs=failed_jobs,
-            total_predictions=total_predictions,
-            avg_processing_time=avg_processing_time,
-            models_used=models_used,
-            recent_activity=recent_activity
-        )
+        overview = PredictionOverview(**prediction_service.get_prediction_overview())
         
         return PredictionOverviewResponse(
             success=True,
@@ -0,0 +1,299 @@
+import os
+import json
+import shutil
+import sqlite3
+import hashlib
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional
+
+
+def file_sha256(path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """SHA-256 (hex) of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentStore:
+    """Content-addressed blob storage with reference tracking
+
+    Each distinct file content is stored once under objects/<aa>/<sha256>.
+    Users of a blob (uploaded files, training sessions) register a reference
+    such as "file:<file_id>" and get a hardlink to it, so repeated data takes
+    no extra disk space. A blob is deleted when its last reference goes.
+
+    Stored objects and references are rows in SQLite, with object, byte and
+    reference totals kept up to date by triggers. Given the connection of
+    another store (and its lock), references commit in the same transaction
+    as that store's rows; otherwise the store keeps its own refs.db.
+    """
+
+    def __init__(self, base_dir: str = "uploaded_files/store",
+                 connection: Optional[sqlite3.Connection] = None,
+                 lock: Optional[threading.RLock] = None):
+        self.base_dir = Path(base_dir)
+        self.objects_dir = self.base_dir / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        if connection is None:
+            connection = sqlite3.connect(
+                str(self.base_dir / "refs.db"),
+                timeout=30.0,
+                check_same_thread=False,
+                isolation_level=None  # autocommit; transactions are explicit
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=30000")
+        self._conn = connection
+        self._lock = lock or threading.RLock()
+        # Blobs being registered by this process; garbage collection leaves them alone
+        self._staged: Counter = Counter()
+        self._initialize()
+        self._import_legacy_refs(self.base_dir / "refs.json")
+
+    def _initialize(self):
+        with self._lock:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS content_objects (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS content_refs (
+                    sha256 TEXT NOT NULL,
+                    ref TEXT NOT NULL,
+                    PRIMARY KEY (sha256, ref)
+                );
+                CREATE TABLE IF NOT EXISTS content_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    objects INTEGER NOT NULL DEFAULT 0,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    refs INTEGER NOT NULL DEFAULT 0
+                );
+                INSERT OR IGNORE INTO content_totals (id) VALUES (1);
+
+                CREATE TRIGGER IF NOT EXISTS content_objects_totals_insert
+                AFTER INSERT ON content_objects BEGIN
+                    UPDATE content_totals SET objects = objects + 1, bytes = bytes + NEW.size WHERE id = 1;
+                END;
+                CREATE TRIGGER IF NOT EXISTS content_objects_totals_delete
+                AFTER DELETE ON content_objects BEGIN
+                    UPDATE content_totals SET objects = objects - 1, bytes = bytes - OLD.size WHERE id = 1;
+                END;
+                CREATE TRIGGER IF NOT EXISTS content_refs_totals_insert
+                AFTER INSERT ON content_refs BEGIN
+                    UPDATE content_totals SET refs = refs + 1 WHERE id = 1;
+                END;
+                CREATE TRIGGER IF NOT EXISTS content_refs_totals_delete
+                AFTER DELETE ON content_refs BEGIN
+                    UPDATE content_totals SET refs = refs - 1 WHERE id = 1;
+                END;
+            """)
+
+    def _import_legacy_refs(self, refs_file: Path):
+        """One-time migration from the old refs.json (and the blobs it described)"""
+        if not refs_file.exists():
+            return
+
+        try:
+            with open(refs_file, 'r', encoding='utf-8') as f:
+                refs = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading legacy content store refs {refs_file}: {e}")
+            return
+
+        with self.transaction():
+            for blob in self.objects_dir.glob("*/*"):
+                if not blob.name.endswith(".tmp"):
+                    self._register_object(blob.name)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO content_refs (sha256, ref) VALUES (?, ?)",
+                [(sha256, ref) for sha256, sha_refs in refs.items() for ref in sha_refs if self.has(sha256)]
+            )
+
+        refs_file.rename(refs_file.with_name(refs_file.name + ".migrated"))
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """One write transaction; joins the caller's transaction when one is open"""
+        with self._lock:
+            if self._conn.in_transaction:
+                yield
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @contextmanager
+    def staged(self, sha256: str) -> Iterator[None]:
+        """Keep a blob from being collected while its first reference is being set up"""
+        with self._lock:
+            self._staged[sha256] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._staged[sha256] -= 1
+                if not self._staged[sha256]:
+                    del self._staged[sha256]
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256
+
+    def has(self, sha256: str) -> bool:
+        return self.object_path(sha256).exists()
+
+    def put(self, source_path: str, sha256: str, ref: Optional[str] = None, move: bool = False) -> Path:
+        """Store a file's content (if not stored yet) and optionally reference it; returns the blob path
+
+        With ``move`` the source file is consumed: renamed into the store, or
+        removed if the content was already there. Otherwise it is copied.
+        """
+        with self.staged(sha256):
+            return self._put(source_path, sha256, ref, move)
+
+    def _put(self, source_path: str, sha256: str, ref: Optional[str], move: bool) -> Path:
+        blob = self.object_path(sha256)
+        temp_blob = None
+        if not move and not blob.exists():
+            # Copied outside the lock, so a large copy does not hold up other store users.
+            # Copied, not hardlinked: the caller's file stays its own (and writable).
+            # Only files the store owns are shared through hardlinks.
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            temp_blob = blob.with_name(f"{blob.name}.{uuid.uuid4().hex}.tmp")
+            shutil.copyfile(source_path, temp_blob)
+        with self._lock:
+            if not blob.exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                if temp_blob is None:
+                    temp_blob = blob.with_name(f"{blob.name}.{uuid.uuid4().hex}.tmp")
+                    os.replace(source_path, temp_blob)
+                # Blobs are shared through hardlinks, so they must never be modified in place
+                os.chmod(temp_blob, 0o444)
+                os.replace(temp_blob, blob)
+            else:
+                if temp_blob is not None:
+                    os.remove(temp_blob)
+                if move and os.path.exists(source_path):
+                    os.remove(source_path)
+            with self.transaction():
+                self._register_object(sha256)
+                if ref is not None:
+                    self._add_ref(sha256, ref)
+            return blob
+
+    def link(self, sha256: str, dest_path: str, ref: Optional[str] = None) -> bool:
+        """Materialize a stored blob at dest_path (hardlink, copy as fallback) and optionally reference it"""
+        with self._lock:
+            blob = self.object_path(sha256)
+            if not blob.exists():
+                return False
+            if os.path.lexists(dest_path):
+                os.remove(dest_path)
+            self._link_or_copy(str(blob), dest_path)
+            if ref is not None:
+                with self.transaction():
+                    self._add_ref(sha256, ref)
+            return True
+
+    def add_ref(self, sha256: str, ref: str):
+        with self.transaction():
+            self._add_ref(sha256, ref)
+
+    def release(self, sha256: str, ref: str) -> bool:
+        """Drop a reference; the blob is deleted once nothing references it. Returns True if deleted.
+
+        Inside a caller's transaction only the reference is dropped; call
+        remove_if_unused after that transaction commits.
+        """
+        with self.transaction():
+            self._conn.execute("DELETE FROM content_refs WHERE sha256 = ? AND ref = ?", (sha256, ref))
+        if self._conn.in_transaction:
+            return False
+        return self.remove_if_unused(sha256)
+
+    def remove_if_unused(self, sha256: str) -> bool:
+        """Delete a blob nothing references (and nobody is staging). Returns True if deleted."""
+        with self._lock:
+            if self._staged[sha256]:
+                return False
+            with self.transaction():
+                if self._referenced(sha256):
+                    return False
+                self._conn.execute("DELETE FROM content_objects WHERE sha256 = ?", (sha256,))
+            self._remove_blob(sha256)
+            return True
+
+    def collect_garbage(self) -> Dict[str, Any]:
+        """Delete blobs without references (e.g. left by an interrupted upload)"""
+        removed = 0
+        freed_bytes = 0
+        with self._lock:
+            for shard in self.objects_dir.iterdir():
+                if not shard.is_dir():
+                    continue
+                for blob in shard.iterdir():
+                    sha256 = blob.name.split(".", 1)[0]
+                    if self._staged[sha256]:
+                        continue
+                    if blob.name.endswith(".tmp") or not self._referenced(sha256):
+                        freed_bytes += blob.stat().st_size
+                        os.chmod(blob, 0o644)
+                        blob.unlink()
+                        removed += 1
+            with self.transaction():
+                # Rows of blobs that are gone, or were just removed above
+                self._conn.execute(
+                    "DELETE FROM content_objects WHERE sha256 NOT IN (SELECT sha256 FROM content_refs)"
+                    f" AND sha256 NOT IN ({', '.join('?' for _ in self._staged)})",
+                    list(self._staged)
+                )
+        return {'removed_objects': removed, 'freed_bytes': freed_bytes}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT objects, bytes, refs FROM content_totals WHERE id = 1"
+            ).fetchone()
+        return {
+            'objects': totals[0],
+            'references': totals[2],
+            'stored_bytes': totals[1]
+        }
+
+    def _register_object(self, sha256: str):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO content_objects (sha256, size) VALUES (?, ?)",
+            (sha256, self.object_path(sha256).stat().st_size)
+        )
+
+    def _add_ref(self, sha256: str, ref: str):
+        self._conn.execute("INSERT OR IGNORE INTO content_refs (sha256, ref) VALUES (?, ?)", (sha256, ref))
+
+    def _referenced(self, sha256: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM content_refs WHERE sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone() is not None
+
+    def _remove_blob(self, sha256: str):
+        blob = self.object_path(sha256)
+        if blob.exists():
+            os.chmod(blob, 0o644)
+            blob.unlink()
+
+    @staticmethod
+    def _link_or_copy(source_path: str, dest_path) -> None:
+        try:
+            os.link(source_path, dest_path)
+        except OSError:
+            # Different filesystem or no hardlink support
+            shutil.copy2(source_path, dest_path)
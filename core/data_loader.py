@@ -0,0 +1,228 @@
+"""
+Loading of data files (CSV, JSON, JSONL, Excel, pickle) into DataFrames.
+
+Every service parses data files through these functions, so all of them
+see the same columns and types: nested JSON values become JSON text, and
+a JSON file may be an array of records, a single record or one list per
+column. ``DataFrameCache`` keeps recently loaded frames in memory so that
+analysing, previewing, validating and processing the same file parses it
+once (see ``FileManager.load_dataframe``).
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+import pandas as pd
+
+# Characters read at a time when streaming a JSON array
+JSON_READ_SIZE = 1024 * 1024
+# Memory budget of the in-process DataFrame cache
+DATAFRAME_CACHE_BYTES = 1024 * 1024 * 1024
+
+SUPPORTED_EXTENSIONS = ['.csv', '.json', '.jsonl', '.xlsx', '.xls', '.pkl', '.pickle']
+
+
+def serialize_nested_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Replace dict and list cells with their JSON text, one column at a time"""
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        nested = values.map(type).isin((dict, list))
+        if nested.any():
+            df[column] = values.where(~nested, values[nested].map(json.dumps))
+    return df
+
+
+def iter_json_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a JSON file one at a time
+
+    A top-level array is decoded element by element while reading the
+    file in blocks; objects (a single record, or columnar lists) are
+    small enough in practice to load whole.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(JSON_READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            data = json.loads(buffer + f.read())
+            if isinstance(data, dict) and data and all(isinstance(v, list) for v in data.values()):
+                # Columnar format: one list per column
+                columns = list(data.keys())
+                for values in zip(*data.values()):
+                    yield dict(zip(columns, values))
+            elif isinstance(data, dict):
+                yield data
+            else:
+                raise ValueError("Invalid JSON format")
+            return
+
+        position = 1
+        while True:
+            # Skip separators; refill until the next element is complete
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                    position += 1
+                if position < len(buffer) and buffer[position] == ']':
+                    return
+                if position < len(buffer):
+                    try:
+                        record, end = decoder.raw_decode(buffer, position)
+                        # A number may be cut short by the block boundary ("1.5" of "1.5e10"),
+                        # so only accept values followed by a separator
+                        if end < len(buffer) and buffer[end] in ' \t\r\n,]':
+                            position = end
+                            break
+                    except json.JSONDecodeError:
+                        pass
+                more = f.read(JSON_READ_SIZE)
+                if not more:
+                    raise ValueError("Invalid JSON format: unexpected end of file")
+                buffer = buffer[position:] + more
+                position = 0
+            yield record
+
+
+def iter_jsonl_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _records_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    return serialize_nested_columns(pd.DataFrame(records))
+
+
+def iter_frames(file_path: str, chunk_rows: int, max_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Read a data file as DataFrames of up to chunk_rows rows, stopping after max_rows"""
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension == '.csv':
+        if max_rows is not None:
+            yield pd.read_csv(file_path, nrows=max_rows)
+            return
+        yield from pd.read_csv(file_path, chunksize=chunk_rows)
+    elif file_extension in ('.json', '.jsonl'):
+        records = iter_json_records(file_path) if file_extension == '.json' else iter_jsonl_records(file_path)
+        batch = []
+        read = 0
+        for record in records:
+            batch.append(record)
+            read += 1
+            if len(batch) >= chunk_rows:
+                yield _records_frame(batch)
+                batch = []
+            if max_rows is not None and read >= max_rows:
+                break
+        if batch or read == 0:
+            yield _records_frame(batch)
+    elif file_extension in ['.xlsx', '.xls']:
+        # Read Excel file, using first sheet by default
+        yield pd.read_excel(file_path, sheet_name=0, nrows=max_rows)
+    elif file_extension in ['.pkl', '.pickle']:
+        # Pickles can only be loaded whole
+        df = read_data_file(file_path)
+        yield df if max_rows is None else df.head(max_rows)
+    else:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+
+
+def read_data_file(file_path: str) -> pd.DataFrame:
+    """Load a whole data file into a DataFrame"""
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension == '.csv':
+        return pd.read_csv(file_path)
+    elif file_extension == '.json':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if isinstance(data, list):
+            # Array of objects: [{"instruction": "...", "output": "..."}, ...]
+            return _records_frame(data)
+        elif isinstance(data, dict):
+            if data and all(isinstance(v, list) for v in data.values()):
+                # Object with arrays: {"instruction": [...], "output": [...]}
+                return serialize_nested_columns(pd.DataFrame(data))
+            # Single object, convert to single-row DataFrame
+            return _records_frame([data])
+        else:
+            raise ValueError("Invalid JSON format. Expected array of objects or object with arrays.")
+    elif file_extension == '.jsonl':
+        return _records_frame(list(iter_jsonl_records(file_path)))
+    elif file_extension in ['.xlsx', '.xls']:
+        # Read Excel file, using first sheet by default
+        return pd.read_excel(file_path, sheet_name=0)
+    elif file_extension in ['.pkl', '.pickle']:
+        # Read pickle file using pandas
+        df = pd.read_pickle(file_path)
+        # Ensure it's a DataFrame
+        if not isinstance(df, pd.DataFrame):
+            raise ValueError("Pickle file must contain a pandas DataFrame")
+        return df
+    else:
+        raise ValueError(f"Unsupported file format: {file_extension}. Supported formats: {', '.join(SUPPORTED_EXTENSIONS)}")
+
+
+class DataFrameCache:
+    """Thread-safe LRU cache of DataFrames, bounded by their memory use
+
+    Keys include the source file's modification time, so a changed file is
+    never served from an old entry. Cached frames are shared: callers get
+    them from ``FileManager.load_dataframe`` as shallow views, which are
+    read-only (values must not be changed in place).
+    """
+
+    def __init__(self, max_bytes: int = DATAFRAME_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._frames: "OrderedDict[Hashable, pd.DataFrame]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[pd.DataFrame]:
+        with self._lock:
+            df = self._frames.get(key)
+            if df is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return df
+
+    def put(self, key: Hashable, df: pd.DataFrame):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._frames:
+                self._remove(key)
+            self._frames[key] = df
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._frames)))
+
+    def invalidate(self, file_id: str):
+        """Drop every entry of a file (keys are tuples starting with the file id)"""
+        with self._lock:
+            for key in [key for key in self._frames if key[0] == file_id]:
+                self._remove(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._frames),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _remove(self, key: Hashable):
+        del self._frames[key]
+        self._bytes -= self._sizes.pop(key)
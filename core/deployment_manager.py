@@ -1,6 +1,7 @@
 import os
 import json
 import subprocess
+import shlex
 import uuid
 import time
 import requests
@@ -52,6 +53,26 @@ class DeploymentConfig:
     trust_remote_code: bool = False
     enforce_eager: bool = False
     disable_log_stats: bool = True
+    # Speculative decoding: None, "ngram" (prompt lookup) or "draft_model"
+    speculative_method: Optional[str] = None
+    speculative_model: Optional[str] = None
+    num_speculative_tokens: int = 5
+    prompt_lookup_max: int = 4
+
+    def speculative_config(self) -> Optional[Dict[str, Any]]:
+        """Value for vLLM's --speculative-config, or None if disabled"""
+        if self.speculative_method == "ngram":
+            return {
+                "method": "ngram",
+                "num_speculative_tokens": self.num_speculative_tokens,
+                "prompt_lookup_max": self.prompt_lookup_max,
+            }
+        if self.speculative_method == "draft_model" and self.speculative_model:
+            return {
+                "model": self.speculative_model,
+                "num_speculative_tokens": self.num_speculative_tokens,
+            }
+        return None
 
 @dataclass
 class DeploymentInfo:
@@ -177,6 +198,10 @@ class VLLMDeploymentManager:
             if deployment.config.disable_log_stats:
                 cmd += " --disable-log-stats"
             
+            speculative_config = deployment.config.speculative_config()
+            if speculative_config:
+                cmd += f" --speculative-config {shlex.quote(json.dumps(speculative_config))}"
+            
             # Start process with shell=True to allow source command
             process = subprocess.Popen(
                 cmd,
@@ -269,6 +294,14 @@ class VLLMDeploymentManager:
         """Get only active (running) deployments"""
         return [d for d in self.deployments.values() if d.status == "running"]
     
+    def get_healthy_deployments(self, model_path: str) -> List[DeploymentInfo]:
+        """Running deployments serving the model at model_path"""
+        target = os.path.normpath(model_path)
+        return [
+            d for d in self.get_active_deployments()
+            if os.path.normpath(d.model_path) == target
+        ]
+    
     def delete_deployment(self, deployment_id: str) -> bool:
         """Delete a deployment (stop and remove)"""
         if deployment_id not in self.deployments:
@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import json
 import os
 import uuid
@@ -53,7 +54,9 @@ class EvaluationService:
             "example_timings": [],
             "estimated_completion_time": None,
             "avg_time_per_example": 0,
-            "processing_speed": 0
+            "processing_speed": 0,
+            "deduplicated_rows": 0,
+            "dedup_ratio": 0
         }
         
         # Start processing in background
@@ -76,6 +79,8 @@ class EvaluationService:
 
             # print(f"Model loaded successfully for job {job_id}")
             model_name = os.path.basename(model_path)
+            # Decoding schema of the requested model, looked up before the path is overridden below
+            output_schema = prediction_service.get_decoding_schema_for_path(model_path)
             #Todo
             # model_path = f"finvix/{model_name}"
             # model_path = "finvix/prediction_model_v2"
@@ -83,9 +88,12 @@ class EvaluationService:
             
             # Use RemoteAPIResponder instead of VLLMResponder for reliable predictions
             print(f"Initializing Remote API responder for model: {model_path}")
-            vllm_engine = RemoteAPIResponder(model_path=model_path)
+            vllm_engine = RemoteAPIResponder(model_path=model_path, output_schema=output_schema)
             results = []
             total_rows = len(test_data)
+            # Responses by prompt hash; rows with an identical prompt reuse them
+            response_cache: Dict[str, str] = {}
+            deduplicated_rows = 0
 
             for i in range(0, total_rows, batch_size):
                 batch = test_data[i:i + batch_size]
@@ -106,13 +114,36 @@ class EvaluationService:
                     prompts.append(prompt)
                     example_prompts.append(prompt)  # Store for later use
 
+                # Send each distinct prompt once; repeats (in this batch or earlier ones) reuse its response
+                prompt_keys = [hashlib.sha256(prompt.encode('utf-8')).hexdigest() for prompt in prompts]
+                unique_prompts: Dict[str, str] = {}
+                dedup_flags = []
+                for key, prompt in zip(prompt_keys, prompts):
+                    is_repeat = key in response_cache or key in unique_prompts
+                    dedup_flags.append(is_repeat)
+                    if not is_repeat:
+                        unique_prompts[key] = prompt
+                
                 # Run batch inference with enhanced error handling
-                try:
-                    raw_responses = vllm_engine.generate_response_using_batch(prompts)
-                    print("raw response!!", raw_responses)
-                except Exception as e:
-                    print("error!!", str(e))
-                    raw_responses = [f"[ERROR: {str(e)}]"] * len(batch)
+                batch_responses: Dict[str, Any] = {}
+                if unique_prompts:
+                    try:
+                        unique_responses = vllm_engine.generate_response_using_batch(list(unique_prompts.values()))
+                        print("raw response!!", unique_responses)
+                    except Exception as e:
+                        print("error!!", str(e))
+                        unique_responses = [f"[ERROR: {str(e)}]"] * len(unique_prompts)
+                    batch_responses = dict(zip(unique_prompts.keys(), unique_responses))
+                
+                raw_responses = [
+                    batch_responses[key] if key in batch_responses else response_cache[key]
+                    for key in prompt_keys
+                ]
+                # Keep successful responses for later batches; errors are retried
+                for key, response in batch_responses.items():
+                    if not str(response).startswith("[ERROR"):
+                        response_cache[key] = response
+                deduplicated_rows += sum(dedup_flags)
 
                 # Process responses with VLLM response handler
                 processed_responses = []
@@ -138,7 +169,8 @@ class EvaluationService:
                         })
 
                 # Save results with mapping support and enhanced metadata
-                for example, prediction, prompt, resp_metadata in zip(batch, processed_responses, example_prompts, response_metadata):
+                for example, prediction, prompt, resp_metadata, deduplicated in zip(
+                        batch, processed_responses, example_prompts, response_metadata, dedup_flags):
                     # Create the correct structure with nested input
                     if mapping and mapping.get('input_columns'):
                         # Create structured result with nested input
@@ -194,6 +226,7 @@ class EvaluationService:
                         expected_fields
                     )
                     
+                    result['deduplicated'] = deduplicated
                     result['parsed_prediction'] = parsed_prediction
                     result['prediction_quality'] = {
                         "category": quality_category,
@@ -222,7 +255,9 @@ class EvaluationService:
                     "example_timings": timings,
                     "estimated_completion_time": time_estimates["estimated_completion_time"],
                     "avg_time_per_example": time_estimates["avg_time_per_example"],
-                    "processing_speed": time_estimates["processing_speed"]
+                    "processing_speed": time_estimates["processing_speed"],
+                    "deduplicated_rows": deduplicated_rows,
+                    "dedup_ratio": round(deduplicated_rows / completed, 4) if completed else 0
                 })
 
                 print(f"Job {job_id}: Processed {completed}/{total_rows} rows ({progress_percentage:.1f}%) - ETA: {time_estimates['eta_formatted']}")
@@ -1,12 +1,122 @@
+import io
 import os
 import json
 import uuid
+import base64
+import hashlib
 import shutil
+import threading
 import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Any, Tuple
 from pathlib import Path
 
+from content_store import ContentStore, file_sha256
+from data_loader import DataFrameCache, iter_frames, read_data_file
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+from file_metadata_store import FileMetadataStore
+
+# Bytes read or written at a time when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Rows parsed for schema checks and the preview when a file is validated
+VALIDATION_SAMPLE_ROWS = 1000
+# Rows per DataFrame in the background full-file statistics pass
+STATS_SCAN_CHUNK_ROWS = 50000
+# Statistics states that still need (or were interrupted during) a full scan
+UNFINISHED_STATS = ('pending', 'running')
+
+
+def write_base64_file(encoded: str, file_path: str, chunk_chars: int = 4 * UPLOAD_CHUNK_SIZE // 3) -> Tuple[int, str]:
+    """Decode base64 text to a file piece by piece; returns (size in bytes, sha256 hex)
+    
+    Avoids holding a second, decoded copy of the payload in memory.
+    """
+    # Line-wrapped base64 would shift the 4-character groups between pieces
+    if "\n" in encoded or "\r" in encoded or " " in encoded:
+        encoded = "".join(encoded.split())
+    # Decode whole 4-character groups only
+    chunk_chars -= chunk_chars % 4
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'wb') as f:
+        for start in range(0, len(encoded), chunk_chars):
+            data = base64.b64decode(encoded[start:start + chunk_chars], validate=True)
+            f.write(data)
+            digest.update(data)
+            size += len(data)
+    return size, digest.hexdigest()
+
+
+class ColumnarWriter:
+    """Writes DataFrame chunks of one file to a Parquet file under a temporary name
+    
+    The first chunk fixes the Arrow schema; later chunks are cast to it. If
+    a chunk cannot be converted the copy is abandoned and ``error`` says why.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.temp_path = path.with_name(path.name + ".tmp")
+        self.schema = None
+        self.rows = 0
+        self.error: Optional[str] = None
+        self._writer = None
+    
+    def write(self, frame: pd.DataFrame) -> bool:
+        """Append a chunk; False once the copy has been abandoned"""
+        if self.error is not None:
+            return False
+        try:
+            table = pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+            if self._writer is None:
+                self.schema = table.schema
+                self._writer = pq.ParquetWriter(str(self.temp_path), self.schema)
+            self._writer.write_table(table)
+            self.rows += table.num_rows
+            return True
+        except Exception as e:
+            self.error = str(e)
+            self.abort()
+            return False
+    
+    def close(self) -> Dict[str, Any]:
+        """Move the finished file into place; returns the metadata describing it"""
+        if self.error is None and self._writer is None:
+            self.error = "No rows to convert"
+        if self.error is not None:
+            return {'status': 'failed', 'error': self.error}
+        self._writer.close()
+        self._writer = None
+        os.replace(self.temp_path, self.path)
+        return {
+            'status': 'ready',
+            'format': 'parquet',
+            'rows': self.rows,
+            'columns': list(self.schema.names),
+            'schema': {field.name: str(field.type) for field in self.schema},
+            'size_bytes': self.path.stat().st_size,
+            'created_at': datetime.now().isoformat()
+        }
+    
+    def abort(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+            self._writer = None
+        if self.temp_path.exists():
+            os.remove(self.temp_path)
+
+
 class FileManager:
     """Manages uploaded training data files with metadata tracking"""
     
@@ -15,39 +125,45 @@ class FileManager:
         self.files_dir = self.base_dir / "files"
         self.metadata_dir = self.base_dir / "metadata"
         self.previews_dir = self.base_dir / "previews"
-        self.metadata_file = self.metadata_dir / "files_metadata.json"
+        # Parquet copy of each uploaded file ({file_id}.parquet), read instead of re-parsing the original
+        self.columnar_dir = self.base_dir / "columnar"
+        # In-progress chunked uploads: {upload_id}.part data and {upload_id}.json state
+        self.uploads_dir = self.base_dir / "uploads"
         
         # Create directories if they don't exist
         self._ensure_directories()
         
-        # Load existing metadata
-        self.metadata = self._load_metadata()
+        # File metadata lives in SQLite; an old files_metadata.json is imported once
+        self.metadata_store = FileMetadataStore(
+            self.metadata_dir / "files.db",
+            legacy_metadata_file=self.metadata_dir / "files_metadata.json"
+        )
+        
+        # File contents are stored once per SHA-256; files/ entries are hardlinks to them.
+        # References live in the metadata database, so they commit together with file rows.
+        self.store = ContentStore(
+            str(self.base_dir / "store"),
+            connection=self.metadata_store.connection,
+            lock=self.metadata_store.lock
+        )
+        
+        # Full-file passes (statistics, Parquet copy) run here, one file at a time
+        self._scan_executor = ThreadPoolExecutor(max_workers=1)
+        self._scans_queued: set = set()
+        self._scans_lock = threading.Lock()
+        
+        # Recently loaded DataFrames, keyed by (file_id, mtime, columns)
+        self.frame_cache = DataFrameCache()
+        
+        # Running SHA-256 of each open upload session (rebuilt from disk after a restart)
+        self._upload_hashers: Dict[str, Any] = {}
+        self._uploads_lock = threading.Lock()
     
     def _ensure_directories(self):
         """Create necessary directories"""
-        for directory in [self.files_dir, self.metadata_dir, self.previews_dir]:
+        for directory in [self.files_dir, self.metadata_dir, self.previews_dir, self.uploads_dir, self.columnar_dir]:
             directory.mkdir(parents=True, exist_ok=True)
     
-    def _load_metadata(self) -> Dict[str, Any]:
-        """Load files metadata from JSON file"""
-        if self.metadata_file.exists():
-            try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Warning: Could not load metadata file: {e}")
-                return {}
-        return {}
-    
-    def _save_metadata(self):
-        """Save files metadata to JSON file"""
-        try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, indent=2, ensure_ascii=False, default=str)
-        except Exception as e:
-            print(f"Error saving metadata: {e}")
-            raise
-    
     def _generate_file_id(self) -> str:
         """Generate unique file ID"""
         return str(uuid.uuid4())
@@ -65,63 +181,28 @@ class FileManager:
             sanitized = name[:96] + ext
         return sanitized
     
-    def _validate_file_data(self, file_path: str) -> Dict[str, Any]:
-        """Validate uploaded file and return validation details"""
+    @staticmethod
+    def _file_type(file_path: str) -> str:
+        file_extension = os.path.splitext(file_path)[1].lower()
+        return {
+            '.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl',
+            '.xlsx': 'excel', '.xls': 'excel', '.pkl': 'pickle', '.pickle': 'pickle'
+        }.get(file_extension, 'unknown')
+    
+    @staticmethod
+    def _null_issues(null_counts: Dict[str, int]) -> List[str]:
+        return [f"Column '{col}' has {count} null values" for col, count in null_counts.items()]
+    
+    def _validate_file_data(self, file_path: str, sample_rows: int = VALIDATION_SAMPLE_ROWS) -> Dict[str, Any]:
+        """Validate a file from its header and first rows and return validation details
+        
+        Only ``sample_rows`` rows are parsed, so cost does not grow with the
+        file. Row count and null counts cover the sample until the full-scan
+        statistics pass (see _schedule_file_scan) replaces them.
+        """
         try:
-            file_extension = os.path.splitext(file_path)[1].lower()
-            
-            if file_extension == '.csv':
-                df = pd.read_csv(file_path)
-                file_type = 'csv'
-            elif file_extension == '.json':
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                # Convert complex nested objects to JSON strings before creating DataFrame
-                def serialize_complex_objects(obj):
-                    if isinstance(obj, list):
-                        return [serialize_complex_objects(item) for item in obj]
-                    elif isinstance(obj, dict):
-                        return {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in obj.items()}
-                    else:
-                        return obj
-                
-                if isinstance(data, list):
-                    # Process each record to handle nested objects
-                    processed_data = [serialize_complex_objects(record) for record in data]
-                    df = pd.DataFrame(processed_data)
-                elif isinstance(data, dict):
-                    # Check if it's a dict with list values (columnar format)
-                    if data and all(isinstance(v, list) for v in data.values()):
-                        df = pd.DataFrame(data)
-                    else:
-                        # Single object, wrap in list and process
-                        processed_data = [serialize_complex_objects(data)]
-                        df = pd.DataFrame(processed_data)
-                else:
-                    raise ValueError("Invalid JSON format")
-                file_type = 'json'
-            elif file_extension == '.jsonl':
-                data = []
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.strip():
-                            data.append(json.loads(line))
-                df = pd.DataFrame(data)
-                file_type = 'jsonl'
-            elif file_extension in ['.xlsx', '.xls']:
-                # Read Excel file, using first sheet by default
-                df = pd.read_excel(file_path, sheet_name=0)
-                file_type = 'excel'
-            elif file_extension in ['.pkl', '.pickle']:
-                # Read pickle file using pandas
-                df = pd.read_pickle(file_path)
-                # Ensure it's a DataFrame
-                if not isinstance(df, pd.DataFrame):
-                    raise ValueError("Pickle file must contain a pandas DataFrame")
-                file_type = 'pickle'
-            else:
-                raise ValueError(f"Unsupported file format: {file_extension}")
+            df = next(iter_frames(file_path, chunk_rows=sample_rows, max_rows=sample_rows))
+            file_type = self._file_type(file_path)
             
             # Check required columns
             required_columns = ['instruction', 'output']
@@ -133,14 +214,14 @@ class FileManager:
             if missing_columns:
                 issues.append(f"Missing required columns: {missing_columns}")
             
-            # Check for null values
+            # Check for null values (in the sample)
             null_counts = {}
             for col in required_columns:
                 if col in df.columns:
-                    null_count = df[col].isnull().sum()
+                    null_count = int(df[col].isnull().sum())
                     if null_count > 0:
                         null_counts[col] = null_count
-                        issues.append(f"Column '{col}' has {null_count} null values")
+            issues.extend(self._null_issues(null_counts))
             
             # Generate sample data for preview
             if len(df) > 0:
@@ -168,6 +249,9 @@ class FileManager:
             
             validation_status = 'valid' if not issues else 'invalid'
             
+            # A short sample is the whole file; otherwise the counts are provisional
+            complete = len(df) < sample_rows
+            
             return {
                 'status': validation_status,
                 'total_rows': len(df),
@@ -175,7 +259,10 @@ class FileManager:
                 'file_type': file_type,
                 'sample_data': sample_data,
                 'null_counts': null_counts,
-                'issues': issues
+                'issues': issues,
+                'missing_columns': missing_columns,
+                'stats_status': 'complete' if complete else 'pending',
+                'rows_scanned': len(df)
             }
             
         except Exception as e:
@@ -186,11 +273,268 @@ class FileManager:
                 'file_type': 'unknown',
                 'sample_data': [],
                 'null_counts': {},
-                'issues': [f"File validation error: {str(e)}"]
+                'issues': [f"File validation error: {str(e)}"],
+                'stats_status': 'failed',
+                'rows_scanned': 0
             }
     
+    def _needs_scan(self, file_info: Dict[str, Any]) -> Tuple[bool, bool]:
+        """(statistics pending or interrupted, Parquet copy missing) for a file"""
+        scan_stats = file_info.get('validation_details', {}).get('stats_status') in UNFINISHED_STATS
+        build_columnar = PYARROW_AVAILABLE and 'columnar' not in file_info
+        return scan_stats, build_columnar
+    
+    def _schedule_file_scan(self, file_id: str):
+        """Run the full-file pass for a file in the background if its statistics or Parquet copy are missing"""
+        file_info = self.get_file_info(file_id)
+        if not file_info or not any(self._needs_scan(file_info)):
+            return
+        with self._scans_lock:
+            if file_id in self._scans_queued:
+                return
+            self._scans_queued.add(file_id)
+        self._scan_executor.submit(self._scan_file, file_id)
+    
+    def resume_file_scans(self):
+        """Queue full scans that a previous server run did not finish
+        
+        A scan interrupted by a restart is left 'running' with a partial row
+        count; it starts over from the beginning of the file.
+        """
+        for file_id in self.metadata_store.ids_with_stats_status(list(UNFINISHED_STATS)):
+            self._schedule_file_scan(file_id)
+    
+    def _scan_file(self, file_id: str):
+        """Read a whole file once: count rows and nulls, and write its Parquet copy
+        
+        Statistics progress is published into the metadata as chunks are
+        read. The Parquet copy is written under a temporary name and only
+        recorded once complete; a file whose chunks cannot be given one
+        Arrow schema (e.g. mixed-type columns) is marked as failed and keeps
+        being loaded from the original.
+        """
+        try:
+            file_info = self.get_file_info(file_id)
+            file_path = self.get_file_path(file_id)
+            if not file_info or not file_path:
+                return
+            scan_stats, build_columnar = self._needs_scan(file_info)
+            if scan_stats:
+                self._scan_file_stats(file_id, file_path, build_columnar)
+            elif build_columnar:
+                writer = ColumnarWriter(self._columnar_file(file_id))
+                for frame in iter_frames(file_path, chunk_rows=STATS_SCAN_CHUNK_ROWS):
+                    if not writer.write(frame):
+                        break
+                self._record_columnar(file_id, writer)
+        except Exception as e:
+            print(f"Error scanning file {file_id}: {e}")
+        finally:
+            with self._scans_lock:
+                self._scans_queued.discard(file_id)
+    
+    def _scan_file_stats(self, file_id: str, file_path: str, build_columnar: bool):
+        """Count rows and nulls over the whole file, publishing progress into the metadata"""
+        required_columns = ['instruction', 'output']
+        rows = 0
+        null_counts: Dict[str, int] = {}
+        writer = ColumnarWriter(self._columnar_file(file_id)) if build_columnar else None
+        
+        def apply(file_info: Dict[str, Any], stats_status: str, error: Optional[str]):
+            details = file_info.setdefault('validation_details', {})
+            details['rows_scanned'] = rows
+            details['stats_status'] = stats_status
+            if stats_status == 'complete':
+                details['total_rows'] = rows
+                details['null_counts'] = dict(null_counts)
+                issues = []
+                if details.get('missing_columns'):
+                    issues.append(f"Missing required columns: {details['missing_columns']}")
+                issues.extend(self._null_issues(null_counts))
+                details['issues'] = issues
+                details['status'] = 'valid' if not issues else 'invalid'
+                file_info['validation_status'] = details['status']
+            elif error:
+                details['stats_error'] = error
+            else:
+                # Running: the row count so far is a lower bound
+                details['total_rows'] = max(rows, details.get('total_rows', 0))
+        
+        def publish(stats_status: str, error: Optional[str] = None) -> bool:
+            # False once the file was deleted while scanning
+            updated = self.metadata_store.update(file_id, lambda file_info: apply(file_info, stats_status, error))
+            return updated is not None
+        
+        try:
+            for frame in iter_frames(file_path, chunk_rows=STATS_SCAN_CHUNK_ROWS):
+                rows += len(frame)
+                for col in required_columns:
+                    if col in frame.columns:
+                        null_count = int(frame[col].isnull().sum())
+                        if null_count:
+                            null_counts[col] = null_counts.get(col, 0) + null_count
+                if writer is not None and writer.error is None and not writer.write(frame):
+                    print(f"Parquet copy of file {file_id} skipped: {writer.error}")
+                if not publish('running'):
+                    if writer is not None:
+                        writer.abort()
+                    return
+            publish('complete')
+            if writer is not None:
+                self._record_columnar(file_id, writer)
+        except Exception as e:
+            print(f"Error scanning file {file_id}: {e}")
+            if writer is not None:
+                writer.abort()
+            publish('failed', str(e))
+    
+    def load_sample(self, file_path: str, rows: int = VALIDATION_SAMPLE_ROWS) -> pd.DataFrame:
+        """Parse only the first ``rows`` rows of a data file (the same sample validation reads)"""
+        return next(iter_frames(file_path, chunk_rows=rows, max_rows=rows))
+    
+    def load_dataframe(self, file_path: str, columns: Optional[List[str]] = None,
+                       start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """Load a data file as a DataFrame, optionally only some columns and rows [start, stop)
+        
+        Uploaded files (paths inside files/) are read from their Parquet copy
+        when there is one and kept in an LRU cache, so repeated loads of the
+        same file parse it once. Other paths are parsed on every call.
+
+        The returned frame shares its data with the cached one, so it must be
+        treated as read-only: callers may add or drop columns, but must
+        ``.copy()`` it before changing any values.
+        """
+        file_id = self._file_id_for_path(file_path)
+        if file_id is None:
+            data = read_data_file(file_path)
+        else:
+            mtime = os.stat(file_path).st_mtime_ns
+            data = self.frame_cache.get((file_id, mtime, None))
+            if data is None and columns is not None:
+                # Without the whole file cached, read just these columns from the Parquet copy
+                key = (file_id, mtime, tuple(columns))
+                data = self.frame_cache.get(key)
+                if data is None:
+                    data = self.read_columnar(file_path, columns=columns)
+                    if data is not None:
+                        self.frame_cache.put(key, data)
+            if data is None:
+                data = self.read_columnar(file_path)
+                if data is None:
+                    data = read_data_file(file_path)
+                self.frame_cache.put((file_id, mtime, None), data)
+        
+        if columns is not None:
+            data = data[[column for column in columns if column in data.columns]]
+        elif file_id is not None:
+            # Don't let callers add or drop columns of the cached frame
+            data = data.copy(deep=False)
+        if start or stop is not None:
+            data = data.iloc[start:stop]
+        return data
+    
+    # Parquet copies of uploaded files
+    
+    def _columnar_file(self, file_id: str) -> Path:
+        return self.columnar_dir / f"{file_id}.parquet"
+    
+    def _record_columnar(self, file_id: str, writer: 'ColumnarWriter'):
+        """Finish a Parquet copy and record its schema and row count (or why it failed) in the metadata"""
+        columnar = writer.close()
+        
+        def apply(file_info: Dict[str, Any]):
+            file_info['columnar'] = columnar
+        
+        if self.metadata_store.update(file_id, apply) is None:
+            # Deleted while scanning
+            writer.abort()
+            self._remove_columnar(file_id)
+    
+    def _remove_columnar(self, file_id: str):
+        columnar_file = self._columnar_file(file_id)
+        if columnar_file.exists():
+            os.remove(columnar_file)
+    
+    def _file_id_for_path(self, file_path: str) -> Optional[str]:
+        """File id of a path inside files/ (stored as {file_id}_{filename}), else None"""
+        path = Path(file_path)
+        if path.parent.resolve() != self.files_dir.resolve():
+            return None
+        return path.name.split('_', 1)[0]
+    
+    def get_columnar_info(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """Schema and row count of a file's Parquet copy, if it is ready"""
+        file_info = self.get_file_info(file_id)
+        if not file_info:
+            return None
+        columnar = file_info.get('columnar')
+        if not columnar:
+            # Uploaded before Parquet copies existed: build one for next time
+            self._schedule_file_scan(file_id)
+            return None
+        if columnar.get('status') != 'ready' or not PYARROW_AVAILABLE:
+            return None
+        return columnar
+    
+    def read_columnar(self, file_path: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """Load an uploaded file from its Parquet copy, or None if it has none
+        
+        The Parquet file is memory mapped and only ``columns`` (those that
+        exist; all by default) are read. Paths outside files/ return None.
+        """
+        file_id = self._file_id_for_path(file_path)
+        columnar = self.get_columnar_info(file_id) if file_id else None
+        if not columnar:
+            return None
+        if columns is not None:
+            columns = [column for column in columns if column in columnar['columns']]
+        try:
+            table = pq.read_table(str(self._columnar_file(file_id)), columns=columns, memory_map=True)
+            return table.to_pandas()
+        except Exception as e:
+            print(f"Error reading Parquet copy of file {file_id}: {e}")
+            return None
+    
     def upload_file(self, file_content: bytes, original_filename: str, display_name: str = None) -> Dict[str, Any]:
         """Upload and store a new file"""
+        return self.upload_file_stream(io.BytesIO(file_content), original_filename, display_name)
+    
+    def upload_file_stream(self, stream: BinaryIO, original_filename: str, display_name: str = None) -> Dict[str, Any]:
+        """Upload a file from a readable binary stream, copying it to disk one chunk at a time"""
+        upload_path = self.uploads_dir / f"{uuid.uuid4()}.part"
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with open(upload_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            return self._store_uploaded_file(upload_path, original_filename, display_name, size, digest.hexdigest())
+        finally:
+            if upload_path.exists():
+                os.remove(upload_path)
+    
+    def upload_base64_file(self, encoded: str, original_filename: str, display_name: str = None) -> Dict[str, Any]:
+        """Upload base64 encoded file content, decoding it straight to disk"""
+        upload_path = self.uploads_dir / f"{uuid.uuid4()}.part"
+        try:
+            size, sha256 = write_base64_file(encoded, str(upload_path))
+            return self._store_uploaded_file(upload_path, original_filename, display_name, size, sha256)
+        finally:
+            if upload_path.exists():
+                os.remove(upload_path)
+    
+    def _store_uploaded_file(self, upload_path: Path, original_filename: str, display_name: Optional[str],
+                             file_size: int, sha256: str) -> Dict[str, Any]:
+        """Move a fully written upload into the content store and register it
+        
+        Content that is already stored (a re-upload) is not kept twice: the
+        new file entry becomes another hardlink to the existing blob.
+        """
         try:
             # Generate file ID and sanitize filename
             file_id = self._generate_file_id()
@@ -198,39 +542,48 @@ class FileManager:
             stored_filename = f"{file_id}_{sanitized_filename}"
             file_path = self.files_dir / stored_filename
             
-            # Save file content
-            with open(file_path, 'wb') as f:
-                f.write(file_content)
-            
-            # Validate file
-            validation_details = self._validate_file_data(str(file_path))
-            
-            # Create metadata entry
-            file_metadata = {
-                'file_id': file_id,
-                'display_name': display_name or original_filename,
-                'original_filename': original_filename,
-                'stored_filename': stored_filename,
-                'file_type': validation_details['file_type'],
-                'file_size': len(file_content),
-                'upload_date': datetime.now().isoformat(),
-                'last_used': None,
-                'usage_count': 0,
-                'validation_status': validation_details['status'],
-                'validation_details': validation_details,
-                'tags': [],
-                'used_in_sessions': []
-            }
-            
-            # Save preview data
-            if validation_details['sample_data']:
-                preview_file = self.previews_dir / f"{file_id}_preview.json"
-                with open(preview_file, 'w', encoding='utf-8') as f:
-                    json.dump(validation_details['sample_data'], f, indent=2, ensure_ascii=False, default=str)
+            # Blobs are renamed into place, so a file appears under its final name all at once.
+            # The blob stays unreferenced (staged, so not collected) until the file row exists.
+            file_ref = self._file_ref(file_id)
+            with self.store.staged(sha256):
+                self.store.put(str(upload_path), sha256, move=True)
+                self.store.link(sha256, str(file_path))
+                
+                # Validate file from disk
+                validation_details = self._validate_file_data(str(file_path))
+                
+                # Create metadata entry
+                file_metadata = {
+                    'file_id': file_id,
+                    'display_name': display_name or original_filename,
+                    'original_filename': original_filename,
+                    'stored_filename': stored_filename,
+                    'file_type': validation_details['file_type'],
+                    'file_size': file_size,
+                    'sha256': sha256,
+                    'upload_date': datetime.now().isoformat(),
+                    'last_used': None,
+                    'usage_count': 0,
+                    'validation_status': validation_details['status'],
+                    'validation_details': validation_details,
+                    'tags': [],
+                    'used_in_sessions': []
+                }
+                
+                # Save preview data
+                if validation_details['sample_data']:
+                    preview_file = self.previews_dir / f"{file_id}_preview.json"
+                    with open(preview_file, 'w', encoding='utf-8') as f:
+                        json.dump(validation_details['sample_data'], f, indent=2, ensure_ascii=False, default=str)
+                
+                # The file row and its content reference commit together, so a crash
+                # leaves either both or an unreferenced blob that garbage collection removes
+                with self.metadata_store.transaction():
+                    self.metadata_store.save(file_metadata)
+                    self.store.add_ref(sha256, file_ref)
             
-            # Update metadata
-            self.metadata[file_id] = file_metadata
-            self._save_metadata()
+            # Count rows and nulls and write the Parquet copy in the background
+            self._schedule_file_scan(file_id)
             
             return {
                 'success': True,
@@ -243,15 +596,186 @@ class FileManager:
             # Clean up file if it was created
             if 'file_path' in locals() and os.path.exists(file_path):
                 os.remove(file_path)
+            if 'file_ref' in locals():
+                self.store.remove_if_unused(sha256)
             
             return {
                 'success': False,
                 'error': str(e)
             }
     
+    @staticmethod
+    def _file_ref(file_id: str) -> str:
+        """Content store reference held by an uploaded file"""
+        return f"file:{file_id}"
+    
+    def link_file_content(self, source_path: str, dest_path: str, ref: str) -> str:
+        """Place a copy of source_path at dest_path as a hardlink to its stored content
+        
+        The content is copied into the store if it is not there yet (source_path
+        itself is never linked or made read-only), and ``ref``
+        keeps it alive until released with release_file_content. Returns the
+        content's SHA-256.
+        """
+        sha256 = file_sha256(source_path)
+        self.store.put(source_path, sha256, ref)
+        self.store.link(sha256, dest_path, ref)
+        return sha256
+    
+    def release_file_content(self, sha256: str, ref: str) -> bool:
+        """Drop a reference taken with link_file_content (the content is deleted when unused)"""
+        return self.store.release(sha256, ref)
+    
+    def collect_garbage(self) -> Dict[str, Any]:
+        """Remove stored contents that no file or session references any more"""
+        return self.store.collect_garbage()
+    
+    # Resumable chunked uploads
+    
+    def _upload_state_file(self, upload_id: str) -> Path:
+        return self.uploads_dir / f"{upload_id}.json"
+    
+    def _upload_data_file(self, upload_id: str) -> Path:
+        return self.uploads_dir / f"{upload_id}.part"
+    
+    def _load_upload_state(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        # Upload IDs are generated UUIDs; anything else never names a session
+        try:
+            uuid.UUID(upload_id)
+        except (ValueError, TypeError):
+            return None
+        state_file = self._upload_state_file(upload_id)
+        if not state_file.exists():
+            return None
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _save_upload_state(self, state: Dict[str, Any]):
+        state_file = self._upload_state_file(state['upload_id'])
+        temp_file = state_file.with_name(state_file.name + ".tmp")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, default=str)
+        os.replace(temp_file, state_file)
+    
+    def _upload_hasher(self, upload_id: str, received_bytes: int):
+        """Running SHA-256 for a session, re-read from the partial file if the process restarted
+        
+        Before re-reading, the file is cut back to the session's recorded
+        received_bytes, dropping the tail of a write interrupted mid-chunk, so
+        the hash covers exactly the bytes that will be stored.
+        """
+        hasher = self._upload_hashers.get(upload_id)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            data_file = self._upload_data_file(upload_id)
+            if data_file.exists():
+                with open(data_file, 'r+b') as f:
+                    f.truncate(received_bytes)
+                    for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                        hasher.update(chunk)
+            self._upload_hashers[upload_id] = hasher
+        return hasher
+    
+    def create_upload_session(self, original_filename: str, display_name: str = None,
+                              total_size: Optional[int] = None) -> Dict[str, Any]:
+        """Start a resumable upload; chunks are then appended with append_upload_chunk"""
+        upload_id = str(uuid.uuid4())
+        state = {
+            'upload_id': upload_id,
+            'original_filename': original_filename,
+            'display_name': display_name,
+            'total_size': total_size,
+            'received_bytes': 0,
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+        self._upload_data_file(upload_id).touch()
+        self._save_upload_state(state)
+        self._upload_hashers[upload_id] = hashlib.sha256()
+        return state
+    
+    def get_upload_session(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """State of an upload session; received_bytes is the offset to resume from"""
+        return self._load_upload_state(upload_id)
+    
+    def append_upload_chunk(self, upload_id: str, offset: int, chunk: bytes) -> Dict[str, Any]:
+        """Append a chunk at ``offset``, which must equal the bytes received so far
+        
+        A chunk retried after a lost response (already fully received) is
+        acknowledged without being written again.
+        """
+        with self._uploads_lock:
+            state = self._load_upload_state(upload_id)
+            if state is None:
+                raise KeyError(f"Upload session {upload_id} not found")
+            
+            received = state['received_bytes']
+            if offset + len(chunk) <= received and offset < received:
+                return state
+            if offset != received:
+                raise ValueError(f"Chunk offset {offset} does not match received bytes {received}")
+            if state.get('total_size') is not None and received + len(chunk) > state['total_size']:
+                raise ValueError(f"Chunk exceeds declared total size of {state['total_size']} bytes")
+            
+            hasher = self._upload_hasher(upload_id, received)
+            with open(self._upload_data_file(upload_id), 'r+b') as f:
+                # Drop any bytes past the recorded offset (from a write interrupted mid-chunk)
+                f.truncate(received)
+                f.seek(received)
+                f.write(chunk)
+            hasher.update(chunk)
+            
+            state['received_bytes'] = received + len(chunk)
+            state['updated_at'] = datetime.now().isoformat()
+            self._save_upload_state(state)
+            return state
+    
+    def complete_upload(self, upload_id: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Verify a finished upload session and register the file"""
+        with self._uploads_lock:
+            state = self._load_upload_state(upload_id)
+            if state is None:
+                return {'success': False, 'error': f"Upload session {upload_id} not found"}
+            
+            if state.get('total_size') is not None and state['received_bytes'] != state['total_size']:
+                return {
+                    'success': False,
+                    'error': f"Upload incomplete: received {state['received_bytes']} of {state['total_size']} bytes"
+                }
+            
+            data_file = self._upload_data_file(upload_id)
+            sha256 = self._upload_hasher(upload_id, state['received_bytes']).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                return {'success': False, 'error': f"SHA-256 mismatch: expected {expected_sha256}, got {sha256}"}
+            
+            with open(data_file, 'rb') as f:
+                os.fsync(f.fileno())
+            
+            result = self._store_uploaded_file(
+                data_file, state['original_filename'], state.get('display_name'),
+                state['received_bytes'], sha256
+            )
+            if result['success']:
+                self._remove_upload_session(upload_id)
+            return result
+    
+    def abort_upload(self, upload_id: str) -> bool:
+        """Discard an upload session and its partial data"""
+        with self._uploads_lock:
+            if self._load_upload_state(upload_id) is None:
+                return False
+            self._remove_upload_session(upload_id)
+            return True
+    
+    def _remove_upload_session(self, upload_id: str):
+        self._upload_hashers.pop(upload_id, None)
+        for path in (self._upload_data_file(upload_id), self._upload_state_file(upload_id)):
+            if path.exists():
+                os.remove(path)
+    
     def get_file_info(self, file_id: str) -> Optional[Dict[str, Any]]:
         """Get metadata for a specific file"""
-        return self.metadata.get(file_id)
+        return self.metadata_store.get(file_id)
     
     def get_file_path(self, file_id: str) -> Optional[str]:
         """Get the file system path for a file"""
@@ -262,26 +786,29 @@ class FileManager:
                 return str(file_path)
         return None
     
-    def list_files(self, filter_by: str = None, sort_by: str = 'upload_date', sort_desc: bool = True) -> List[Dict[str, Any]]:
-        """List all files with optional filtering and sorting"""
-        files = list(self.metadata.values())
-        
-        # Apply filters
-        if filter_by:
-            if filter_by == 'valid':
-                files = [f for f in files if f['validation_status'] == 'valid']
-            elif filter_by == 'invalid':
-                files = [f for f in files if f['validation_status'] == 'invalid']
-            elif filter_by in ['json', 'csv', 'jsonl']:
-                files = [f for f in files if f['file_type'] == filter_by]
-        
-        # Sort files
-        if sort_by in ['upload_date', 'last_used', 'usage_count', 'file_size']:
-            files.sort(key=lambda x: x.get(sort_by, ''), reverse=sort_desc)
-        elif sort_by == 'name':
-            files.sort(key=lambda x: x.get('display_name', '').lower(), reverse=sort_desc)
-        
-        return files
+    @staticmethod
+    def _list_filters(filter_by: Optional[str], tag: Optional[str]) -> Dict[str, Any]:
+        filters: Dict[str, Any] = {'tag': tag}
+        if filter_by in ['valid', 'invalid']:
+            filters['validation_status'] = filter_by
+        elif filter_by in ['json', 'csv', 'jsonl']:
+            filters['file_type'] = filter_by
+        return filters
+    
+    def list_files(self, filter_by: str = None, sort_by: str = 'upload_date', sort_desc: bool = True,
+                   tag: str = None, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """List files with optional filtering, sorting and pagination"""
+        return self.metadata_store.list(
+            sort_by=sort_by,
+            sort_desc=sort_desc,
+            limit=limit,
+            offset=offset,
+            **self._list_filters(filter_by, tag)
+        )
+    
+    def count_files(self, filter_by: str = None, tag: str = None) -> int:
+        """Number of files matching the list_files filters"""
+        return self.metadata_store.count(**self._list_filters(filter_by, tag))
     
     def get_file_preview(self, file_id: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
         """Get preview data for a file"""
@@ -314,14 +841,23 @@ class FileManager:
             if file_path.exists():
                 os.remove(file_path)
             
-            # Remove preview
+            # Remove from metadata and release its stored content in one transaction
+            sha256 = file_info.get('sha256')
+            with self.metadata_store.transaction():
+                self.metadata_store.delete(file_id)
+                if sha256:
+                    self.store.release(sha256, self._file_ref(file_id))
+            
+            # The content is deleted once nothing else references it
+            if sha256:
+                self.store.remove_if_unused(sha256)
+            
+            # Remove preview and Parquet copy
             preview_file = self.previews_dir / f"{file_id}_preview.json"
             if preview_file.exists():
                 os.remove(preview_file)
-            
-            # Remove from metadata
-            del self.metadata[file_id]
-            self._save_metadata()
+            self._remove_columnar(file_id)
+            self.frame_cache.invalidate(file_id)
             
             return True
             
@@ -331,14 +867,15 @@ class FileManager:
     
     def update_file_usage(self, file_id: str, session_id: str):
         """Update file usage statistics"""
-        if file_id in self.metadata:
-            self.metadata[file_id]['usage_count'] += 1
-            self.metadata[file_id]['last_used'] = datetime.now().isoformat()
-            
-            if session_id not in self.metadata[file_id]['used_in_sessions']:
-                self.metadata[file_id]['used_in_sessions'].append(session_id)
+        def apply(file_info: Dict[str, Any]):
+            file_info['usage_count'] = file_info.get('usage_count', 0) + 1
+            file_info['last_used'] = datetime.now().isoformat()
             
-            self._save_metadata()
+            sessions = file_info.setdefault('used_in_sessions', [])
+            if session_id not in sessions:
+                sessions.append(session_id)
+        
+        self.metadata_store.update(file_id, apply)
     
     def revalidate_file(self, file_id: str) -> bool:
         """Re-validate a file and update its metadata"""
@@ -351,8 +888,11 @@ class FileManager:
             validation_details = self._validate_file_data(file_path)
             
             # Update metadata
-            self.metadata[file_id]['validation_status'] = validation_details['status']
-            self.metadata[file_id]['validation_details'] = validation_details
+            def apply(file_info: Dict[str, Any]):
+                file_info['validation_status'] = validation_details['status']
+                file_info['validation_details'] = validation_details
+            
+            self.metadata_store.update(file_id, apply)
             
             # Update preview
             if validation_details['sample_data']:
@@ -360,30 +900,41 @@ class FileManager:
                 with open(preview_file, 'w', encoding='utf-8') as f:
                     json.dump(validation_details['sample_data'], f, indent=2, ensure_ascii=False, default=str)
             
-            self._save_metadata()
+            self._schedule_file_scan(file_id)
             return True
             
         except Exception as e:
             print(f"Error revalidating file {file_id}: {e}")
             return False
     
+    def merge_validation_details(self, file_id: str, details: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Merge keys into a file's validation details in one transaction
+        
+        Keys written concurrently by other passes (e.g. the background
+        statistics) are kept. Returns the merged validation details, or None
+        if the file does not exist.
+        """
+        def apply(file_info: Dict[str, Any]):
+            file_info['validation_details'] = {**(file_info.get('validation_details') or {}), **details}
+        
+        file_info = self.metadata_store.update(file_id, apply)
+        return file_info['validation_details'] if file_info is not None else None
+    
     def update_file_metadata(self, file_id: str, updates: Dict[str, Any]) -> bool:
         """Update file metadata (display_name, tags, etc.)"""
         try:
-            if file_id not in self.metadata:
-                return False
-            
             # Only allow certain fields to be updated
             allowed_fields = [
                 'display_name', 'tags', 'validation_details', 'column_mapping', 
                 'has_mapping', 'validation_status', 'last_used', 'usage_count'
             ]
-            for field, value in updates.items():
-                if field in allowed_fields:
-                    self.metadata[file_id][field] = value
             
-            self._save_metadata()
-            return True
+            def apply(file_info: Dict[str, Any]):
+                for field, value in updates.items():
+                    if field in allowed_fields:
+                        file_info[field] = value
+            
+            return self.metadata_store.update(file_id, apply) is not None
             
         except Exception as e:
             print(f"Error updating file metadata {file_id}: {e}")
@@ -391,27 +942,22 @@ class FileManager:
     
     def get_storage_stats(self) -> Dict[str, Any]:
         """Get storage statistics"""
-        total_files = len(self.metadata)
-        total_size = sum(f.get('file_size', 0) for f in self.metadata.values())
-        
-        # Count by type
-        type_counts = {}
-        for file_info in self.metadata.values():
-            file_type = file_info.get('file_type', 'unknown')
-            type_counts[file_type] = type_counts.get(file_type, 0) + 1
+        # Totals and per type / validation status counts, aggregated in SQLite
+        file_stats = self.metadata_store.get_stats()
+        total_size = file_stats['total_size_bytes']
         
-        # Count by validation status
-        status_counts = {}
-        for file_info in self.metadata.values():
-            status = file_info.get('validation_status', 'unknown')
-            status_counts[status] = status_counts.get(status, 0) + 1
+        # Bytes actually on disk after content deduplication
+        store_stats = self.store.get_stats()
         
         return {
-            'total_files': total_files,
+            'total_files': file_stats['total_files'],
             'total_size_bytes': total_size,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
-            'type_counts': type_counts,
-            'status_counts': status_counts
+            'stored_size_bytes': store_stats['stored_bytes'],
+            'stored_objects': store_stats['objects'],
+            'dataframe_cache': self.frame_cache.get_stats(),
+            'type_counts': file_stats['type_counts'],
+            'status_counts': file_stats['status_counts']
         }
 
 # Global file manager instance
@@ -0,0 +1,262 @@
+"""
+SQLite-backed store for uploaded file metadata.
+
+Each file is one row holding its metadata document plus indexed copies of
+the fields listings filter and sort on (upload date, type, validation
+status, usage, size, name), and its tags in a separate indexed table. An
+upload, delete or usage bump rewrites one row in its own transaction
+instead of the whole metadata document, and listings are filtered, sorted
+and paginated by SQLite. The database runs in WAL mode, so an interrupted
+write never leaves a truncated metadata file behind.
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+
+# Listing sort keys -> indexed column
+SORT_COLUMNS = {
+    "upload_date": "upload_date",
+    "last_used": "last_used",
+    "usage_count": "usage_count",
+    "file_size": "file_size",
+    "name": "name_key",
+}
+
+
+class FileMetadataStore:
+    """Persists file metadata as JSON documents with indexed lookup columns"""
+
+    def __init__(self, db_path: Union[str, Path], legacy_metadata_file: Optional[Union[str, Path]] = None):
+        self.db_path = str(db_path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            self.db_path,
+            timeout=30.0,
+            check_same_thread=False,
+            isolation_level=None  # autocommit; transactions are explicit
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._initialize()
+
+        if legacy_metadata_file is not None:
+            self._import_legacy_metadata(Path(legacy_metadata_file))
+
+    def _initialize(self):
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=30000")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    file_id TEXT PRIMARY KEY,
+                    name_key TEXT NOT NULL,
+                    file_type TEXT,
+                    validation_status TEXT,
+                    upload_date TEXT,
+                    last_used TEXT,
+                    usage_count INTEGER NOT NULL DEFAULT 0,
+                    file_size INTEGER NOT NULL DEFAULT 0,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files (upload_date);
+                CREATE INDEX IF NOT EXISTS idx_files_type ON files (file_type, upload_date);
+                CREATE INDEX IF NOT EXISTS idx_files_validation_status ON files (validation_status, upload_date);
+                CREATE INDEX IF NOT EXISTS idx_files_last_used ON files (last_used);
+                CREATE INDEX IF NOT EXISTS idx_files_usage_count ON files (usage_count);
+                CREATE INDEX IF NOT EXISTS idx_files_file_size ON files (file_size);
+                CREATE INDEX IF NOT EXISTS idx_files_name ON files (name_key);
+
+                CREATE TABLE IF NOT EXISTS file_tags (
+                    file_id TEXT NOT NULL REFERENCES files (file_id) ON DELETE CASCADE,
+                    tag TEXT NOT NULL,
+                    PRIMARY KEY (file_id, tag)
+                );
+                CREATE INDEX IF NOT EXISTS idx_file_tags_tag ON file_tags (tag);
+            """)
+
+    def _import_legacy_metadata(self, metadata_file: Path):
+        """One-time migration from the old files_metadata.json"""
+        if not metadata_file.exists():
+            return
+
+        try:
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading legacy file metadata {metadata_file}: {e}")
+            return
+
+        with self.transaction():
+            for file_info in metadata.values():
+                if not self._exists(file_info["file_id"]):
+                    self._upsert(file_info)
+
+        metadata_file.rename(metadata_file.with_name(metadata_file.name + ".migrated"))
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The database connection, for tables that commit together with file rows"""
+        return self._conn
+
+    @property
+    def lock(self) -> threading.RLock:
+        """Lock guarding the connection; hold it (or use transaction()) to share the connection"""
+        return self._lock
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """One write transaction; joins the caller's transaction when one is open"""
+        with self._lock:
+            if self._conn.in_transaction:
+                yield
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _exists(self, file_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM files WHERE file_id = ?", (file_id,)).fetchone() is not None
+
+    def _get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT data FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def _upsert(self, file_info: Dict[str, Any]):
+        columns = ["file_id", "name_key", "file_type", "validation_status", "upload_date",
+                   "last_used", "usage_count", "file_size", "data"]
+        values = [
+            file_info["file_id"],
+            str(file_info.get("display_name") or "").lower(),
+            file_info.get("file_type"),
+            file_info.get("validation_status"),
+            file_info.get("upload_date"),
+            file_info.get("last_used"),
+            file_info.get("usage_count") or 0,
+            file_info.get("file_size") or 0,
+            json.dumps(file_info, ensure_ascii=False, default=str),
+        ]
+        # An UPSERT (not INSERT OR REPLACE) so the row, and with it its tags, is not deleted first
+        self._conn.execute(
+            f"""INSERT INTO files ({", ".join(columns)})
+                VALUES ({", ".join("?" for _ in columns)})
+                ON CONFLICT (file_id) DO UPDATE SET
+                {", ".join(f"{column} = excluded.{column}" for column in columns[1:])}""",
+            values
+        )
+        self._conn.execute("DELETE FROM file_tags WHERE file_id = ?", (file_info["file_id"],))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO file_tags (file_id, tag) VALUES (?, ?)",
+            [(file_info["file_id"], str(tag)) for tag in file_info.get("tags") or []]
+        )
+
+    def save(self, file_info: Dict[str, Any]):
+        """Insert or replace one file's metadata"""
+        with self.transaction():
+            self._upsert(file_info)
+
+    def update(self, file_id: str, apply: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        """Read-modify-write one file's metadata in a single transaction
+
+        ``apply`` changes the metadata dict in place. Returns the updated
+        metadata, or None if the file does not exist.
+        """
+        with self.transaction():
+            file_info = self._get(file_id)
+            if file_info is not None:
+                apply(file_info)
+                self._upsert(file_info)
+        return file_info
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._get(file_id)
+
+    def list(self,
+             file_type: Optional[str] = None,
+             validation_status: Optional[str] = None,
+             tag: Optional[str] = None,
+             sort_by: str = "upload_date",
+             sort_desc: bool = True,
+             limit: Optional[int] = None,
+             offset: int = 0) -> List[Dict[str, Any]]:
+        """Files matching the filters, sorted (upload date by default) and paginated"""
+        where, params = self._filters(file_type, validation_status, tag)
+        column = SORT_COLUMNS.get(sort_by, "upload_date")
+        direction = "DESC" if sort_desc else "ASC"
+        query = f"SELECT data FROM files{where} ORDER BY {column} {direction}, file_id {direction}"
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def count(self,
+              file_type: Optional[str] = None,
+              validation_status: Optional[str] = None,
+              tag: Optional[str] = None) -> int:
+        where, params = self._filters(file_type, validation_status, tag)
+        with self._lock:
+            row = self._conn.execute(f"SELECT COUNT(*) FROM files{where}", params).fetchone()
+        return row[0]
+
+    def ids_with_stats_status(self, statuses: List[str]) -> List[str]:
+        """Ids of files whose full-scan statistics are in one of ``statuses``"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT file_id FROM files
+                    WHERE json_extract(data, '$.validation_details.stats_status')
+                    IN ({", ".join("?" for _ in statuses)})""",
+                list(statuses)
+            ).fetchall()
+        return [row["file_id"] for row in rows]
+
+    def delete(self, file_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+        return cursor.rowcount > 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """File count, total size and counts per type and validation status"""
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT COUNT(*) AS files, COALESCE(SUM(file_size), 0) AS size FROM files"
+            ).fetchone()
+            type_rows = self._conn.execute(
+                "SELECT COALESCE(file_type, 'unknown') AS value, COUNT(*) AS n FROM files GROUP BY file_type"
+            ).fetchall()
+            status_rows = self._conn.execute(
+                "SELECT COALESCE(validation_status, 'unknown') AS value, COUNT(*) AS n FROM files GROUP BY validation_status"
+            ).fetchall()
+        return {
+            "total_files": totals["files"],
+            "total_size_bytes": totals["size"],
+            "type_counts": {row["value"]: row["n"] for row in type_rows},
+            "status_counts": {row["value"]: row["n"] for row in status_rows},
+        }
+
+    @staticmethod
+    def _filters(file_type: Optional[str], validation_status: Optional[str], tag: Optional[str]):
+        clauses = []
+        params: List[Any] = []
+        if file_type:
+            clauses.append("file_type = ?")
+            params.append(file_type)
+        if validation_status:
+            clauses.append("validation_status = ?")
+            params.append(validation_status)
+        if tag:
+            clauses.append("file_id IN (SELECT file_id FROM file_tags WHERE tag = ?)")
+            params.append(tag)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
@@ -0,0 +1,309 @@
+"""
+Batched generation worker for streaming inference.
+
+A single background thread owns the generate loop for the loaded model.
+Streaming requests are queued, grouped with other compatible requests and
+decoded together in one batched generate() call. New text for each request
+is handed back to its caller through a bounded asyncio queue.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+
+@dataclass
+class StreamRequest:
+    """A single streaming generation request waiting for (or in) a batch"""
+    input_ids: List[int]
+    max_tokens: int
+    temperature: float
+    do_sample: bool
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue
+    cancelled: bool = False
+    finished: bool = False
+    # Text produced while the consumer's queue was full; flushed as one chunk
+    pending_text: str = ""
+    pending_done: bool = False
+    pending_error: Optional[str] = None
+    generate_kwargs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def batch_key(self) -> Tuple[float, bool, Tuple[Tuple[str, Any], ...]]:
+        """Requests can share a generate() call only if their sampling setup matches"""
+        return (
+            self.temperature,
+            self.do_sample,
+            tuple(sorted((k, repr(v)) for k, v in self.generate_kwargs.items())),
+        )
+
+    def offer(self, text: str, done: bool = False, error: Optional[str] = None):
+        """Queue new output for the consumer (must run on the request's event loop).
+
+        When the consumer is behind and the queue is full, text is coalesced
+        into ``pending_text`` instead of blocking the shared generation batch.
+        """
+        self.pending_text += text
+        self.pending_done = self.pending_done or done
+        self.pending_error = self.pending_error or error
+        self.flush()
+
+    def flush(self):
+        """Move coalesced output into the queue if there is room"""
+        if not (self.pending_text or self.pending_done or self.pending_error):
+            return
+        if self.queue.full():
+            return
+        self.queue.put_nowait((self.pending_text, self.pending_done, self.pending_error))
+        self.pending_text = ""
+        self.pending_done = False
+        self.pending_error = None
+
+
+class BatchTokenStreamer:
+    """generate() streamer that fans newly generated tokens out to each request in the batch"""
+
+    def __init__(self, tokenizer, requests: List[StreamRequest], eos_token_ids: List[int]):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.eos_token_ids = set(eos_token_ids)
+        self.token_ids: List[List[int]] = [[] for _ in requests]
+        self.emitted_text: List[str] = ["" for _ in requests]
+        self.next_tokens_are_prompt = True
+
+    def put(self, value):
+        # The first call carries the prompt ids; only stream what comes after
+        if self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            return
+
+        if value.dim() > 1:
+            value = value[:, -1]
+
+        for row, token_id in enumerate(value.tolist()):
+            request = self.requests[row]
+            if request.finished:
+                continue
+
+            if request.cancelled or token_id in self.eos_token_ids:
+                self._finish(row)
+                continue
+
+            self.token_ids[row].append(token_id)
+            text = self.tokenizer.decode(self.token_ids[row], skip_special_tokens=True)
+
+            # Hold back incomplete multi-byte characters until the next token arrives
+            if not text.endswith("\ufffd"):
+                new_text = text[len(self.emitted_text[row]):]
+                if new_text:
+                    self.emitted_text[row] = text
+                    self._deliver(request, new_text)
+
+            if len(self.token_ids[row]) >= request.max_tokens:
+                self._finish(row)
+
+    def end(self):
+        for row in range(len(self.requests)):
+            self._finish(row)
+
+    def all_finished(self) -> bool:
+        return all(request.finished or request.cancelled for request in self.requests)
+
+    def _finish(self, row: int):
+        request = self.requests[row]
+        if request.finished:
+            return
+        request.finished = True
+        # Flush whatever was held back waiting for a complete character
+        text = self.tokenizer.decode(self.token_ids[row], skip_special_tokens=True)
+        self._deliver(request, text[len(self.emitted_text[row]):], done=True)
+        self.emitted_text[row] = text
+
+    @staticmethod
+    def _deliver(request: StreamRequest, text: str, done: bool = False):
+        if request.cancelled:
+            return
+        try:
+            request.loop.call_soon_threadsafe(request.offer, text, done)
+        except RuntimeError:
+            # Event loop is closed; the client is gone
+            request.cancelled = True
+
+
+class _BatchFinishedCriteria(StoppingCriteria):
+    """Stop the batched generate() once every request has finished or disconnected"""
+
+    def __init__(self, streamer: BatchTokenStreamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.streamer.all_finished()
+
+
+class GenerationWorker:
+    """Runs streaming generation for all callers on one thread, in batches"""
+
+    def __init__(self,
+                 model_manager,
+                 max_batch_size: int = 16,
+                 batch_window_ms: float = 10.0,
+                 queue_size: int = 64):
+        self.model_manager = model_manager
+        self.max_batch_size = max_batch_size
+        self.batch_window_s = batch_window_ms / 1000.0
+        self.queue_size = queue_size
+
+        self._requests: "queue.Queue[StreamRequest]" = queue.Queue()
+        self._deferred: List[StreamRequest] = []
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    async def stream(self,
+                     input_ids: List[int],
+                     max_tokens: int = 150,
+                     temperature: float = 0.7,
+                     do_sample: bool = True,
+                     **generate_kwargs) -> AsyncIterator[str]:
+        """Submit compiled prompt ids and yield generated text chunks as they are produced"""
+        request = StreamRequest(
+            input_ids=input_ids,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            do_sample=do_sample,
+            loop=asyncio.get_running_loop(),
+            queue=asyncio.Queue(maxsize=self.queue_size),
+            generate_kwargs=generate_kwargs,
+        )
+        self._ensure_started()
+        self._requests.put(request)
+
+        try:
+            while True:
+                text, done, error = await request.queue.get()
+                # A slot just freed up; pick up anything coalesced meanwhile
+                request.flush()
+                if error:
+                    raise RuntimeError(error)
+                if text:
+                    yield text
+                if done:
+                    return
+        finally:
+            # Consumer finished or disconnected; let the batch drop this row
+            request.cancelled = True
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="generation-worker",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._generate_batch(batch)
+
+    def _next_batch(self) -> List[StreamRequest]:
+        """Collect the next group of compatible requests"""
+        if self._deferred:
+            first = self._deferred.pop(0)
+        else:
+            first = self._requests.get()
+
+        batch = [first]
+        deferred = []
+
+        # Requests deferred from an earlier round go first
+        for request in self._deferred:
+            if len(batch) < self.max_batch_size and request.batch_key == first.batch_key:
+                batch.append(request)
+            else:
+                deferred.append(request)
+
+        # Then give concurrent callers a short window to join this batch
+        deadline = time.monotonic() + self.batch_window_s
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request.batch_key == first.batch_key:
+                batch.append(request)
+            else:
+                deferred.append(request)
+
+        self._deferred = deferred
+        return [request for request in batch if not request.cancelled]
+
+    def _generate_batch(self, batch: List[StreamRequest]):
+        model = self.model_manager.current_model
+        tokenizer = self.model_manager.current_tokenizer
+
+        if model is None or tokenizer is None:
+            self._fail(batch, "No model currently loaded. Please load a model first.")
+            return
+
+        try:
+            # Decoder-only models need left padding so every row ends at its prompt
+            pad_token_id = tokenizer.pad_token_id
+            if pad_token_id is None:
+                pad_token_id = tokenizer.eos_token_id
+            width = max(len(request.input_ids) for request in batch)
+
+            model_device = self.model_manager._get_model_device()
+            input_ids = torch.tensor(
+                [[pad_token_id] * (width - len(request.input_ids)) + request.input_ids for request in batch],
+                dtype=torch.long,
+                device=model_device
+            )
+            attention_mask = torch.tensor(
+                [[0] * (width - len(request.input_ids)) + [1] * len(request.input_ids) for request in batch],
+                dtype=torch.long,
+                device=model_device
+            )
+
+            streamer = BatchTokenStreamer(tokenizer, batch, [tokenizer.eos_token_id])
+            first = batch[0]
+
+            with torch.no_grad():
+                model.generate(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    max_new_tokens=max(request.max_tokens for request in batch),
+                    temperature=first.temperature,
+                    do_sample=first.do_sample,
+                    pad_token_id=tokenizer.eos_token_id,
+                    eos_token_id=tokenizer.eos_token_id,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_BatchFinishedCriteria(streamer)]),
+                    **first.generate_kwargs
+                )
+
+        except Exception as e:
+            self._fail(batch, f"Error generating response: {str(e)}")
+
+    @staticmethod
+    def _fail(batch: List[StreamRequest], message: str):
+        for request in batch:
+            if request.finished or request.cancelled:
+                continue
+            request.finished = True
+            try:
+                request.loop.call_soon_threadsafe(request.offer, "", True, message)
+            except RuntimeError:
+                pass
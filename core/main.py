@@ -1,4 +1,17 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form, Request
+import os
+import sys
+
+if __name__ == "__main__":
+    # Serve through uvicorn's module entry point rather than running this file as
+    # __main__: worker processes started with "spawn" (dataset builds) re-import
+    # the __main__ module, which here would load the whole application in each one.
+    os.execv(sys.executable, [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+        "--host", "0.0.0.0", "--port", "8000"
+    ])
+
+from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, StreamingResponse
@@ -14,7 +27,6 @@ import uuid
 import pandas as pd
 import tempfile
 import shutil
-import base64
 import logging
 
 # Import enhanced models and config processor
@@ -34,7 +46,7 @@ from model_manager import model_manager
 from evaluation_service import evaluation_service, validate_test_data, load_test_data_from_file
 
 # Import the file manager
-from file_manager import file_manager
+from file_manager import file_manager, write_base64_file
 
 # Import monitoring services
 from services.monitoring_service import system_monitor
@@ -66,6 +78,16 @@ async def lifespan(app: FastAPI):
     # Start connection cleanup
     cleanup_task = asyncio.create_task(connection_cleanup_task())
     
+    # Fill the model catalog and keep it current in the background
+    model_manager.model_catalog.start_watching()
+    
+    # Dataset builds do not survive a restart
+    from services.dataset_service import dataset_service
+    dataset_service.fail_interrupted_builds()
+    
+    # File statistics scans are started over
+    file_manager.resume_file_scans()
+    
     # Add alert callback
     def on_alert(alert):
         logging.warning(f"ALERT: {alert.title} - {alert.message}")
@@ -77,6 +99,7 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logging.info("Stopping monitoring services...")
     system_monitor.stop_monitoring()
+    model_manager.model_catalog.stop_watching()
     monitoring_task.cancel()
     broadcast_task.cancel()
     alerts_task.cancel()
@@ -290,14 +313,37 @@ def save_training_data_copy(session_id: str, data_file_path: str):
     if not data_dir or not os.path.exists(data_dir):
         return
     
-    # Copy training data file
+    # Link training data file (shared with identical data already stored, not copied)
     if os.path.exists(data_file_path):
         filename = os.path.basename(data_file_path)
         dest_path = os.path.join(data_dir, f"training_data_{filename}")
-        shutil.copy2(data_file_path, dest_path)
+        sha256 = file_manager.link_file_content(data_file_path, dest_path, f"session:{session_id}")
         
         # Update session metadata with data file path
         session_data['training_data_file'] = dest_path
+        session_data['training_data_sha256'] = sha256
+        save_training_session(session_id, session_data)
+
+def save_training_dataset_copy(session_id: str, dataset_id: str):
+    """Link a library dataset's stored data into the session directory (shared with the dataset, not copied)"""
+    from services.dataset_service import dataset_service
+    
+    session_data = load_training_session(session_id)
+    if not session_data:
+        return
+    
+    data_dir = session_data.get('data_directory')
+    if not data_dir or not os.path.exists(data_dir):
+        return
+    
+    # Hardlinks to the dataset store's blocks, referenced there until the session is deleted
+    linked = dataset_service.link_segments(
+        dataset_id, os.path.join(data_dir, f"training_data_{dataset_id}"), f"session:{session_id}"
+    )
+    if linked:
+        session_data['training_data_file'] = linked['path']
+        session_data['training_dataset_id'] = dataset_id
+        session_data['training_data_segments'] = linked['segments']
         save_training_session(session_id, session_data)
 
 def get_session_files(session_id: str) -> Dict[str, Any]:
@@ -445,11 +491,23 @@ class ChatResponse(BaseModel):
     message: str
     response: str
     model_path: Optional[str] = None
+    speculative: Optional[Dict[str, Any]] = None
 
 class ModelLoadRequest(BaseModel):
     model_path: str
     max_seq_length: Optional[int] = 2048
 
+class TokenizeRequest(BaseModel):
+    message: str
+    system_prompt: Optional[str] = None
+    max_tokens: Optional[int] = 150
+
+class SpeculativeDecodingRequest(BaseModel):
+    method: str = "none"  # none, prompt_lookup, draft_model
+    num_draft_tokens: Optional[int] = 10
+    max_ngram_size: Optional[int] = 2
+    draft_model_path: Optional[str] = None
+
 class ModelResponse(BaseModel):
     status: str
     message: str
@@ -485,46 +543,17 @@ def validate_data_file(data: pd.DataFrame, file_type: str) -> Dict[str, Any]:
         "file_type": file_type.upper()
     }
 
+def describe_sample_count(validation_details: Dict[str, Any]) -> str:
+    """Sample count of an uploaded file for messages; a lower bound until its full scan completes"""
+    total_rows = validation_details.get('total_rows', 0)
+    if validation_details.get('stats_status') in ('pending', 'running'):
+        return f"at least {total_rows} samples, full count pending"
+    return f"{total_rows} samples"
+
 def load_data_file(file_path: str) -> tuple[pd.DataFrame, str]:
-    """Load data from CSV or JSON file"""
+    """Load data from a data file; returns the DataFrame and the file type"""
     file_extension = os.path.splitext(file_path)[1].lower()
-    
-    if file_extension == '.csv':
-        df = pd.read_csv(file_path)
-        return df, 'csv'
-    
-    elif file_extension == '.json':
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Handle different JSON structures
-        if isinstance(data, list):
-            # Array of objects: [{"instruction": "...", "output": "..."}, ...]
-            df = pd.DataFrame(data)
-        elif isinstance(data, dict):
-            # Check if it's object with arrays: {"instruction": [...], "output": [...]}
-            if all(isinstance(v, list) for v in data.values()):
-                df = pd.DataFrame(data)
-            else:
-                # Single object, convert to single-row DataFrame
-                df = pd.DataFrame([data])
-        else:
-            raise ValueError("Invalid JSON format. Expected array of objects or object with arrays.")
-        
-        return df, 'json'
-    
-    elif file_extension == '.jsonl':
-        # Handle JSONL (JSON Lines) format
-        data = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    data.append(json.loads(line))
-        df = pd.DataFrame(data)
-        return df, 'jsonl'
-    
-    else:
-        raise ValueError(f"Unsupported file format: {file_extension}. Supported formats: .csv, .json, .jsonl")
+    return file_manager.load_dataframe(file_path), file_extension.lstrip('.')
 
 def run_training_job_with_data_file(job_id: str, data_file_path: str, config: Dict[str, Any]):
     """Run training with data file (CSV/JSON) in a separate thread"""
@@ -627,41 +656,21 @@ def run_training_job_with_dataset(job_id: str, dataset_id: str, config: Dict[str
         # Save updated session to persistent storage
         save_training_session(job_id, training_jobs[job_id])
         
-        # Get dataset data from dataset service
+        # Training reads the dataset straight from its stored segments
         from services.dataset_service import dataset_service
         
-        dataset_data = dataset_service.get_dataset_data(dataset_id)
-        if not dataset_data:
+        dataset = dataset_service.get_dataset(dataset_id)
+        if not dataset or dataset.status != 'ready':
             raise ValueError(f"Dataset with ID {dataset_id} not found or data not accessible")
         
-        # Convert TrainingExample objects to dictionaries for JSON serialization
-        training_data = []
-        for example in dataset_data:
-            if hasattr(example, 'dict'):
-                # It's a Pydantic model, convert to dict
-                training_data.append(example.dict())
-            elif isinstance(example, dict):
-                # It's already a dict
-                training_data.append(example)
-            else:
-                # Convert to dict if possible
-                training_data.append(dict(example))
-        
-        # Create temporary file with dataset data
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, f"dataset_{uuid.uuid4().hex}.json")
-        
-        with open(temp_file_path, 'w', encoding='utf-8') as f:
-            json.dump(training_data, f, indent=2, ensure_ascii=False)
-        
         # Save a copy of training data to session directory
-        save_training_data_copy(job_id, temp_file_path)
+        save_training_dataset_copy(job_id, dataset_id)
         
         # Track dataset usage
         dataset_service.track_usage(dataset_id)
         
-        # Call training function with dataset file path and config
-        train_with_config(temp_file_path, config, job_id)
+        # Call training function with the dataset and config
+        train_with_config(None, config, job_id, dataset_id=dataset_id)
         
         training_jobs[job_id]["status"] = "completed"
         training_jobs[job_id]["completed_at"] = get_ist_timestamp()
@@ -686,12 +695,6 @@ def run_training_job_with_dataset(job_id: str, dataset_id: str, config: Dict[str
         
         # Save failed session state to persistent storage
         save_training_session(job_id, training_jobs[job_id])
-    finally:
-        # Clean up temporary dataset file
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        if 'temp_dir' in locals() and os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
 
 def run_training_job(job_id: str, config: FinetuneRequest):
     """Run training in a separate thread (legacy method)"""
@@ -961,19 +964,18 @@ async def handle_base64_request(request: Request, background_tasks: BackgroundTa
         if base64_request.learning_rate <= 0 or base64_request.learning_rate > 1:
             raise HTTPException(status_code=400, detail="learning_rate must be between 0 and 1")
         
-        # Decode base64 content
-        try:
-            file_content = base64.b64decode(base64_request.file_content)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
-        
         # Create temporary file
         temp_dir = tempfile.mkdtemp()
         file_extension = f".{base64_request.file_type.lower()}"
         temp_file_path = os.path.join(temp_dir, f"training_data_{uuid.uuid4().hex}{file_extension}")
         
-        with open(temp_file_path, "wb") as f:
-            f.write(file_content)
+        # Decode base64 content straight to the temporary file
+        try:
+            write_base64_file(base64_request.file_content, temp_file_path)
+        except Exception as e:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
         
         # Load and validate data file
         try:
@@ -1069,6 +1071,8 @@ async def start_finetuning_with_file_id(
             dataset = dataset_service.get_dataset(file_id)
             if not dataset:
                 raise HTTPException(status_code=404, detail=f"Dataset with ID {file_id} not found")
+            if dataset.status != "ready":
+                raise HTTPException(status_code=409, detail=f"Dataset {file_id} is not ready (status: {dataset.status})")
             
             # Generate unique job ID
             job_id = str(uuid.uuid4())
@@ -1150,7 +1154,7 @@ async def start_finetuning_with_file_id(
             return FinetuneResponse(
                 job_id=job_id,
                 status="queued",
-                message=f"Enhanced finetuning job queued with model '{trainer_config.model_name}' using file '{file_info['display_name']}' ({file_info['validation_details']['total_rows']} samples)",
+                message=f"Enhanced finetuning job queued with model '{trainer_config.model_name}' using file '{file_info['display_name']}' ({describe_sample_count(file_info.get('validation_details', {}))})",
                 dashboard_url=f"https://finetune_engine.deepcite.in/training/{job_id}"
             )
         
@@ -2075,6 +2079,13 @@ async def delete_training_session(session_id: str):
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error deleting session directory: {str(e)}")
     
+    # Release the session's reference to its training data content
+    if session_data.get('training_data_sha256'):
+        file_manager.release_file_content(session_data['training_data_sha256'], f"session:{session_id}")
+    if session_data.get('training_data_segments'):
+        from services.dataset_service import dataset_service
+        dataset_service.release_segments(session_data['training_data_segments'], f"session:{session_id}")
+    
     # Remove from in-memory storage if present
     if session_id in training_jobs:
         del training_jobs[session_id]
@@ -2532,6 +2543,52 @@ async def unload_model():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error unloading model: {str(e)}")
 
+@app.post("/api/models/tokenize")
+async def tokenize_prompt(request: TokenizeRequest):
+    """Count prompt tokens for the loaded model without running generation"""
+    try:
+        result = model_manager.count_prompt_tokens(
+            message=request.message,
+            max_tokens=request.max_tokens,
+            system_prompt=request.system_prompt
+        )
+        
+        if result["status"] == "error":
+            raise HTTPException(status_code=400, detail=result["message"])
+        
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error tokenizing prompt: {str(e)}")
+
+@app.get("/api/models/speculative")
+async def get_speculative_decoding():
+    """Get the speculative decoding settings used for local generation"""
+    return model_manager.get_speculative_status()
+
+@app.post("/api/models/speculative")
+async def configure_speculative_decoding(request: SpeculativeDecodingRequest):
+    """Enable prompt-lookup or draft-model speculative decoding, or turn it off"""
+    try:
+        result = model_manager.configure_speculative_decoding(
+            method=request.method,
+            num_draft_tokens=request.num_draft_tokens,
+            max_ngram_size=request.max_ngram_size,
+            draft_model_path=request.draft_model_path
+        )
+        
+        if result["status"] == "error":
+            raise HTTPException(status_code=400, detail=result["message"])
+        
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error configuring speculative decoding: {str(e)}")
+
 @app.post("/chat/single", response_model=ChatResponse)
 async def chat_single(request: SingleChatRequest):
     """Send a single message to the model and get a response"""
@@ -2557,7 +2614,8 @@ async def chat_single(request: SingleChatRequest):
             status=result["status"],
             message=result["message"],
             response=result["response"],
-            model_path=model_manager.current_model_path
+            model_path=model_manager.current_model_path,
+            speculative=result.get("speculative")
         )
         
     except HTTPException:
@@ -2866,19 +2924,18 @@ async def handle_evaluation_base64_request(request: Request):
                 detail=f"file_type must be one of: {', '.join(allowed_file_types)}. Got: {eval_request.file_type}"
             )
         
-        # Decode base64 content
-        try:
-            file_content = base64.b64decode(eval_request.file_content)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
-        
         # Create temporary file
         temp_dir = tempfile.mkdtemp()
         file_extension = f".{eval_request.file_type.lower()}"
         temp_file_path = os.path.join(temp_dir, f"test_data_{uuid.uuid4().hex}{file_extension}")
         
-        with open(temp_file_path, "wb") as f:
-            f.write(file_content)
+        # Decode base64 content straight to the temporary file
+        try:
+            write_base64_file(eval_request.file_content, temp_file_path)
+        except Exception as e:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
         
         # Load and validate test data
         try:
@@ -3055,12 +3112,9 @@ async def handle_file_upload_multipart(request: Request):
                 detail=f"File must be one of: {', '.join(allowed_extensions)}. Got: {file_extension}"
             )
         
-        # Read file content
-        file_content = await data_file.read()
-        
-        # Upload file using file manager
-        result = file_manager.upload_file(
-            file_content=file_content,
+        # Copy the spooled upload to storage chunk by chunk
+        result = file_manager.upload_file_stream(
+            data_file.file,
             original_filename=data_file.filename,
             display_name=display_name
         )
@@ -3086,12 +3140,6 @@ async def handle_file_upload_base64(request: Request):
         body = await request.json()
         upload_request = FileUploadRequest(**body)
         
-        # Decode base64 content
-        try:
-            file_content = base64.b64decode(upload_request.file_content)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
-        
         # Validate file type
         allowed_extensions = ['.csv', '.json', '.jsonl']
         file_extension = os.path.splitext(upload_request.original_filename)[1].lower()
@@ -3102,12 +3150,15 @@ async def handle_file_upload_base64(request: Request):
                 detail=f"File must be one of: {', '.join(allowed_extensions)}. Got: {file_extension}"
             )
         
-        # Upload file using file manager
-        result = file_manager.upload_file(
-            file_content=file_content,
-            original_filename=upload_request.original_filename,
-            display_name=upload_request.display_name
-        )
+        # Decode base64 content straight to storage
+        try:
+            result = file_manager.upload_base64_file(
+                upload_request.file_content,
+                original_filename=upload_request.original_filename,
+                display_name=upload_request.display_name
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid base64 encoding: {str(e)}")
         
         if result['success']:
             return FileUploadResponse(
@@ -3128,22 +3179,34 @@ async def handle_file_upload_base64(request: Request):
 async def list_training_files(
     filter_by: Optional[str] = None,
     sort_by: Optional[str] = "upload_date",
-    sort_desc: Optional[bool] = True
+    sort_desc: Optional[bool] = True,
+    tag: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: Optional[int] = Query(None, ge=1, le=1000)
 ):
     """List all uploaded training files"""
     try:
+        # Filtered, sorted and paginated in the metadata store
+        start_idx = (page - 1) * page_size if page_size else 0
         files = file_manager.list_files(
             filter_by=filter_by,
             sort_by=sort_by,
-            sort_desc=sort_desc
+            sort_desc=sort_desc,
+            tag=tag,
+            limit=page_size,
+            offset=start_idx
         )
         
+        total_files = file_manager.count_files(filter_by=filter_by, tag=tag) if page_size else len(files)
         storage_stats = file_manager.get_storage_stats()
         
         return FileListResponse(
             files=files,
-            total=len(files),
-            storage_stats=storage_stats
+            total=total_files,
+            storage_stats=storage_stats,
+            page=page,
+            page_size=page_size,
+            has_more=start_idx + len(files) < total_files
         )
         
     except Exception as e:
@@ -3502,7 +3565,3 @@ async def health():
         Response: Health status response
     """
     return {"status": "ready"}
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
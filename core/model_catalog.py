@@ -0,0 +1,159 @@
+"""
+In-memory catalog of locally trained models.
+
+The catalog scans the model directories once, keeps one entry per model in
+memory and re-scans in a background polling thread. Each entry is keyed by a
+cheap stat signature of its directory and adapter files, so sizes and
+metadata are only recomputed for models that actually changed.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Signature = Tuple[Any, ...]
+
+
+class ModelCatalog:
+    """Keeps the list of available local models current without per-request disk walks"""
+
+    def __init__(self,
+                 build_entry: Callable[[str, str], Optional[Dict[str, Any]]],
+                 scan_dirs: Optional[List[str]] = None,
+                 model_dirs: Optional[List[Tuple[str, str]]] = None,
+                 watched_files: Optional[List[str]] = None,
+                 poll_interval: float = 5.0):
+        """
+        Args:
+            build_entry: Called as ``build_entry(name, path)``; returns the catalog
+                entry for a model directory, or None if it is not a valid model.
+            scan_dirs: Directories whose sub-directories are candidate models.
+            model_dirs: ``(name, path)`` pairs that are candidate models themselves.
+            watched_files: Files inside a model directory whose changes invalidate its entry.
+            poll_interval: Seconds between background re-scans.
+        """
+        self.build_entry = build_entry
+        self.scan_dirs = scan_dirs or []
+        self.model_dirs = model_dirs or []
+        self.watched_files = watched_files or []
+        self.poll_interval = poll_interval
+
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._signatures: Dict[str, Signature] = {}
+        self._order: List[str] = []
+        self._scanned = False
+        self._lock = threading.Lock()
+        self._watch_thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def list_models(self) -> List[Dict[str, Any]]:
+        """Return the cached model entries, scanning once if the catalog is still empty"""
+        if not self._scanned:
+            self.refresh()
+        with self._lock:
+            return [dict(self._entries[path]) for path in self._order if path in self._entries]
+
+    def refresh(self) -> bool:
+        """Re-scan the model directories; returns True if anything changed"""
+        candidates = self._candidates()
+        entries: Dict[str, Dict[str, Any]] = {}
+        signatures: Dict[str, Signature] = {}
+        order: List[str] = []
+
+        for name, path in candidates:
+            signature = self._signature(path)
+            if signature is None:
+                continue
+
+            if self._signatures.get(path) == signature and path in self._entries:
+                entry = self._entries[path]
+            else:
+                entry = self.build_entry(name, path)
+
+            signatures[path] = signature
+            if entry is not None:
+                entries[path] = entry
+                order.append(path)
+
+        with self._lock:
+            changed = (
+                not self._scanned
+                or order != self._order
+                or any(self._signatures.get(path) != signatures[path] for path in order)
+            )
+            self._entries = entries
+            self._signatures = signatures
+            self._order = order
+            self._scanned = True
+
+        return changed
+
+    def invalidate(self, path: Optional[str] = None):
+        """Force entries (or one entry) to be rebuilt on the next refresh"""
+        with self._lock:
+            if path is None:
+                self._signatures = {}
+            else:
+                self._signatures.pop(path, None)
+        self.refresh()
+
+    def start_watching(self):
+        """Fill the catalog and keep it current from a background polling thread"""
+        self.refresh()
+
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return
+
+        self._running = True
+
+        def watch_loop():
+            while self._running:
+                time.sleep(self.poll_interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Model catalog refresh error: {e}")
+
+        self._watch_thread = threading.Thread(
+            target=watch_loop,
+            name="model-catalog-watcher",
+            daemon=True
+        )
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        """Stop the background polling thread"""
+        self._running = False
+
+    def _candidates(self) -> List[Tuple[str, str]]:
+        candidates = []
+        for scan_dir in self.scan_dirs:
+            if not os.path.isdir(scan_dir):
+                continue
+            try:
+                names = sorted(os.listdir(scan_dir))
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(scan_dir, name)
+                if os.path.isdir(path):
+                    candidates.append((name, path))
+        candidates.extend(self.model_dirs)
+        return candidates
+
+    def _signature(self, path: str) -> Optional[Signature]:
+        """Stat-based fingerprint of a model directory, or None if it is gone"""
+        try:
+            dir_stat = os.stat(path)
+        except OSError:
+            return None
+
+        signature = [dir_stat.st_mtime_ns]
+        for filename in self.watched_files:
+            try:
+                file_stat = os.stat(os.path.join(path, filename))
+                signature.append((filename, file_stat.st_mtime_ns, file_stat.st_size))
+            except OSError:
+                signature.append((filename, None, None))
+        return tuple(signature)
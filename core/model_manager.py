@@ -5,12 +5,31 @@ import gc
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from unsloth import FastLanguageModel
-from transformers import TextStreamer, TextIteratorStreamer
+from transformers import TextStreamer, TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 import gc
 from threading import Thread
 from vllm import SamplingParams
 from vllm import LLM
 
+from generation_worker import GenerationWorker
+from prompt_compiler import PromptCompiler, PromptTooLongError
+from model_catalog import ModelCatalog
+from speculative_decoding import SpeculativeConfig, SpeculativeRun
+from structured_decoding import JSONSchemaDecoder, VocabularyIndex, is_structured_schema
+
+REQUIRED_ADAPTER_FILES = ["adapter_config.json", "adapter_model.safetensors"]
+
+
+class _StopEventCriteria(StoppingCriteria):
+    """Stop generate() as soon as a caller sets the event (e.g. the job was cancelled)"""
+    
+    def __init__(self, stop_event):
+        self.stop_event = stop_event
+    
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.stop_event.is_set()
+
+
 class ModelManager:
     """Manages loading, unloading, and inference with fine-tuned models"""
     
@@ -20,46 +39,50 @@ class ModelManager:
         self.current_model_path = None
         self.model_metadata = {}
         self.is_huggingface_model = False
+        self.max_seq_length = 2048
+        self.prompt_compiler: Optional[PromptCompiler] = None
+        # Token index for schema-constrained decoding, built on first use per model
+        self.vocabulary_index: Optional[VocabularyIndex] = None
+        
+        # Speculative decoding (prompt lookup or a small draft model)
+        self.speculative_config = SpeculativeConfig()
+        self.draft_model = None
+        self.draft_model_path = None
+        # Running average of non-speculative ms/token, used to report speedup
+        self.baseline_ms_per_token: Optional[float] = None
+        
+        # Single background worker that batches concurrent streaming requests
+        self.generation_worker = GenerationWorker(self)
+        
+        # Trained models under ./results (and ./lora_model), kept in memory
+        self.model_catalog = ModelCatalog(
+            build_entry=self._build_catalog_entry,
+            scan_dirs=["./results"],
+            model_dirs=[("lora_model", "./lora_model")],
+            watched_files=REQUIRED_ADAPTER_FILES
+        )
         
     def get_available_models(self) -> List[Dict[str, Any]]:
-        """Scan for available trained models"""
-        models = []
-        
-        # Check default results directory
-        results_dir = "./results"
-        if os.path.exists(results_dir):
-            for item in os.listdir(results_dir):
-                model_path = os.path.join(results_dir, item)
-                if os.path.isdir(model_path):
-                    # Check if it's a valid model directory
-                    if self._is_valid_model_dir(model_path):
-                        metadata = self._get_model_metadata(model_path)
-                        models.append({
-                            "name": item,
-                            "path": model_path,
-                            "size_mb": self._get_directory_size(model_path),
-                            "created_at": metadata.get("created_at"),
-                            "training_config": metadata.get("config", {})
-                        })
-        
-        # Check for lora_model directory (common output)
-        lora_model_path = "./lora_model"
-        if os.path.exists(lora_model_path) and self._is_valid_model_dir(lora_model_path):
-            metadata = self._get_model_metadata(lora_model_path)
-            models.append({
-                "name": "lora_model",
-                "path": lora_model_path,
-                "size_mb": self._get_directory_size(lora_model_path),
-                "created_at": metadata.get("created_at"),
-                "training_config": metadata.get("config", {})
-            })
-            
-        return models
+        """List available trained models from the in-memory catalog"""
+        return self.model_catalog.list_models()
+    
+    def _build_catalog_entry(self, name: str, model_path: str) -> Optional[Dict[str, Any]]:
+        """Build the catalog entry for a model directory (None if it is not a valid model)"""
+        if not self._is_valid_model_dir(model_path):
+            return None
+        
+        metadata = self._get_model_metadata(model_path)
+        return {
+            "name": name,
+            "path": model_path,
+            "size_mb": self._get_directory_size(model_path),
+            "created_at": metadata.get("created_at"),
+            "training_config": metadata.get("config", {})
+        }
     
     def _is_valid_model_dir(self, path: str) -> bool:
         """Check if directory contains a valid model"""
-        required_files = ["adapter_config.json", "adapter_model.safetensors"]
-        return all(os.path.exists(os.path.join(path, f)) for f in required_files)
+        return all(os.path.exists(os.path.join(path, f)) for f in REQUIRED_ADAPTER_FILES)
     
     def _get_model_metadata(self, model_path: str) -> Dict[str, Any]:
         """Extract metadata from model directory"""
@@ -140,6 +163,10 @@ class ModelManager:
             self.current_tokenizer = tokenizer
             self.current_model_path = model_path
             self.is_huggingface_model = is_hf_model
+            self.max_seq_length = max_seq_length
+            self.prompt_compiler = PromptCompiler(tokenizer, max_seq_length=max_seq_length)
+            self.baseline_ms_per_token = None
+            self.vocabulary_index = None
             
             # Set metadata based on model type
             if is_hf_model:
@@ -177,6 +204,9 @@ class ModelManager:
                 self.current_model_path = None
                 self.model_metadata = {}
                 self.is_huggingface_model = False
+                self.prompt_compiler = None
+                self.baseline_ms_per_token = None
+                self.vocabulary_index = None
                 
                 # Force garbage collection
                 gc.collect()
@@ -225,12 +255,193 @@ class ModelManager:
         except StopIteration:
             return torch.device("cpu")
     
+    def count_prompt_tokens(self,
+                            message: str,
+                            max_tokens: int = 150,
+                            system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """Exact token accounting for a message against the loaded model's context"""
+        if self.prompt_compiler is None:
+            return {
+                "status": "error",
+                "message": "No model currently loaded. Please load a model first."
+            }
+        
+        return {
+            "status": "success",
+            "model_path": self.current_model_path,
+            **self.prompt_compiler.count_tokens(message, system_prompt, max_tokens)
+        }
+    
+    def configure_speculative_decoding(self,
+                                       method: str = "none",
+                                       num_draft_tokens: int = 10,
+                                       max_ngram_size: int = 2,
+                                       draft_model_path: Optional[str] = None) -> Dict[str, Any]:
+        """Enable or disable speculative decoding for local generation
+        
+        ``prompt_lookup`` drafts tokens from n-gram matches in the prompt;
+        ``draft_model`` loads a small model that shares the main model's
+        tokenizer and lets it propose tokens for the main model to verify.
+        """
+        try:
+            config = SpeculativeConfig(
+                method=method,
+                num_draft_tokens=num_draft_tokens,
+                max_ngram_size=max_ngram_size,
+                draft_model_path=draft_model_path if method == "draft_model" else None
+            )
+            config.validate()
+            
+            if config.method == "draft_model":
+                self._load_draft_model(config.draft_model_path)
+            else:
+                self._unload_draft_model()
+            
+            self.speculative_config = config
+            return {
+                "status": "success",
+                "message": f"Speculative decoding set to '{config.method}'",
+                "config": config.to_dict()
+            }
+            
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Failed to configure speculative decoding: {str(e)}",
+                "config": self.speculative_config.to_dict()
+            }
+    
+    def get_speculative_status(self) -> Dict[str, Any]:
+        """Current speculative decoding settings"""
+        return {
+            "config": self.speculative_config.to_dict(),
+            "draft_model_loaded": self.draft_model is not None,
+            "draft_model_path": self.draft_model_path,
+            "baseline_ms_per_token": (
+                round(self.baseline_ms_per_token, 3) if self.baseline_ms_per_token else None
+            )
+        }
+    
+    def _load_draft_model(self, draft_model_path: str):
+        """Load the draft model used for assisted generation"""
+        if self.draft_model is not None and self.draft_model_path == draft_model_path:
+            return
+        
+        self._unload_draft_model()
+        print(f"Loading draft model: {draft_model_path}")
+        
+        draft_model, draft_tokenizer = FastLanguageModel.from_pretrained(
+            model_name=draft_model_path,
+            max_seq_length=self.max_seq_length,
+            dtype=None,
+            load_in_4bit=True,
+        )
+        FastLanguageModel.for_inference(draft_model)
+        
+        # Drafted ids are verified by the main model as-is, so vocabularies must match
+        if self.current_tokenizer is not None and len(draft_tokenizer) != len(self.current_tokenizer):
+            del draft_model
+            raise ValueError(
+                f"Draft model vocabulary ({len(draft_tokenizer)}) does not match "
+                f"the loaded model ({len(self.current_tokenizer)})"
+            )
+        
+        self.draft_model = draft_model
+        self.draft_model_path = draft_model_path
+    
+    def _unload_draft_model(self):
+        if self.draft_model is None:
+            return
+        del self.draft_model
+        self.draft_model = None
+        self.draft_model_path = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    
+    def _generate_from_ids(self,
+                           input_ids: List[int],
+                           max_tokens: int,
+                           temperature: float,
+                           do_sample: bool):
+        """Run generate() on pre-tokenized prompt ids
+        
+        Returns the output ids and, when speculative decoding is enabled,
+        the acceptance/speedup stats for this request.
+        """
+        model_device = self._get_model_device()
+        input_tensor = torch.tensor([input_ids], dtype=torch.long, device=model_device)
+        speculative_kwargs = self.speculative_config.generate_kwargs(self.draft_model)
+        
+        run = SpeculativeRun(self.speculative_config, self.current_model, len(input_ids))
+        with torch.no_grad(), run:
+            outputs = self.current_model.generate(
+                input_ids=input_tensor,
+                attention_mask=torch.ones_like(input_tensor),
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                do_sample=do_sample,
+                pad_token_id=self.current_tokenizer.eos_token_id,
+                eos_token_id=self.current_tokenizer.eos_token_id,
+                **speculative_kwargs
+            )
+        
+        output_ids = outputs[0]
+        generated_tokens = len(output_ids) - len(input_ids)
+        
+        if not speculative_kwargs:
+            self._record_baseline(run.elapsed, generated_tokens)
+            return output_ids, None
+        
+        return output_ids, run.stats(generated_tokens, self.baseline_ms_per_token)
+    
+    def _record_baseline(self, elapsed: float, generated_tokens: int, alpha: float = 0.2):
+        """Update the running non-speculative ms/token average"""
+        if generated_tokens <= 0:
+            return
+        ms_per_token = elapsed * 1000 / generated_tokens
+        if self.baseline_ms_per_token is None:
+            self.baseline_ms_per_token = ms_per_token
+        else:
+            self.baseline_ms_per_token += alpha * (ms_per_token - self.baseline_ms_per_token)
+    
+    def _generate_structured_from_ids(self,
+                                      input_ids: List[int],
+                                      output_schema: Dict[str, Any],
+                                      max_tokens: int,
+                                      temperature: float,
+                                      do_sample: bool):
+        """Decode a JSON object that follows ``output_schema`` from pre-tokenized prompt ids"""
+        if self.vocabulary_index is None:
+            self.vocabulary_index = VocabularyIndex(self.current_tokenizer)
+        
+        decoder = JSONSchemaDecoder(self.current_model, self.current_tokenizer, self.vocabulary_index)
+        return decoder.generate(
+            input_ids,
+            output_schema,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            do_sample=do_sample
+        )
+    
     def generate_response(self, 
                          message: str, 
                          max_tokens: int = 150, 
                          temperature: float = 0.7,
-                         do_sample: bool = True) -> Dict[str, Any]:
-        """Generate a response using the loaded model"""
+                         do_sample: bool = True,
+                         system_prompt: Optional[str] = None,
+                         overflow: str = "reject",
+                         output_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Generate a response using the loaded model
+        
+        Prompts that do not fit the model context together with ``max_tokens``
+        are rejected up front (``overflow="reject"``) or split on token
+        boundaries and answered chunk by chunk (``overflow="chunk"``).
+        
+        With a structured ``output_schema`` (field name -> "string" / "number" /
+        "boolean") the response is decoded under that schema and is always
+        valid JSON; generation stops as soon as the object closes.
+        """
         
         if self.current_model is None or self.current_tokenizer is None:
             return {
@@ -241,49 +452,59 @@ class ModelManager:
         
         try:
             # Format the prompt
-            prompt = f"### Instruction:\n{message}\n\n### Response:\n"
+            instruction = f"{system_prompt}\n\n{message}" if system_prompt else message
+            prompt = f"### Instruction:\n{instruction}\n\n### Response:\n"
             
-            # Tokenize
-            inputs = self.current_tokenizer(
-                prompt, 
-                return_tensors="pt",
-                truncation=True,
-                max_length=2048
-            )
+            # Tokenize the full prompt, rejecting or chunking it if it would not fit
+            if overflow == "chunk":
+                compiled_prompts = self.prompt_compiler.compile_chunks(message, system_prompt, max_tokens)
+            else:
+                compiled_prompts = [self.prompt_compiler.compile_checked(message, system_prompt, max_tokens)]
             
-            # Get model device and move inputs to the same device
-            model_device = self._get_model_device()
-            inputs = {key: value.to(model_device) for key, value in inputs.items()}
-            
-            # Generate response
-            with torch.no_grad():
-                outputs = self.current_model.generate(
-                    **inputs,
-                    max_new_tokens=max_tokens,
-                    temperature=temperature,
-                    do_sample=do_sample,
-                    pad_token_id=self.current_tokenizer.eos_token_id,
-                    eos_token_id=self.current_tokenizer.eos_token_id,
+            if is_structured_schema(output_schema):
+                return self._generate_structured_response(
+                    compiled_prompts, output_schema, prompt, max_tokens, temperature, do_sample
                 )
             
-            # Decode response
-            full_response = self.current_tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Extract only the generated part (after "### Response:")
-            response_start = full_response.find("### Response:")
-            if response_start != -1:
-                response = full_response[response_start + len("### Response:"):].strip()
-            else:
-                response = full_response.strip()
+            responses = []
+            full_outputs = []
+            speculative_stats = []
+            for compiled in compiled_prompts:
+                output_ids, stats = self._generate_from_ids(compiled.input_ids, max_tokens, temperature, do_sample)
+                if stats is not None:
+                    speculative_stats.append(stats)
+                
+                # Decode only the generated part (after "### Response:")
+                responses.append(self.current_tokenizer.decode(
+                    output_ids[compiled.prompt_tokens:], skip_special_tokens=True
+                ).strip())
+                full_outputs.append(self.current_tokenizer.decode(output_ids, skip_special_tokens=True))
             
-            return {
+            result = {
                 "status": "success",
                 "message": "Response generated successfully",
-                "response": response,
+                "response": "\n".join(responses),
                 "prompt": prompt,
-                "full_output": full_response
+                "full_output": "\n".join(full_outputs),
+                "prompt_tokens": sum(compiled.prompt_tokens for compiled in compiled_prompts)
             }
+            if len(compiled_prompts) > 1:
+                result["chunk_responses"] = responses
+            if speculative_stats:
+                result["speculative"] = (
+                    speculative_stats[0] if len(speculative_stats) == 1
+                    else self._merge_speculative_stats(speculative_stats)
+                )
+            return result
             
+        except PromptTooLongError as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "response": "",
+                "prompt_tokens": e.prompt_tokens,
+                "max_seq_length": e.max_seq_length
+            }
         except Exception as e:
             return {
                 "status": "error",
@@ -291,6 +512,194 @@ class ModelManager:
                 "response": ""
             }
     
+    def generate_batch(self,
+                       messages: List[str],
+                       max_tokens: int = 150,
+                       temperature: float = 0.7,
+                       do_sample: bool = True,
+                       system_prompt: Optional[str] = None,
+                       output_schema: Optional[Dict[str, Any]] = None,
+                       stop_event=None) -> List[Dict[str, Any]]:
+        """Generate responses for many messages with one batched generate() call
+        
+        Returns one result dict per message, in order. A message that cannot
+        be compiled (e.g. too long) gets an error result without failing the
+        rest of the batch. Structured schemas are decoded one row at a time
+        since constrained decoding steps a single sequence.
+        
+        Setting ``stop_event`` (a threading.Event) ends generation at the next
+        token so the GPU is released right away; outputs are then partial.
+        """
+        if self.current_model is None or self.current_tokenizer is None:
+            return [{
+                "status": "error",
+                "message": "No model currently loaded. Please load a model first.",
+                "response": ""
+            } for _ in messages]
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        compiled_rows = []
+        for index, message in enumerate(messages):
+            try:
+                compiled_rows.append((index, self.prompt_compiler.compile_checked(message, system_prompt, max_tokens)))
+            except PromptTooLongError as e:
+                results[index] = {
+                    "status": "error",
+                    "message": str(e),
+                    "response": "",
+                    "prompt_tokens": e.prompt_tokens,
+                    "max_seq_length": e.max_seq_length
+                }
+        
+        if is_structured_schema(output_schema):
+            for index, compiled in compiled_rows:
+                if stop_event is not None and stop_event.is_set():
+                    results[index] = {
+                        "status": "error",
+                        "message": "Generation stopped",
+                        "response": ""
+                    }
+                    continue
+                try:
+                    structured = self._generate_structured_from_ids(
+                        compiled.input_ids, output_schema, max_tokens, temperature, do_sample
+                    )
+                    results[index] = {
+                        "status": "success",
+                        "message": "Response generated successfully",
+                        "response": structured.text,
+                        "prompt_tokens": compiled.prompt_tokens,
+                        "generated_tokens": structured.generated_tokens,
+                        "structured": True,
+                        "parsed_output": structured.values
+                    }
+                except Exception as e:
+                    results[index] = {
+                        "status": "error",
+                        "message": f"Error generating response: {str(e)}",
+                        "response": ""
+                    }
+            return results
+        
+        if compiled_rows:
+            try:
+                # Decoder-only models need left padding so every row ends at its prompt
+                pad_token_id = self.current_tokenizer.pad_token_id
+                if pad_token_id is None:
+                    pad_token_id = self.current_tokenizer.eos_token_id
+                width = max(compiled.prompt_tokens for _, compiled in compiled_rows)
+                
+                model_device = self._get_model_device()
+                input_tensor = torch.tensor(
+                    [[pad_token_id] * (width - compiled.prompt_tokens) + compiled.input_ids for _, compiled in compiled_rows],
+                    dtype=torch.long,
+                    device=model_device
+                )
+                attention_mask = torch.tensor(
+                    [[0] * (width - compiled.prompt_tokens) + [1] * compiled.prompt_tokens for _, compiled in compiled_rows],
+                    dtype=torch.long,
+                    device=model_device
+                )
+                
+                with torch.no_grad():
+                    outputs = self.current_model.generate(
+                        input_ids=input_tensor,
+                        attention_mask=attention_mask,
+                        max_new_tokens=max_tokens,
+                        temperature=temperature,
+                        do_sample=do_sample,
+                        pad_token_id=self.current_tokenizer.eos_token_id,
+                        eos_token_id=self.current_tokenizer.eos_token_id,
+                        stopping_criteria=(
+                            StoppingCriteriaList([_StopEventCriteria(stop_event)]) if stop_event is not None else None
+                        ),
+                    )
+                
+                responses = self.current_tokenizer.batch_decode(outputs[:, width:], skip_special_tokens=True)
+                for (index, compiled), response in zip(compiled_rows, responses):
+                    results[index] = {
+                        "status": "success",
+                        "message": "Response generated successfully",
+                        "response": response.strip(),
+                        "prompt_tokens": compiled.prompt_tokens
+                    }
+                    
+            except Exception as e:
+                for index, _ in compiled_rows:
+                    results[index] = {
+                        "status": "error",
+                        "message": f"Error generating response: {str(e)}",
+                        "response": ""
+                    }
+        
+        return results
+    
+    def _generate_structured_response(self,
+                                      compiled_prompts,
+                                      output_schema: Dict[str, Any],
+                                      prompt: str,
+                                      max_tokens: int,
+                                      temperature: float,
+                                      do_sample: bool) -> Dict[str, Any]:
+        """Schema-constrained counterpart of the generate_response loop"""
+        parsed_outputs = []
+        generated_tokens = 0
+        truncated_fields = []
+        for compiled in compiled_prompts:
+            structured = self._generate_structured_from_ids(
+                compiled.input_ids, output_schema, max_tokens, temperature, do_sample
+            )
+            parsed_outputs.append(structured.values)
+            generated_tokens += structured.generated_tokens
+            truncated_fields.extend(f for f in structured.truncated_fields if f not in truncated_fields)
+        
+        # Chunks of one document: keep the first non-empty value found for each field
+        parsed_output = dict(parsed_outputs[0])
+        for values in parsed_outputs[1:]:
+            for field, value in values.items():
+                if parsed_output.get(field) in (None, ""):
+                    parsed_output[field] = value
+        
+        response = json.dumps(parsed_output, ensure_ascii=False)
+        result = {
+            "status": "success",
+            "message": "Response generated successfully",
+            "response": response,
+            "prompt": prompt,
+            "full_output": prompt + response,
+            "prompt_tokens": sum(compiled.prompt_tokens for compiled in compiled_prompts),
+            "generated_tokens": generated_tokens,
+            "structured": True,
+            "parsed_output": parsed_output,
+            "truncated_fields": truncated_fields
+        }
+        if len(compiled_prompts) > 1:
+            result["chunk_responses"] = [json.dumps(values, ensure_ascii=False) for values in parsed_outputs]
+        return result
+    
+    @staticmethod
+    def _merge_speculative_stats(stats_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine the per-chunk stats of a chunked request"""
+        generated = sum(s["generated_tokens"] for s in stats_list)
+        passes = sum(s["target_forward_passes"] for s in stats_list)
+        proposed = sum(s["draft_tokens_proposed"] for s in stats_list)
+        accepted = sum(s["draft_tokens_accepted"] for s in stats_list)
+        elapsed_ms = sum(s["generation_time_ms"] for s in stats_list)
+        speedups = [s["speedup"] for s in stats_list if s["speedup"]]
+        
+        return {
+            "method": stats_list[0]["method"],
+            "generated_tokens": generated,
+            "target_forward_passes": passes,
+            "draft_tokens_proposed": proposed,
+            "draft_tokens_accepted": accepted,
+            "acceptance_rate": round(accepted / proposed, 4) if proposed else None,
+            "tokens_per_forward_pass": round(generated / passes, 3) if passes else None,
+            "generation_time_ms": round(elapsed_ms, 2),
+            "ms_per_token": round(elapsed_ms / generated, 3) if generated else None,
+            "speedup": round(sum(speedups) / len(speedups), 3) if speedups else None,
+        }
+    
     def generate_response_stream(self, 
                                message: str, 
                                max_tokens: int = 150, 
@@ -308,20 +717,12 @@ class ModelManager:
             return
         
         try:
-            # Format the prompt
-            prompt = f"### Instruction:\n{message}\n\n### Response:\n"
-            
-            # Tokenize
-            inputs = self.current_tokenizer(
-                prompt, 
-                return_tensors="pt",
-                truncation=True,
-                max_length=2048
-            )
+            # Tokenize, rejecting prompts that would not fit the context
+            compiled = self.prompt_compiler.compile_checked(message, max_new_tokens=max_tokens)
             
             # Get model device and move inputs to the same device
             model_device = self._get_model_device()
-            inputs = {key: value.to(model_device) for key, value in inputs.items()}
+            input_tensor = torch.tensor([compiled.input_ids], dtype=torch.long, device=model_device)
             
             # Create streamer
             streamer = TextIteratorStreamer(
@@ -333,7 +734,8 @@ class ModelManager:
             
             # Generation parameters
             generation_kwargs = {
-                **inputs,
+                "input_ids": input_tensor,
+                "attention_mask": torch.ones_like(input_tensor),
                 "max_new_tokens": max_tokens,
                 "temperature": temperature,
                 "do_sample": do_sample,
@@ -366,6 +768,13 @@ class ModelManager:
                 "done": True
             })
             
+        except PromptTooLongError as e:
+            yield json.dumps({
+                "status": "error",
+                "message": str(e),
+                "token": "",
+                "done": True
+            })
         except Exception as e:
             yield json.dumps({
                 "status": "error",
@@ -430,29 +839,57 @@ class ModelManager:
                                     max_tokens: int = 150, 
                                     temperature: float = 0.7,
                                     do_sample: bool = True,
-                                    system_prompt: Optional[str] = None) -> Dict[str, Any]:
+                                    system_prompt: Optional[str] = None,
+                                    output_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Async wrapper for generate_response"""
         import asyncio
+        from functools import partial
         
         # Run the synchronous method in a thread pool
         loop = asyncio.get_event_loop()
         
-        # If system prompt is provided, prepend it to the message
-        if system_prompt:
-            formatted_message = f"{system_prompt}\n\n{message}"
-        else:
-            formatted_message = message
-        
+        # The system prompt is passed separately so its tokens are cached
         result = await loop.run_in_executor(
             None, 
-            self.generate_response, 
-            formatted_message, 
-            max_tokens, 
-            temperature, 
-            do_sample
+            partial(
+                self.generate_response,
+                message,
+                max_tokens,
+                temperature,
+                do_sample,
+                system_prompt=system_prompt or None,
+                output_schema=output_schema
+            )
         )
         return result
 
+    async def generate_batch_async(self,
+                                   messages: List[str],
+                                   max_tokens: int = 150,
+                                   temperature: float = 0.7,
+                                   do_sample: bool = True,
+                                   system_prompt: Optional[str] = None,
+                                   output_schema: Optional[Dict[str, Any]] = None,
+                                   stop_event=None) -> List[Dict[str, Any]]:
+        """Async wrapper for generate_batch; the batch runs on a worker thread"""
+        import asyncio
+        from functools import partial
+        
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            partial(
+                self.generate_batch,
+                messages,
+                max_tokens,
+                temperature,
+                do_sample,
+                system_prompt=system_prompt,
+                output_schema=output_schema,
+                stop_event=stop_event
+            )
+        )
+
     async def generate_streaming_response(self, 
                                         message: str, 
                                         max_tokens: int = 150, 
@@ -460,8 +897,6 @@ class ModelManager:
                                         do_sample: bool = True,
                                         system_prompt: Optional[str] = None):
         """Async generator for streaming responses"""
-        import asyncio
-        
         if self.current_model is None or self.current_tokenizer is None:
             yield {
                 "status": "error",
@@ -472,63 +907,29 @@ class ModelManager:
             return
         
         try:
-            # If system prompt is provided, prepend it to the message
-            if system_prompt:
-                formatted_message = f"{system_prompt}\n\n{message}"
-            else:
-                formatted_message = message
-            
-            # Format the prompt
-            prompt = f"### Instruction:\n{formatted_message}\n\n### Response:\n"
-            
-            # Tokenize
-            inputs = self.current_tokenizer(
-                prompt, 
-                return_tensors="pt",
-                truncation=True,
-                max_length=2048
-            )
-            
-            # Get model device and move inputs to the same device
-            model_device = self._get_model_device()
-            inputs = {key: value.to(model_device) for key, value in inputs.items()}
-            
-            # Create streamer
-            streamer = TextIteratorStreamer(
-                self.current_tokenizer, 
-                timeout=10.0, 
-                skip_prompt=True, 
-                skip_special_tokens=True
+            # Tokenize and check the length before anything is queued
+            compiled = self.prompt_compiler.compile_checked(
+                message,
+                system_prompt=system_prompt,
+                max_new_tokens=max_tokens
             )
             
-            # Generation parameters
-            generation_kwargs = {
-                **inputs,
-                "max_new_tokens": max_tokens,
-                "temperature": temperature,
-                "do_sample": do_sample,
-                "pad_token_id": self.current_tokenizer.eos_token_id,
-                "eos_token_id": self.current_tokenizer.eos_token_id,
-                "streamer": streamer
-            }
-            
-            # Start generation in a separate thread
-            thread = Thread(target=self.current_model.generate, kwargs=generation_kwargs)
-            thread.start()
-            
-            # Stream tokens as they are generated
+            # Tokens come back from the shared generation worker, batched with
+            # any other concurrent streams, without blocking the event loop
             generated_text = ""
-            for new_text in streamer:
-                if new_text:
-                    generated_text += new_text
-                    yield {
-                        "status": "streaming",
-                        "token": new_text,
-                        "generated_text": generated_text,
-                        "done": False
-                    }
-                    # Small delay to prevent overwhelming the client
-                    await asyncio.sleep(0.01)
+            async for new_text in self.generation_worker.stream(
+                compiled.input_ids,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                do_sample=do_sample
+            ):
+                generated_text += new_text
+                yield {
+                    "status": "streaming",
+                    "token": new_text,
+                    "generated_text": generated_text,
+                    "done": False
+                }
             
             # Signal completion
             yield {
@@ -2,6 +2,7 @@
 Dataset management models for processed training datasets.
 """
 
+from enum import Enum
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 from datetime import datetime
@@ -20,6 +21,13 @@ class ProcessingStats(BaseModel):
     column_usage: Dict[str, int] = Field(..., description="Column usage statistics")
 
 
+class DatasetSegment(BaseModel):
+    """A block of examples (JSONL) stored once by content and shared between dataset versions"""
+    sha256: str = Field(..., description="SHA-256 of the block's content")
+    rows: int = Field(..., description="Examples in the block (or kept by the manifest)")
+    manifest: Optional[str] = Field(default=None, description="SHA-256 of the byte offsets of the block's lines this segment keeps (None: every line)")
+
+
 class ProcessedDataset(BaseModel):
     """A processed dataset ready for training"""
     dataset_id: str = Field(..., description="Unique dataset identifier")
@@ -35,11 +43,24 @@ class ProcessedDataset(BaseModel):
     
     # Dataset statistics
     total_examples: int = Field(..., description="Total training examples")
-    processing_stats: ProcessingStats = Field(..., description="Processing statistics")
+    processing_stats: Optional[ProcessingStats] = Field(default=None, description="Processing statistics (set once the build completes)")
+    
+    # Build status (datasets are materialized in the background)
+    status: str = Field(default="ready", description="Build status (processing, ready, failed)")
+    progress: float = Field(default=100.0, description="Build progress percentage")
+    rows_processed: int = Field(default=0, description="Source rows mapped so far")
+    error: Optional[str] = Field(default=None, description="Build error, if the build failed")
     
     # Storage information
     file_path: str = Field(..., description="Path to stored dataset file")
     file_size: int = Field(..., description="Dataset file size in bytes")
+    segments: List[DatasetSegment] = Field(default=[], description="Stored blocks holding the examples, in order")
+    
+    # Versioning (a dataset's examples never change; edits create a new version)
+    version: int = Field(default=1, description="Version number within the dataset's lineage")
+    parent_id: Optional[str] = Field(default=None, description="Dataset this one was duplicated or derived from")
+    root_id: Optional[str] = Field(default=None, description="First version of the lineage (None: this dataset)")
+    derivation: Optional[Dict[str, Any]] = Field(default=None, description="How this version was derived from its parent")
     
     # Metadata
     created_at: str = Field(..., description="Creation timestamp")
@@ -61,6 +82,35 @@ class DatasetCreateRequest(BaseModel):
     tags: Optional[List[str]] = Field(default=[], description="Dataset tags")
 
 
+class FilterOperator(str, Enum):
+    """Comparison a dataset filter applies to an example field"""
+    CONTAINS = "contains"
+    NOT_CONTAINS = "not_contains"
+    EQUALS = "equals"
+    NOT_EQUALS = "not_equals"
+    MATCHES = "matches"
+    MIN_LENGTH = "min_length"
+    MAX_LENGTH = "max_length"
+
+
+class DatasetFilter(BaseModel):
+    """Condition on one field of an example (input and output objects are compared as JSON text)"""
+    field: str = Field(..., regex="^(instruction|input|output)$", description="Example field: instruction, input or output")
+    operator: FilterOperator = Field(..., description="Comparison to apply")
+    value: str = Field(..., description="Text to compare with, a regular expression (matches) or a length")
+
+
+class DatasetVersionRequest(BaseModel):
+    """Request to derive a new version of a dataset"""
+    name: Optional[str] = Field(default=None, description="Version name (defaults to the parent's name and version number)")
+    description: Optional[str] = Field(default=None, description="Version description")
+    filters: List[DatasetFilter] = Field(default=[], description="Keep only the examples matching all of these")
+    sample_size: Optional[int] = Field(default=None, ge=1, description="Keep a random sample of this many examples (after filtering)")
+    seed: int = Field(default=42, description="Random seed for sampling")
+    append_examples: List[TrainingExample] = Field(default=[], description="Examples to add after the parent's")
+    tags: Optional[List[str]] = Field(default=None, description="Version tags (defaults to the parent's)")
+
+
 class DatasetUpdateRequest(BaseModel):
     """Request to update dataset metadata"""
     name: Optional[str] = Field(default=None, description="New dataset name")
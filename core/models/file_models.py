@@ -72,6 +72,10 @@ class ValidationDetails(BaseModel):
     null_counts: Dict[str, int] = Field(default={}, description="Null value counts per column")
     issues: List[str] = Field(default=[], description="List of validation issues")
     
+    # Validation parses a sample; a background pass fills in full-file counts
+    stats_status: Optional[str] = Field(default=None, description="Full-scan statistics status (pending, running, complete, failed)")
+    rows_scanned: Optional[int] = Field(default=None, description="Rows counted so far by the statistics pass")
+    
     # Column information (no AI suggestions)
     column_types: Optional[Dict[str, str]] = Field(default={}, description="Detected data types for each column")
     column_stats: Optional[Dict[str, Dict[str, Any]]] = Field(default={}, description="Statistics for each column")
@@ -110,11 +114,37 @@ class FileUploadResponse(BaseModel):
     metadata: Optional[FileMetadata] = Field(default=None, description="File metadata if successful")
 
 
+class UploadSessionRequest(BaseModel):
+    """Request to start a resumable chunked upload"""
+    original_filename: str = Field(..., description="Original filename (its extension selects the parser)")
+    display_name: Optional[str] = Field(default=None, description="User-friendly display name")
+    total_size: Optional[int] = Field(default=None, ge=0, description="Expected file size in bytes")
+
+
+class UploadCompleteRequest(BaseModel):
+    """Request to finish a chunked upload"""
+    sha256: Optional[str] = Field(default=None, description="Expected SHA-256 (hex) of the whole file")
+
+
+class UploadSessionResponse(BaseModel):
+    """State of a chunked upload session"""
+    upload_id: str = Field(..., description="Upload session identifier")
+    original_filename: str = Field(..., description="Original filename")
+    display_name: Optional[str] = Field(default=None, description="User-friendly display name")
+    total_size: Optional[int] = Field(default=None, description="Expected file size in bytes")
+    received_bytes: int = Field(..., description="Bytes stored so far; the next chunk starts here")
+    created_at: str = Field(..., description="Session creation timestamp")
+    updated_at: str = Field(..., description="Timestamp of the last stored chunk")
+
+
 class FileListResponse(BaseModel):
     """Response for file listing operations"""
     files: List[FileMetadata] = Field(..., description="List of files")
     total: int = Field(..., description="Total number of files")
     storage_stats: Dict[str, Any] = Field(..., description="Storage statistics")
+    page: int = Field(1, description="Page number")
+    page_size: Optional[int] = Field(None, description="Files per page (all files if not set)")
+    has_more: bool = Field(False, description="Whether more pages follow")
 
 
 class FilePreviewResponse(BaseModel):
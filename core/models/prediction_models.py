@@ -14,6 +14,7 @@ class PredictionStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
     CANCELLED = "cancelled"
+    PAUSED = "paused"
 
 
 class ModelStatus(str, Enum):
@@ -54,6 +55,8 @@ class ModelInfo(BaseModel):
     model_path: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
     base_model: str
+    # Decode predictions under output_schema (only flat schemas; see structured_decoding)
+    constrained_decoding: bool = False
 
 
 class PredictionResult(BaseModel):
@@ -64,6 +67,27 @@ class PredictionResult(BaseModel):
     processing_time_ms: Optional[float] = Field(default=None, ge=0.0)
     model_version: Optional[str] = None
     error_message: Optional[str] = None
+    # Set when the row's mapped inputs repeat an earlier row and its prediction was reused
+    deduplicated: bool = False
+    duplicate_of: Optional[int] = None
+
+
+class PredictionJobStats(BaseModel):
+    """Aggregates over a job's results, computed once when the job completes"""
+    result_count: int = Field(default=0, ge=0)
+    error_count: int = Field(default=0, ge=0)
+    confidence_count: int = Field(default=0, ge=0)
+    confidence_sum: float = 0.0
+    confidence_min: Optional[float] = None
+    confidence_max: Optional[float] = None
+    processing_time_count: int = Field(default=0, ge=0)
+    processing_time_sum: float = 0.0
+    processing_time_min: Optional[float] = None
+    processing_time_max: Optional[float] = None
+    latency_histogram: Dict[str, int] = Field(default_factory=dict)
+    deduplicated_count: int = Field(default=0, ge=0)
+    # Share of rows answered without a model call of their own
+    dedup_ratio: Optional[float] = Field(default=None, ge=0.0, le=1.0)
 
 
 class PredictionJob(BaseModel):
@@ -84,6 +108,9 @@ class PredictionJob(BaseModel):
     description: Optional[str] = None
     mapping: PredictionMapping
     created_by: Optional[str] = None
+    stats: Optional[PredictionJobStats] = None
+    # Index of the next row to process; a resumed job continues from here
+    checkpoint_row: int = Field(default=0, ge=0)
 
 
 class StartPredictionRequest(BaseModel):
@@ -175,6 +202,18 @@ class CancelJobResponse(BaseModel):
     job_id: str
 
 
+class PauseJobResponse(BaseModel):
+    success: bool
+    message: str
+    job_id: str
+
+
+class ResumeJobResponse(BaseModel):
+    success: bool
+    message: str
+    job_id: str
+
+
 class DeleteJobResponse(BaseModel):
     success: bool
     message: str
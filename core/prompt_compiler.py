@@ -0,0 +1,214 @@
+"""
+Per-model prompt compiler with length prechecks.
+
+The instruction template used for inference is made of static pieces
+(template markers, system prompts) and a dynamic message. The full prompt
+text is tokenized in one call, so the ids are exactly what the tokenizer
+produces for the text the model was trained on, including tokens that merge
+across the template/message boundary. Token counts are exact for the ids
+that are actually fed to the model, so over-length prompts can be rejected
+or chunked before any generation starts instead of being silently
+truncated. Chunk boundaries come from the token offsets of that single
+tokenization.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+INSTRUCTION_PREFIX = "### Instruction:\n"
+RESPONSE_SUFFIX = "\n\n### Response:\n"
+
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt plus its generation budget does not fit the model context"""
+
+    def __init__(self, prompt_tokens: int, max_new_tokens: int, max_seq_length: int):
+        self.prompt_tokens = prompt_tokens
+        self.max_new_tokens = max_new_tokens
+        self.max_seq_length = max_seq_length
+        super().__init__(
+            f"Prompt is {prompt_tokens} tokens; with max_tokens={max_new_tokens} it exceeds "
+            f"the model context of {max_seq_length} tokens by "
+            f"{prompt_tokens + max_new_tokens - max_seq_length} tokens"
+        )
+
+
+@dataclass
+class CompiledPrompt:
+    """Token ids for a prompt, ready to be passed to generate()"""
+    input_ids: List[int]
+    prompt_tokens: int
+    max_new_tokens: int
+    max_seq_length: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.max_new_tokens
+
+    @property
+    def fits(self) -> bool:
+        return self.total_tokens <= self.max_seq_length
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "max_new_tokens": self.max_new_tokens,
+            "total_tokens": self.total_tokens,
+            "max_seq_length": self.max_seq_length,
+            "available_tokens": max(self.max_seq_length - self.total_tokens, 0),
+            "fits": self.fits,
+        }
+
+
+class PromptCompiler:
+    """Builds token ids for the instruction template of one loaded model"""
+
+    def __init__(self, tokenizer, max_seq_length: int = 2048, cache_size: int = 256):
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.cache_size = cache_size
+        # Token count of the template around an empty message, by system prompt
+        self._frame_cache: "OrderedDict[str, int]" = OrderedDict()
+        # Offset mappings are only available from fast (Rust) tokenizers
+        self.supports_offsets = bool(getattr(tokenizer, "is_fast", False))
+
+    @staticmethod
+    def _prompt_text(message: str, system_prompt: Optional[str] = None) -> Tuple[str, int]:
+        """The full prompt for a message, and the character position the message starts at"""
+        prefix = INSTRUCTION_PREFIX + (f"{system_prompt}\n\n" if system_prompt else "")
+        return prefix + message + RESPONSE_SUFFIX, len(prefix)
+
+    def _tokenize(self, text: str, offsets: bool = False) -> Tuple[List[int], Optional[List[Tuple[int, int]]]]:
+        """Token ids for text with the tokenizer's special tokens, plus character offsets if asked for"""
+        if offsets and self.supports_offsets:
+            encoded = self.tokenizer(text, add_special_tokens=True, return_offsets_mapping=True)
+            return list(encoded["input_ids"]), [tuple(offset) for offset in encoded["offset_mapping"]]
+        return list(self.tokenizer(text, add_special_tokens=True)["input_ids"]), None
+
+    def _frame_tokens(self, system_prompt: Optional[str]) -> int:
+        """Tokens the template (and system prompt) take around an empty message"""
+        key = system_prompt or ""
+        cached = self._frame_cache.get(key)
+        if cached is not None:
+            self._frame_cache.move_to_end(key)
+            return cached
+
+        count = len(self._tokenize(self._prompt_text("", system_prompt)[0])[0])
+        self._frame_cache[key] = count
+        if len(self._frame_cache) > self.cache_size:
+            self._frame_cache.popitem(last=False)
+        return count
+
+    def _message_budget(self, system_prompt: Optional[str], max_new_tokens: int) -> int:
+        """Message tokens that fit in one prompt next to the template and the generation budget"""
+        overhead = self._frame_tokens(system_prompt)
+        budget = self.max_seq_length - max_new_tokens - overhead
+        if budget <= 0:
+            raise PromptTooLongError(overhead, max_new_tokens, self.max_seq_length)
+        return budget
+
+    def _compiled(self, input_ids: List[int], max_new_tokens: int) -> CompiledPrompt:
+        return CompiledPrompt(
+            input_ids=input_ids,
+            prompt_tokens=len(input_ids),
+            max_new_tokens=max_new_tokens,
+            max_seq_length=self.max_seq_length
+        )
+
+    def compile(self,
+                message: str,
+                system_prompt: Optional[str] = None,
+                max_new_tokens: int = 150,
+                raw: bool = False) -> CompiledPrompt:
+        """Compile a message into the instruction template without checking its length.
+
+        With ``raw=True`` the message is taken to be a fully formatted prompt
+        and only the tokenizer's special tokens are added around it.
+        """
+        text = message if raw else self._prompt_text(message, system_prompt)[0]
+        return self._compiled(self._tokenize(text)[0], max_new_tokens)
+
+    def compile_checked(self,
+                        message: str,
+                        system_prompt: Optional[str] = None,
+                        max_new_tokens: int = 150,
+                        raw: bool = False) -> CompiledPrompt:
+        """Compile a message and raise PromptTooLongError if it does not fit"""
+        compiled = self.compile(message, system_prompt, max_new_tokens, raw)
+        if not compiled.fits:
+            raise PromptTooLongError(compiled.prompt_tokens, max_new_tokens, self.max_seq_length)
+        return compiled
+
+    def _message_token_ends(self, message: str, system_prompt: Optional[str]) -> List[int]:
+        """Character position in message at which each of its tokens ends, in the full prompt's tokenization"""
+        text, start = self._prompt_text(message, system_prompt)
+        end = start + len(message)
+        _, offsets = self._tokenize(text, offsets=True)
+        if offsets is not None:
+            return [
+                min(token_end, end) - start
+                for token_start, token_end in offsets
+                if token_start < end and token_end > start
+            ]
+
+        # Slow tokenizers have no offsets; measure the message's own tokens by decoding them
+        message_ids = self.tokenizer(message, add_special_tokens=False)["input_ids"]
+        return [
+            min(len(self.tokenizer.decode(message_ids[:count], skip_special_tokens=True)), len(message))
+            for count in range(1, len(message_ids) + 1)
+        ]
+
+    def compile_chunks(self,
+                       message: str,
+                       system_prompt: Optional[str] = None,
+                       max_new_tokens: int = 150) -> List[CompiledPrompt]:
+        """Split an over-length message into as many prompts as needed to fit the context.
+
+        The template and system prompt are repeated in every chunk; only the
+        message is split, at token boundaries of the full prompt's
+        tokenization. Each chunk is tokenized as a whole prompt again, and
+        gives back trailing tokens if that comes out longer than the budget.
+        """
+        compiled = self.compile(message, system_prompt, max_new_tokens)
+        if compiled.fits:
+            return [compiled]
+
+        budget = self._message_budget(system_prompt, max_new_tokens)
+        ends = self._message_token_ends(message, system_prompt)
+
+        chunks = []
+        first_token, first_char = 0, 0
+        while True:
+            last_token = min(first_token + budget, len(ends))
+            while True:
+                last_char = ends[last_token - 1] if last_token < len(ends) else len(message)
+                chunk = self.compile(message[first_char:last_char], system_prompt, max_new_tokens)
+                if chunk.fits:
+                    break
+                if last_token - first_token <= 1:
+                    raise PromptTooLongError(chunk.prompt_tokens, max_new_tokens, self.max_seq_length)
+                last_token -= 1
+            chunks.append(chunk)
+            if last_token >= len(ends):
+                return chunks
+            first_token, first_char = last_token, last_char
+
+    def count_tokens(self,
+                     message: str,
+                     system_prompt: Optional[str] = None,
+                     max_new_tokens: int = 150) -> Dict[str, Any]:
+        """Token accounting for a message, including how many chunks it would need"""
+        compiled = self.compile(message, system_prompt, max_new_tokens)
+        counts = compiled.to_dict()
+
+        if compiled.fits:
+            counts["chunks_needed"] = 1
+        else:
+            overhead = self._frame_tokens(system_prompt)
+            budget = self.max_seq_length - max_new_tokens - overhead
+            message_tokens = compiled.prompt_tokens - overhead
+            counts["chunks_needed"] = -(-message_tokens // budget) if budget > 0 else None
+
+        counts["cached_segments"] = len(self._frame_cache)
+        return counts
@@ -7,15 +7,25 @@ import threading
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from structured_decoding import is_structured_schema, to_json_schema
+
 class RemoteAPIResponder:
     """
     Remote API responder that uses the working API endpoint pattern
     Replaces local vLLM with remote API calls for reliable predictions
     """
     
-    def __init__(self, model_path: str, api_url: str = "https://finvix.deepcite.in/v1/chat/completions"):
+    def __init__(self, model_path: str, api_url: str = "https://finvix.deepcite.in/v1/chat/completions",
+                 output_schema: Optional[Dict[str, Any]] = None):
         self.model_path = model_path
         self.api_url = api_url
+        # Structured models get server-side JSON-schema guided decoding
+        self.response_format = None
+        if is_structured_schema(output_schema):
+            self.response_format = {
+                "type": "json_schema",
+                "json_schema": {"name": "output", "schema": to_json_schema(output_schema)}
+            }
         self.session = self._create_session()
         
     def _create_session(self) -> requests.Session:
@@ -105,14 +115,17 @@ class RemoteAPIResponder:
         input_text = self._extract_input_from_prompt(prompt)
         
         # Use the exact payload structure from the working code
-        payload = json.dumps({
+        request_body = {
             "model": self.model_path,
             "temperature": temperature,
             "messages": [
                 {"role": "system", "content": instruction},
                 {"role": "user", "content": input_text}
             ]
-        })
+        }
+        if self.response_format:
+            request_body["response_format"] = self.response_format
+        payload = json.dumps(request_body)
         
         headers = {
             'Content-Type': 'application/json',
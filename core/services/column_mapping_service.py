@@ -4,8 +4,10 @@ Enhanced column mapping service for manual column mapping and processing.
 
 import pandas as pd
 import json
+import re
 import numpy as np
-from typing import Dict, List, Any, Optional, Union
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple, Union
 from datetime import datetime
 from models.file_models import (
     ColumnConfig, ColumnMapping, ColumnRole, ColumnFormat,
@@ -13,6 +15,32 @@ from models.file_models import (
 )
 
 
+@dataclass
+class MappedData:
+    """Result of applying a column mapping: the rows with a valid output, and statistics"""
+    instructions: List[str]
+    inputs: List[Union[str, Dict[str, Any]]]
+    outputs: List[Union[str, Dict[str, Any]]]
+    stats: Dict[str, Any]
+    
+    def __len__(self) -> int:
+        return len(self.instructions)
+    
+    def records(self) -> List[Dict[str, Any]]:
+        """Rows as plain instruction/input/output dicts"""
+        return [
+            {'instruction': instruction, 'input': input_data, 'output': output}
+            for instruction, input_data, output in zip(self.instructions, self.inputs, self.outputs)
+        ]
+    
+    def examples(self) -> List[TrainingExample]:
+        """Rows as TrainingExample models (values are already of the declared types)"""
+        return [
+            TrainingExample.construct(instruction=instruction, input=input_data, output=output)
+            for instruction, input_data, output in zip(self.instructions, self.inputs, self.outputs)
+        ]
+
+
 class ColumnMappingService:
     """Service for manual column mapping and data processing"""
     
@@ -197,203 +225,235 @@ class ColumnMappingService:
             'unused_columns': list(available_columns - all_mapped_columns)
         }
     
-    def apply_mapping(self, data: pd.DataFrame, mapping: ColumnMapping) -> List[TrainingExample]:
+    def map_data(self, data: pd.DataFrame, mapping: ColumnMapping) -> MappedData:
         """
-        Apply column mapping to data and return processed training examples
+        Apply column mapping to data column by column, computing statistics in the same pass
         
         Args:
             data: Source DataFrame
             mapping: Column mapping configuration
             
         Returns:
-            List of training examples
+            Instructions, inputs and outputs of the rows with a valid output, and processing statistics
         """
-        processed_data = []
+        data = self._with_row_dtypes(data)
+        instructions = self._build_instructions(mapping, data)
+        inputs = self._build_values(mapping.input_columns, data)
+        outputs = self._build_values(mapping.output_columns, data, mapping.output_template)
+        
+        # Only require a valid output; the instruction may be empty
+        if isinstance(outputs, pd.Series):
+            valid = outputs.str.strip().ne("")
+        else:
+            valid = pd.Series([self._is_valid_output(output) for output in outputs], index=data.index, dtype=bool)
         
-        for _, row in data.iterrows():
-            try:
-                # Build instruction
-                instruction = self._build_instruction(mapping, row)
-                
-                # Build input (string or JSON object)
-                input_data = self._build_input(mapping, row)
-                
-                # Build output (string or JSON object)
-                output_data = self._build_output(mapping, row)
-                
-                # More lenient validation - only require valid output
-                # Allow empty instructions if static instruction is provided
-                has_valid_instruction = (
-                    instruction.strip() or 
-                    (mapping.static_instruction and mapping.static_instruction.strip())
-                )
-                
-                has_valid_output = self._is_valid_output(output_data)
-                
-                if has_valid_output:
-                    # Use static instruction if dynamic instruction is empty
-                    final_instruction = instruction.strip() or (mapping.static_instruction or "").strip()
-                    
-                    processed_data.append(TrainingExample(
-                        instruction=final_instruction,
-                        input=input_data,
-                        output=output_data
-                    ))
-                    
-            except Exception as e:
-                # Skip rows that can't be processed
-                print(f"Warning: Could not process row: {e}")
-                continue
+        instructions = instructions[valid]
+        valid_rows = valid.to_numpy()
+        inputs = inputs[valid].tolist() if isinstance(inputs, pd.Series) else [x for x, ok in zip(inputs, valid_rows) if ok]
+        outputs = outputs[valid].tolist() if isinstance(outputs, pd.Series) else [o for o, ok in zip(outputs, valid_rows) if ok]
+        
+        total_input_rows = len(data)
+        valid_output_rows = len(instructions)
+        instruction_lengths = instructions.str.len()
+        json_outputs = sum(1 for output in outputs if isinstance(output, dict))
         
-        return processed_data
+        stats = {
+            'total_input_rows': total_input_rows,
+            'valid_output_rows': valid_output_rows,
+            'skipped_rows': total_input_rows - valid_output_rows,
+            'success_rate': (valid_output_rows / total_input_rows * 100) if total_input_rows > 0 else 0,
+            'instruction_stats': {
+                'avg_length': float(instruction_lengths.mean()) if valid_output_rows else 0,
+                'min_length': int(instruction_lengths.min()) if valid_output_rows else 0,
+                'max_length': int(instruction_lengths.max()) if valid_output_rows else 0
+            },
+            'output_types': {
+                'string_outputs': sum(1 for output in outputs if isinstance(output, str)),
+                'json_outputs': json_outputs
+            },
+            'column_usage': {
+                'instruction_columns': len(mapping.instruction_columns),
+                'input_columns': len(mapping.input_columns),
+                'output_columns': len(mapping.output_columns)
+            }
+        }
+        
+        return MappedData(
+            instructions=instructions.tolist(),
+            inputs=inputs,
+            outputs=outputs,
+            stats=stats
+        )
     
-    def _build_instruction(self, mapping: ColumnMapping, row: pd.Series) -> str:
-        """Build instruction string from mapping and row data"""
-        instruction_parts = []
+    def apply_mapping(self, data: pd.DataFrame, mapping: ColumnMapping) -> List[TrainingExample]:
+        """
+        Apply column mapping to data and return processed training examples
         
-        # Add static instruction if provided
-        if mapping.static_instruction and mapping.static_instruction.strip():
-            instruction_parts.append(mapping.static_instruction.strip())
+        Args:
+            data: Source DataFrame
+            mapping: Column mapping configuration
+            
+        Returns:
+            List of training examples
+        """
+        return self.map_data(data, mapping).examples()
+    
+    @staticmethod
+    def _with_row_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+        """
+        The frame with the value types the row-by-row mapping used to see
         
-        # Add dynamic instruction from columns
+        Rows of an all-numeric frame with a float column come out of
+        ``iterrows`` as floats, so integer columns were rendered as floats
+        ('1.0', {'q': 1.0}). The same upcast is applied here so rebuilt
+        datasets keep producing the same text.
+        """
+        dtypes = list(data.dtypes)
+        numeric = all(isinstance(dtype, np.dtype) and dtype.kind in 'iuf' for dtype in dtypes)
+        if dtypes and numeric and any(dtype.kind == 'f' for dtype in dtypes):
+            return data.astype(np.result_type(*dtypes))
+        return data
+    
+    def _text_column(self, data: pd.DataFrame, col_name: str) -> pd.Series:
+        """Column values as strings, with missing values as empty strings"""
+        values = data[col_name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            # astype(str) would drop midnight times that str() of a Timestamp keeps
+            text = values.map(str)
+        else:
+            text = values.astype(str)
+        return text.where(values.notna(), "")
+    
+    def _build_instructions(self, mapping: ColumnMapping, data: pd.DataFrame) -> pd.Series:
+        """Build the instruction of every row: static instruction, then the dynamic one from columns"""
+        dynamic = pd.Series("", index=data.index, dtype=object)
+        columns = [c for c in mapping.instruction_columns if c.column_name in data.columns]
         if mapping.instruction_columns:
             if mapping.instruction_template:
                 # Use custom template
-                dynamic_instruction = self._apply_template(
-                    mapping.instruction_template, 
-                    mapping.instruction_columns, 
-                    row
-                )
+                dynamic = self._render_template(mapping.instruction_template, columns, data)
             else:
                 # Default template: just concatenate column values
-                dynamic_parts = []
-                for col_config in mapping.instruction_columns:
-                    col_name = col_config.column_name
-                    if col_name in row.index:
-                        value = str(row[col_name]) if pd.notna(row[col_name]) else ""
-                        if value.strip():
-                            dynamic_parts.append(value.strip())
-                dynamic_instruction = "\n".join(dynamic_parts)
-            
-            if dynamic_instruction.strip():
-                instruction_parts.append(dynamic_instruction.strip())
+                dynamic = self._join_nonempty(
+                    [self._text_column(data, c.column_name).str.strip() for c in columns],
+                    data.index
+                )
+            dynamic = dynamic.str.strip()
         
-        return "\n".join(instruction_parts)
+        static_instruction = (mapping.static_instruction or "").strip()
+        if not static_instruction:
+            return dynamic
+        return (static_instruction + "\n" + dynamic).where(dynamic.ne(""), static_instruction)
     
-    def _build_input(self, mapping: ColumnMapping, row: pd.Series) -> Union[str, Dict[str, Any]]:
-        """Build input data (string or JSON object) from mapping and row data"""
-        if not mapping.input_columns:
-            return ""
-        
-        if len(mapping.input_columns) == 1:
-            # Single column -> return as string or parsed JSON
-            col_config = mapping.input_columns[0]
-            col_name = col_config.column_name
-            if col_name in row.index:
-                value = row[col_name]
-                if pd.notna(value):
-                    if col_config.parse_json:
-                        try:
-                            # Try to parse as JSON
-                            return json.loads(str(value))
-                        except (json.JSONDecodeError, TypeError):
-                            # If parsing fails, return as string
-                            return str(value)
-                    else:
-                        return str(value)
-                return ""
-            return ""
-        else:
-            # Multiple columns -> return as JSON object with field mapping
-            input_obj = {}
-            for col_config in mapping.input_columns:
-                col_name = col_config.column_name
-                target_field = col_config.get_target_field()
-                
-                if col_name in row.index:
-                    value = row[col_name]
-                    if pd.notna(value):
-                        if col_config.parse_json:
-                            try:
-                                # Try to parse as JSON
-                                parsed_value = json.loads(str(value))
-                                input_obj[target_field] = parsed_value
-                            except (json.JSONDecodeError, TypeError):
-                                # If parsing fails, store as string
-                                input_obj[target_field] = self._convert_numpy_types(value)
-                        else:
-                            input_obj[target_field] = self._convert_numpy_types(value)
-                    else:
-                        input_obj[target_field] = None
-            return input_obj
+    @staticmethod
+    def _join_nonempty(parts: List[pd.Series], index: pd.Index, separator: str = "\n") -> pd.Series:
+        """Join the non-empty strings of each row"""
+        joined = pd.Series("", index=index, dtype=object)
+        for part in parts:
+            joined = (joined + separator + part).where(joined.ne("") & part.ne(""), joined + part)
+        return joined
     
-    def _build_output(self, mapping: ColumnMapping, row: pd.Series) -> Union[str, Dict[str, Any]]:
-        """Build output data (string or JSON object) from mapping and row data"""
-        if not mapping.output_columns:
-            return ""
-        
-        if len(mapping.output_columns) == 1:
-            # Single column -> return as string or parsed JSON
-            col_config = mapping.output_columns[0]
-            col_name = col_config.column_name
-            if col_name in row.index:
-                value = row[col_name]
-                if pd.notna(value):
-                    if mapping.output_template:
-                        # Apply custom template
-                        return self._apply_template(mapping.output_template, [col_config], row)
-                    elif col_config.parse_json:
-                        try:
-                            # Try to parse as JSON
-                            return json.loads(str(value))
-                        except (json.JSONDecodeError, TypeError):
-                            # If parsing fails, return as string
-                            return str(value)
-                    else:
-                        # Return raw value as string
-                        return str(value)
-                return ""
-            return ""
-        else:
-            # Multiple columns -> return as JSON object with field mapping
-            output_obj = {}
-            for col_config in mapping.output_columns:
-                col_name = col_config.column_name
-                target_field = col_config.get_target_field()
-                
-                if col_name in row.index:
-                    value = row[col_name]
-                    if pd.notna(value):
-                        if col_config.parse_json:
-                            try:
-                                # Try to parse as JSON
-                                parsed_value = json.loads(str(value))
-                                output_obj[target_field] = parsed_value
-                            except (json.JSONDecodeError, TypeError):
-                                # If parsing fails, store as string
-                                output_obj[target_field] = self._convert_numpy_types(value)
-                        else:
-                            output_obj[target_field] = self._convert_numpy_types(value)
-                    else:
-                        output_obj[target_field] = None
-            return output_obj
+    def _render_template(self, template: str, columns: List[ColumnConfig], data: pd.DataFrame) -> pd.Series:
+        """Fill {column} placeholders of a template with each row's formatted values"""
+        # A column mapped more than once fills its placeholders with its first config
+        formatted: Dict[str, pd.Series] = {}
+        for c in columns:
+            if c.column_name not in formatted:
+                formatted[c.column_name] = self._format_column(self._text_column(data, c.column_name), c)
+        result = pd.Series("", index=data.index, dtype=object)
+        if not formatted:
+            return result + template.strip()
+        
+        # Split into literal text and placeholders: [text, column, text, column, ..., text]
+        pattern = "|".join(re.escape(f"{{{name}}}") for name in formatted)
+        pieces = re.split(f"({pattern})", template)
+        for i, piece in enumerate(pieces):
+            if i % 2:
+                result = result + formatted[piece[1:-1]]
+            elif piece:
+                result = result + piece
+        return result.str.strip()
     
-    def _apply_template(self, template: str, columns: List[ColumnConfig], row: pd.Series) -> str:
-        """Apply template to a single row of data"""
-        result = template
+    def _format_column(self, values: pd.Series, col_config: ColumnConfig) -> pd.Series:
+        """Format string values of a column based on its configuration"""
+        if col_config.format_type == ColumnFormat.TABLE:
+            # Simple table formatting
+            return ("| " + values + " |").where(values.ne(""), "")
+        if col_config.format_type in (ColumnFormat.JSON, ColumnFormat.LIST):
+            return values.map(lambda value: self._format_column_value(value, col_config))
+        return values
+    
+    def _build_values(self, columns: List[ColumnConfig], data: pd.DataFrame,
+                      template: str = "") -> Union[pd.Series, List[Any]]:
+        """Build input or output values: a string (or parsed JSON) from one column, an object from several
         
+        Returns a Series of strings when every value is a string, else a list.
+        """
+        if not columns:
+            return pd.Series("", index=data.index, dtype=object)
+        
+        if len(columns) == 1:
+            # Single column -> string or parsed JSON
+            col_config = columns[0]
+            if col_config.column_name not in data.columns:
+                return pd.Series("", index=data.index, dtype=object)
+            if template:
+                # Apply custom template (missing values stay empty)
+                present = data[col_config.column_name].notna()
+                return self._render_template(template, [col_config], data).where(present, "")
+            text = self._text_column(data, col_config.column_name)
+            if col_config.parse_json:
+                return [self._parse_json_value(value) if value else "" for value in text.tolist()]
+            return text
+        
+        # Multiple columns -> JSON object with field mapping
+        fields = []
+        column_values = []
         for col_config in columns:
-            col_name = col_config.column_name
-            if col_name in row.index:
-                value = str(row[col_name]) if pd.notna(row[col_name]) else ""
-                
-                # Apply formatting based on column configuration
-                formatted_value = self._format_column_value(value, col_config)
-                
-                # Replace placeholder in template
-                result = result.replace(f"{{{col_name}}}", formatted_value)
-        
-        return result.strip()
+            if col_config.column_name not in data.columns:
+                continue
+            fields.append(col_config.get_target_field())
+            column_values.append(self._native_values(data[col_config.column_name], col_config.parse_json))
+        if not fields:
+            return [{} for _ in range(len(data))]
+        return [dict(zip(fields, row)) for row in zip(*column_values)]
+    
+    def _native_values(self, values: pd.Series, parse_json: bool) -> List[Any]:
+        """Column values as JSON-serializable Python values, with missing values as None"""
+        missing = values.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(values):
+            converted = [self._convert_numpy_types(value) for value in values]
+        else:
+            converted = values.astype(object).tolist()
+            if values.dtype == object:
+                # Strings need no conversion; numpy scalars, dates etc. do
+                converted = [
+                    value if isinstance(value, str) else self._convert_numpy_types(value)
+                    for value in converted
+                ]
+        
+        result = []
+        for value, is_missing in zip(converted, missing):
+            if is_missing:
+                result.append(None)
+            elif parse_json:
+                try:
+                    result.append(json.loads(str(value)))
+                except (json.JSONDecodeError, TypeError):
+                    # If parsing fails, keep the value
+                    result.append(value)
+            else:
+                result.append(value)
+        return result
+    
+    @staticmethod
+    def _parse_json_value(value: str) -> Union[str, Dict[str, Any]]:
+        """Parse a JSON object; anything else (invalid JSON, arrays, numbers) stays a string"""
+        try:
+            parsed = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return value
+        return parsed if isinstance(parsed, (str, dict)) else value
     
     def _format_column_value(self, value: str, col_config: ColumnConfig) -> str:
         """Format a column value based on its configuration"""
@@ -467,6 +527,9 @@ class ColumnMappingService:
         """
         Get statistics about how the mapping would process the data
         
+        Callers that also need the examples should use map_data, which
+        returns both from one pass.
+        
         Args:
             data: Source DataFrame
             mapping: Column mapping configuration
@@ -474,34 +537,38 @@ class ColumnMappingService:
         Returns:
             Processing statistics
         """
-        # Apply mapping to get processed examples
-        processed_examples = self.apply_mapping(data, mapping)
-        
-        # Calculate statistics
-        total_input_rows = len(data)
-        valid_output_rows = len(processed_examples)
-        skipped_rows = total_input_rows - valid_output_rows
-        
-        # Analyze instruction lengths
-        instruction_lengths = [len(ex.instruction) for ex in processed_examples]
+        return self.map_data(data, mapping).stats
+    
+    def merge_processing_stats(self, shard_stats: List[Dict[str, Any]], mapping: ColumnMapping) -> Dict[str, Any]:
+        """
+        Combine the statistics of consecutive row ranges mapped separately
         
-        # Analyze output types and sizes
-        string_outputs = sum(1 for ex in processed_examples if isinstance(ex.output, str))
-        json_outputs = sum(1 for ex in processed_examples if isinstance(ex.output, dict))
+        Args:
+            shard_stats: Statistics returned by map_data for each row range
+            mapping: Column mapping configuration
+            
+        Returns:
+            Processing statistics for all rows, as map_data would report them
+        """
+        total_input_rows = sum(stats['total_input_rows'] for stats in shard_stats)
+        valid_output_rows = sum(stats['valid_output_rows'] for stats in shard_stats)
+        non_empty = [stats for stats in shard_stats if stats['valid_output_rows']]
         
         return {
             'total_input_rows': total_input_rows,
             'valid_output_rows': valid_output_rows,
-            'skipped_rows': skipped_rows,
+            'skipped_rows': total_input_rows - valid_output_rows,
             'success_rate': (valid_output_rows / total_input_rows * 100) if total_input_rows > 0 else 0,
             'instruction_stats': {
-                'avg_length': sum(instruction_lengths) / len(instruction_lengths) if instruction_lengths else 0,
-                'min_length': min(instruction_lengths) if instruction_lengths else 0,
-                'max_length': max(instruction_lengths) if instruction_lengths else 0
+                'avg_length': sum(
+                    stats['instruction_stats']['avg_length'] * stats['valid_output_rows'] for stats in non_empty
+                ) / valid_output_rows if valid_output_rows else 0,
+                'min_length': min(stats['instruction_stats']['min_length'] for stats in non_empty) if non_empty else 0,
+                'max_length': max(stats['instruction_stats']['max_length'] for stats in non_empty) if non_empty else 0
             },
             'output_types': {
-                'string_outputs': string_outputs,
-                'json_outputs': json_outputs
+                'string_outputs': sum(stats['output_types']['string_outputs'] for stats in shard_stats),
+                'json_outputs': sum(stats['output_types']['json_outputs'] for stats in shard_stats)
             },
             'column_usage': {
                 'instruction_columns': len(mapping.instruction_columns),
@@ -511,5 +578,25 @@ class ColumnMappingService:
         }
 
 
+def map_shard(data: pd.DataFrame, mapping: ColumnMapping) -> Tuple[str, Dict[str, Any]]:
+    """
+    Map one row range of a source file and encode its records
+    
+    Module-level so it can run in a worker process. The records are encoded
+    there as well (one JSON object per line), leaving the parent process
+    only to append the text to the dataset file.
+    
+    Args:
+        data: Rows of the source DataFrame
+        mapping: Column mapping configuration
+        
+    Returns:
+        Encoded records (empty if no row produced a valid example) and processing statistics
+    """
+    mapped = column_mapping_service.map_data(data, mapping)
+    text = "\n".join(json.dumps(record, ensure_ascii=False, default=str) for record in mapped.records())
+    return text, mapped.stats
+
+
 # Global instance
 column_mapping_service = ColumnMappingService()
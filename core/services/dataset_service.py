@@ -3,20 +3,40 @@ Dataset management service for processed training datasets.
 """
 
 import os
+import re
 import json
 import uuid
+import random
 import shutil
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, BinaryIO, Callable, Iterable, Iterator, Optional, Set, Tuple
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
 from models.dataset_models import (
-    ProcessedDataset, DatasetCreateRequest, ProcessingStats,
-    DatasetTemplate
+    ProcessedDataset, DatasetCreateRequest, DatasetVersionRequest, DatasetSegment,
+    DatasetFilter, FilterOperator, ProcessingStats, DatasetTemplate
 )
 from models.file_models import ColumnMapping, TrainingExample
-from services.column_mapping_service import column_mapping_service
+from services.column_mapping_service import column_mapping_service, map_shard
 from file_manager import file_manager
+from data_loader import iter_json_records, iter_jsonl_records
+from content_store import ContentStore, file_sha256
+
+
+# Source rows mapped per worker task when building a dataset
+DATASET_SHARD_ROWS = 50_000
+
+# Worker processes used to map shards
+MAX_BUILD_WORKERS = os.cpu_count() or 1
 
 
 class DatasetService:
@@ -34,6 +54,17 @@ class DatasetService:
         self.metadata_file = self.datasets_dir / "datasets_index.json"
         self.templates_file = self.datasets_dir / "templates_index.json"
         
+        # Dataset examples are stored once by content; versions and duplicates share blocks
+        self.store = ContentStore(str(self.datasets_dir / "store"))
+        
+        # Guards read-modify-write of the datasets index (builds update it from worker threads)
+        self._index_lock = threading.RLock()
+        
+        # Dataset builds run in the background; the process pool is started on first use
+        self._build_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dataset-build")
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        
         # Initialize index files if they don't exist
         if not self.metadata_file.exists():
             self._save_datasets_index({})
@@ -41,7 +72,14 @@ class DatasetService:
             self._save_templates_index({})
     
     def create_dataset(self, request: DatasetCreateRequest) -> Dict[str, Any]:
-        """Create a new processed dataset"""
+        """
+        Create a new processed dataset
+        
+        The source file is checked and the dataset registered with status
+        "processing"; the rows are mapped and written in the background
+        (see _build_dataset), so this returns the dataset_id immediately.
+        Poll get_dataset for status and progress.
+        """
         try:
             # Generate unique dataset ID
             dataset_id = f"dataset_{uuid.uuid4().hex[:12]}"
@@ -54,7 +92,6 @@ class DatasetService:
                     'error': 'Source file not found'
                 }
             
-            # Load and process the source data
             file_path = file_manager.get_file_path(request.source_file_id)
             if not file_path or not os.path.exists(file_path):
                 return {
@@ -62,32 +99,9 @@ class DatasetService:
                     'error': 'Source file not accessible'
                 }
             
-            # Load data using the file service's method
-            data = self._load_data_file(file_path)
-            
-            # Apply column mapping to generate training examples
-            training_examples = column_mapping_service.apply_mapping(data, request.column_mapping)
-            
-            if not training_examples:
-                return {
-                    'success': False,
-                    'error': 'No valid training examples generated from the mapping'
-                }
-            
-            # Get processing statistics
-            processing_stats = column_mapping_service.get_processing_stats(data, request.column_mapping)
-            
-            # Save dataset to file
-            dataset_file_path = self.datasets_dir / "data" / f"{dataset_id}.json"
-            training_data = [example.dict() for example in training_examples]
+            dataset_file_path = self._dataset_file_path(dataset_id)
             
-            with open(dataset_file_path, 'w', encoding='utf-8') as f:
-                json.dump(training_data, f, indent=2, ensure_ascii=False, default=str)
-            
-            # Get file size
-            file_size = os.path.getsize(dataset_file_path)
-            
-            # Create dataset metadata
+            # Create dataset metadata; the statistics are filled in by the build
             now = datetime.now().isoformat()
             dataset = ProcessedDataset(
                 dataset_id=dataset_id,
@@ -96,10 +110,12 @@ class DatasetService:
                 source_file_id=request.source_file_id,
                 source_filename=file_info.get('original_filename', 'unknown'),
                 column_mapping=request.column_mapping,
-                total_examples=len(training_examples),
-                processing_stats=ProcessingStats(**processing_stats),
+                total_examples=0,
+                processing_stats=None,
+                status="processing",
+                progress=0.0,
                 file_path=str(dataset_file_path),
-                file_size=file_size,
+                file_size=0,
                 created_at=now,
                 last_modified=now,
                 tags=request.tags or [],
@@ -110,6 +126,8 @@ class DatasetService:
             # Save metadata
             self._save_dataset_metadata(dataset)
             
+            self._build_executor.submit(self._build_dataset, dataset_id, file_path, request.column_mapping)
+            
             return {
                 'success': True,
                 'dataset_id': dataset_id,
@@ -122,6 +140,259 @@ class DatasetService:
                 'error': f'Failed to create dataset: {str(e)}'
             }
     
+    def _build_dataset(self, dataset_id: str, source_path: str, mapping: ColumnMapping):
+        """
+        Map the source rows and store the dataset's examples (runs on the build executor)
+        
+        The rows are split into ranges of DATASET_SHARD_ROWS and mapped in the
+        process pool; each shard is appended to the dataset's segment as soon
+        as it and every shard before it are done. Progress is recorded after
+        every shard.
+        """
+        try:
+            # Load data (parsed once and cached by the file manager)
+            data = file_manager.load_dataframe(source_path)
+            total_rows = len(data)
+            
+            shard_stats = []
+            
+            def shard_texts() -> Iterator[str]:
+                rows_processed = 0
+                for rows, (text, stats) in self._map_shards(data, mapping):
+                    if text:
+                        yield text + "\n"
+                    shard_stats.append(stats)
+                    rows_processed += rows
+                    
+                    progress = round(rows_processed / total_rows * 100, 1) if total_rows else 100.0
+                    if not self._update_dataset(dataset_id, {'rows_processed': rows_processed, 'progress': progress}):
+                        # Deleted while building
+                        return
+            
+            segment = self._write_segment(dataset_id, shard_texts())
+            processing_stats = column_mapping_service.merge_processing_stats(shard_stats, mapping)
+            
+            if self.get_dataset(dataset_id) is None:
+                if segment:
+                    self.store.release(segment.sha256, self._content_ref(dataset_id))
+                return
+            
+            if segment is None:
+                self._update_dataset(dataset_id, {
+                    'status': 'failed',
+                    'error': 'No valid training examples generated from the mapping',
+                    'processing_stats': processing_stats
+                })
+                return
+            
+            dataset_file_path = self._dataset_file_path(dataset_id)
+            self.store.link(segment.sha256, str(dataset_file_path), self._content_ref(dataset_id))
+            
+            ready = self._update_dataset(dataset_id, {
+                'status': 'ready',
+                'progress': 100.0,
+                'total_examples': segment.rows,
+                'processing_stats': processing_stats,
+                'segments': [segment.dict()],
+                'file_size': os.path.getsize(dataset_file_path),
+                'last_modified': datetime.now().isoformat()
+            })
+            if ready is None:
+                dataset_file_path.unlink(missing_ok=True)
+                self.store.release(segment.sha256, self._content_ref(dataset_id))
+            
+        except Exception as e:
+            print(f"Error building dataset {dataset_id}: {e}")
+            self._update_dataset(dataset_id, {
+                'status': 'failed',
+                'error': f'Failed to create dataset: {str(e)}'
+            })
+    
+    def _map_shards(self, data: pd.DataFrame, mapping: ColumnMapping) -> Iterator[Tuple[int, Tuple[str, Dict[str, Any]]]]:
+        """
+        Map row ranges of the data, yielding (row count, map_shard result) in row order
+        
+        Data that fits in a single shard is mapped in this process. Otherwise
+        at most two shards per worker are in flight, so the pickled slices and
+        encoded results waiting to be written stay bounded.
+        """
+        if len(data) <= DATASET_SHARD_ROWS:
+            yield len(data), map_shard(data, mapping)
+            return
+        
+        pool = self._get_process_pool()
+        pending = deque()
+        for start in range(0, len(data), DATASET_SHARD_ROWS):
+            shard = data.iloc[start:start + DATASET_SHARD_ROWS]
+            pending.append((len(shard), pool.submit(map_shard, shard, mapping)))
+            if len(pending) >= 2 * MAX_BUILD_WORKERS:
+                rows, future = pending.popleft()
+                yield rows, future.result()
+        
+        while pending:
+            rows, future = pending.popleft()
+            yield rows, future.result()
+    
+    def _dataset_file_path(self, dataset_id: str) -> Path:
+        """Where a dataset's examples are linked as one file, one JSON object per line"""
+        return self.datasets_dir / "data" / f"{dataset_id}.jsonl"
+    
+    @staticmethod
+    def _content_ref(dataset_id: str) -> str:
+        """Content store reference held by a dataset on each of its segments"""
+        return f"dataset:{dataset_id}"
+    
+    def _write_segment(self, dataset_id: str, chunks: Iterable[str]) -> Optional[DatasetSegment]:
+        """
+        Store JSONL text as a segment referenced by the dataset
+        
+        Args:
+            dataset_id: Dataset taking a reference on the segment
+            chunks: Text made of complete lines, one example per line
+            
+        Returns:
+            The segment (shared with any dataset that stored the same content), or None if there were no lines
+        """
+        temp_path = self.datasets_dir / "data" / f"{dataset_id}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            digest = hashlib.sha256()
+            rows = 0
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    data = chunk.encode('utf-8')
+                    f.write(data)
+                    digest.update(data)
+                    # json.dumps escapes newlines inside values, so each one ends an example
+                    rows += chunk.count("\n")
+            
+            if not rows:
+                return None
+            
+            sha256 = digest.hexdigest()
+            self.store.put(str(temp_path), sha256, self._content_ref(dataset_id), move=True)
+            return DatasetSegment(sha256=sha256, rows=rows)
+        finally:
+            temp_path.unlink(missing_ok=True)
+    
+    def _write_manifest(self, dataset_id: str, offsets: np.ndarray) -> str:
+        """Store the byte offsets of the lines a segment keeps from its block; returns the manifest's SHA-256"""
+        data = offsets.astype('<u8').tobytes()
+        sha256 = hashlib.sha256(data).hexdigest()
+        temp_path = self.datasets_dir / "data" / f"{dataset_id}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            temp_path.write_bytes(data)
+            self.store.put(str(temp_path), sha256, self._content_ref(dataset_id), move=True)
+            return sha256
+        finally:
+            temp_path.unlink(missing_ok=True)
+    
+    def _open_segments(self, segments: List[DatasetSegment]) -> List[Tuple[BinaryIO, Optional[np.ndarray]]]:
+        """Open the blocks of segments with the line offsets their manifests keep (None: every line)"""
+        opened = []
+        try:
+            for segment in segments:
+                offsets = None
+                if segment.manifest:
+                    offsets = np.fromfile(self.store.object_path(segment.manifest), dtype='<u8')
+                opened.append((open(self.store.object_path(segment.sha256), 'rb'), offsets))
+        except Exception:
+            for f, _ in opened:
+                f.close()
+            raise
+        return opened
+    
+    @staticmethod
+    def _block_lines(f: BinaryIO, offsets: Optional[np.ndarray]) -> Iterator[Tuple[int, bytes]]:
+        """(byte offset, line) of the examples kept from an open block, in order"""
+        if offsets is None:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    yield offset, line
+                offset += len(line)
+            return
+        # Offsets are ascending, so the reads move forward through the block
+        for offset in offsets.tolist():
+            f.seek(offset)
+            yield offset, f.readline()
+    
+    def _iter_opened_lines(self, opened: List[Tuple[BinaryIO, Optional[np.ndarray]]]) -> Iterator[str]:
+        """The JSONL lines of opened segments, in order; closes them when done"""
+        try:
+            for f, offsets in opened:
+                for _, line in self._block_lines(f, offsets):
+                    text = line.decode('utf-8')
+                    yield text if text.endswith("\n") else text + "\n"
+        finally:
+            for f, _ in opened:
+                f.close()
+    
+    def _iter_segment_lines(self, segments: List[DatasetSegment]) -> Iterator[str]:
+        """The JSONL lines of segments, in order"""
+        for segment in segments:
+            yield from self._iter_opened_lines(self._open_segments([segment]))
+    
+    @staticmethod
+    def _segment_blobs(segments: List[DatasetSegment]) -> Set[str]:
+        """Stored blobs segments use: their blocks and manifests"""
+        return {segment.sha256 for segment in segments} | {segment.manifest for segment in segments if segment.manifest}
+    
+    @staticmethod
+    def _single_block(segments: List[DatasetSegment]) -> Optional[str]:
+        """The block holding exactly a dataset's examples, if they are one whole block"""
+        if len(segments) == 1 and not segments[0].manifest:
+            return segments[0].sha256
+        return None
+    
+    def _segments_size(self, segments: List[DatasetSegment]) -> int:
+        """Bytes stored for segments, counting each shared block or manifest once"""
+        paths = [self.store.object_path(sha256) for sha256 in self._segment_blobs(segments)]
+        return sum(path.stat().st_size for path in paths if path.exists())
+    
+    def _ensure_segments(self, dataset: ProcessedDataset) -> ProcessedDataset:
+        """Move the data file of a dataset created before segmented storage into the content store"""
+        if dataset.segments or not os.path.exists(dataset.file_path):
+            return dataset
+        
+        ref = self._content_ref(dataset.dataset_id)
+        if dataset.file_path.endswith('.jsonl'):
+            # Already JSONL: the file itself becomes the segment (hardlinked, not copied)
+            sha256 = file_sha256(dataset.file_path)
+            self.store.put(dataset.file_path, sha256, ref)
+            self.store.link(sha256, dataset.file_path, ref)
+            segment = DatasetSegment(sha256=sha256, rows=dataset.total_examples)
+            file_path = dataset.file_path
+        else:
+            # A JSON array is rewritten as JSONL once
+            segment = self._write_segment(dataset.dataset_id, (
+                json.dumps(record, ensure_ascii=False, default=str) + "\n"
+                for record in iter_json_records(dataset.file_path)
+            ))
+            if segment is None:
+                return dataset
+            file_path = str(self._dataset_file_path(dataset.dataset_id))
+            self.store.link(segment.sha256, file_path, ref)
+            os.remove(dataset.file_path)
+        
+        updated = self._update_dataset(dataset.dataset_id, {
+            'segments': [segment.dict()],
+            'total_examples': segment.rows,
+            'file_path': file_path
+        })
+        return updated or dataset
+    
+    
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        """Worker processes for mapping shards, started on first use"""
+        with self._pool_lock:
+            if self._process_pool is None:
+                # Spawn rather than fork: the server process holds threads and CUDA state
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=MAX_BUILD_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._process_pool
+    
     def list_datasets(
         self, 
         sort_by: str = 'created_at', 
@@ -165,11 +436,17 @@ class DatasetService:
             total_examples = sum(d.total_examples for d in datasets)
             total_size = sum(d.file_size for d in datasets)
             
+            # Blocks shared between versions are counted once
+            stored_size = self._segments_size([segment for d in datasets for segment in d.segments]) + sum(
+                d.file_size for d in datasets if not d.segments
+            )
+            
             storage_stats = {
                 'total_datasets': total_datasets,
                 'total_examples': total_examples,
                 'total_size_bytes': total_size,
                 'total_size_mb': round(total_size / (1024 * 1024), 2),
+                'stored_size_bytes': stored_size,
                 'avg_examples_per_dataset': round(total_examples / total_datasets, 1) if total_datasets > 0 else 0
             }
             
@@ -201,26 +478,47 @@ class DatasetService:
             print(f"Error loading dataset {dataset_id}: {e}")
             return None
     
+    def iter_dataset_data(self, dataset_id: str, limit: Optional[int] = None) -> Optional[Iterator[TrainingExample]]:
+        """
+        Stream a dataset's training examples from its file, one at a time
+        
+        Args:
+            dataset_id: Dataset to read
+            limit: Stop after this many examples (reads only that far into the file)
+            
+        Returns:
+            Iterator of training examples, or None if the dataset or its file does not exist
+        """
+        dataset = self.get_dataset(dataset_id)
+        if not dataset:
+            return None
+        
+        if dataset.segments:
+            records = (json.loads(line) for line in self._iter_segment_lines(dataset.segments))
+            return (TrainingExample(**record) for record in islice(records, limit))
+        
+        if not os.path.exists(dataset.file_path):
+            return None
+        
+        # Datasets stored before segments are a JSONL or JSON array file; both are read record by record
+        if dataset.file_path.endswith('.jsonl'):
+            records = iter_jsonl_records(dataset.file_path)
+        else:
+            records = iter_json_records(dataset.file_path)
+        
+        return (TrainingExample(**record) for record in islice(records, limit))
+    
     def get_dataset_data(self, dataset_id: str) -> Optional[List[TrainingExample]]:
         """Load the actual training data for a dataset"""
         try:
-            dataset = self.get_dataset(dataset_id)
-            if not dataset:
-                return None
-            
-            if not os.path.exists(dataset.file_path):
-                return None
-            
-            with open(dataset.file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            return [TrainingExample(**example) for example in data]
+            examples = self.iter_dataset_data(dataset_id)
+            return list(examples) if examples is not None else None
         except Exception as e:
             print(f"Error loading dataset data {dataset_id}: {e}")
             return None
     
     def preview_dataset(self, dataset_id: str, limit: int = 10) -> Dict[str, Any]:
-        """Get a preview of dataset examples"""
+        """Get a preview of dataset examples (reads only the first ``limit`` rows)"""
         try:
             dataset = self.get_dataset(dataset_id)
             if not dataset:
@@ -229,20 +527,26 @@ class DatasetService:
                     'error': 'Dataset not found'
                 }
             
-            training_data = self.get_dataset_data(dataset_id)
-            if training_data is None:
+            if dataset.status != 'ready':
+                return {
+                    'success': False,
+                    'error': f'Dataset is not ready (status: {dataset.status})'
+                }
+            
+            examples = self.iter_dataset_data(dataset_id, limit)
+            if examples is None:
                 return {
                     'success': False,
                     'error': 'Dataset data not accessible'
                 }
             
-            preview_data = training_data[:limit]
+            preview_data = list(examples)
             
             return {
                 'success': True,
                 'dataset_id': dataset_id,
                 'preview_data': preview_data,
-                'total_examples': len(training_data),
+                'total_examples': dataset.total_examples,
                 'showing_examples': len(preview_data)
             }
             
@@ -252,6 +556,84 @@ class DatasetService:
                 'error': f'Failed to preview dataset: {str(e)}'
             }
     
+    def iter_data_lines(self, dataset_id: str) -> Optional[Iterator[str]]:
+        """
+        The JSONL lines of a ready dataset, streamed from its segments (for download and training)
+        
+        Every segment is opened before this returns, so the stream stays
+        readable even if the dataset is deleted while it is being sent.
+        """
+        dataset = self.get_dataset(dataset_id)
+        if not dataset or dataset.status != 'ready':
+            return None
+        
+        if not dataset.segments and os.path.exists(dataset.file_path) and not dataset.file_path.endswith('.jsonl'):
+            # Built before JSONL storage: a JSON array, sent as JSONL
+            return (
+                json.dumps(record, ensure_ascii=False, default=str) + "\n"
+                for record in iter_json_records(dataset.file_path)
+            )
+        
+        try:
+            if dataset.segments:
+                opened = self._open_segments(dataset.segments)
+            else:
+                opened = [(open(dataset.file_path, 'rb'), None)]
+        except FileNotFoundError:
+            return None
+        
+        return self._iter_opened_lines(opened)
+    
+    def link_segments(self, dataset_id: str, dest_base: str, ref: str) -> Optional[Dict[str, Any]]:
+        """
+        Hardlink a ready dataset's stored data next to dest_base and reference it with ``ref``
+        
+        Nothing is re-hashed or copied: the links point at this store's
+        blobs, which stay alive until release_segments is called with the
+        same ref. A dataset stored as one whole block is linked as
+        {dest_base}.jsonl; otherwise segment n is linked into the directory
+        dest_base as n.jsonl (its block), plus n.offsets (its manifest) when
+        it keeps only some of the block's lines.
+        
+        Returns:
+            {'path': linked file or directory, 'segments': segment dicts}, or None if the dataset is not ready
+        """
+        dataset = self.get_dataset(dataset_id)
+        if not dataset or dataset.status != 'ready':
+            return None
+        dataset = self._ensure_segments(dataset)
+        if not dataset.segments:
+            return None
+        
+        block = self._single_block(dataset.segments)
+        if block:
+            path = f"{dest_base}.jsonl"
+            links = [(block, path)]
+        else:
+            path = dest_base
+            os.makedirs(path, exist_ok=True)
+            links = []
+            for n, segment in enumerate(dataset.segments):
+                links.append((segment.sha256, os.path.join(path, f"{n}.jsonl")))
+                if segment.manifest:
+                    links.append((segment.manifest, os.path.join(path, f"{n}.offsets")))
+        
+        linked = []
+        for sha256, link_path in links:
+            if not self.store.link(sha256, link_path, ref):
+                # Deleted meanwhile
+                for linked_sha256 in linked:
+                    self.store.release(linked_sha256, ref)
+                return None
+            linked.append(sha256)
+        
+        return {'path': path, 'segments': [segment.dict() for segment in dataset.segments]}
+    
+    def release_segments(self, segments: List[Dict[str, Any]], ref: str):
+        """Drop a reference taken with link_segments (blobs nothing else uses are deleted)"""
+        for sha256 in self._segment_blobs([DatasetSegment(**segment) for segment in segments]):
+            self.store.release(sha256, ref)
+    
     def update_dataset(self, dataset_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update dataset metadata"""
         try:
@@ -262,18 +644,17 @@ class DatasetService:
                     'error': 'Dataset not found'
                 }
             
-            # Update allowed fields
-            if 'name' in updates:
-                dataset.name = updates['name']
-            if 'description' in updates:
-                dataset.description = updates['description']
-            if 'tags' in updates:
-                dataset.tags = updates['tags']
-            
-            dataset.last_modified = datetime.now().isoformat()
+            # Update allowed fields (only these, so a build in progress is not overwritten)
+            fields = {key: updates[key] for key in ('name', 'description', 'tags') if key in updates}
+            fields['last_modified'] = datetime.now().isoformat()
             
             # Save updated metadata
-            self._save_dataset_metadata(dataset)
+            dataset = self._update_dataset(dataset_id, fields)
+            if not dataset:
+                return {
+                    'success': False,
+                    'error': 'Dataset not found'
+                }
             
             return {
                 'success': True,
@@ -296,15 +677,18 @@ class DatasetService:
                     'error': 'Dataset not found'
                 }
             
-            # Delete data file
+            # Delete data file, and release the segments (kept while other versions share them)
             if os.path.exists(dataset.file_path):
                 os.remove(dataset.file_path)
+            for sha256 in self._segment_blobs(dataset.segments):
+                self.store.release(sha256, self._content_ref(dataset_id))
             
-            # Remove from index
-            datasets_index = self._load_datasets_index()
-            if dataset_id in datasets_index:
-                del datasets_index[dataset_id]
-                self._save_datasets_index(datasets_index)
+            # Remove from index (a build in progress stops at its next shard)
+            with self._index_lock:
+                datasets_index = self._load_datasets_index()
+                if dataset_id in datasets_index:
+                    del datasets_index[dataset_id]
+                    self._save_datasets_index(datasets_index)
             
             return {
                 'success': True,
@@ -317,6 +701,311 @@ class DatasetService:
                 'error': f'Failed to delete dataset: {str(e)}'
             }
     
+    def duplicate_dataset(self, dataset_id: str, new_name: str) -> Dict[str, Any]:
+        """
+        Copy a dataset without copying its data
+        
+        The duplicate references the original's segments in the content
+        store, so it is created instantly and takes no extra space.
+        """
+        try:
+            original = self.get_dataset(dataset_id)
+            if not original:
+                return {
+                    'success': False,
+                    'error': 'Original dataset not found'
+                }
+            if original.status != 'ready':
+                return {
+                    'success': False,
+                    'error': f'Dataset is not ready (status: {original.status})'
+                }
+            
+            original = self._ensure_segments(original)
+            if not original.segments:
+                return {
+                    'success': False,
+                    'error': 'Dataset data not accessible'
+                }
+            
+            new_dataset_id = f"dataset_{uuid.uuid4().hex[:12]}"
+            ref = self._content_ref(new_dataset_id)
+            for sha256 in self._segment_blobs(original.segments):
+                self.store.add_ref(sha256, ref)
+            
+            now = datetime.now().isoformat()
+            dataset = original.copy(update={
+                'dataset_id': new_dataset_id,
+                'name': new_name,
+                'description': f"Copy of {original.name}",
+                'tags': original.tags + ["duplicate"],
+                'file_path': str(self._dataset_file_path(new_dataset_id)),
+                'created_at': now,
+                'last_modified': now,
+                'usage_count': 0,
+                'last_used': None,
+                'version': 1,
+                'parent_id': original.dataset_id,
+                'root_id': None,
+                'derivation': {'type': 'duplicate'}
+            })
+            block = self._single_block(dataset.segments)
+            if block:
+                self.store.link(block, dataset.file_path, ref)
+            
+            self._save_dataset_metadata(dataset)
+            
+            return {
+                'success': True,
+                'dataset_id': new_dataset_id,
+                'dataset': dataset
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Failed to duplicate dataset: {str(e)}'
+            }
+    
+    def create_version(self, dataset_id: str, request: DatasetVersionRequest) -> Dict[str, Any]:
+        """
+        Derive a new version of a dataset by filtering, sampling and/or appending examples
+        
+        The parent is left unchanged and its blocks are shared, never copied:
+        a filtered or sampled version stores, per parent block, a manifest of
+        the byte offsets of the lines it keeps, and appended examples are
+        stored as one more segment. Like create_dataset, the version is
+        registered with status "processing" and written in the background.
+        """
+        try:
+            parent = self.get_dataset(dataset_id)
+            if not parent:
+                return {
+                    'success': False,
+                    'error': 'Dataset not found'
+                }
+            if parent.status != 'ready':
+                return {
+                    'success': False,
+                    'error': f'Dataset is not ready (status: {parent.status})'
+                }
+            if request.sample_size is None and not request.filters and not request.append_examples:
+                return {
+                    'success': False,
+                    'error': 'A version needs filters, a sample size or examples to append'
+                }
+            try:
+                self._compile_filters(request.filters)
+            except (ValueError, re.error) as e:
+                return {
+                    'success': False,
+                    'error': f'Invalid filter: {str(e)}'
+                }
+            
+            root_id = parent.root_id or parent.dataset_id
+            lineage = self._lineage(root_id)
+            version = max(existing.version for existing in lineage) + 1
+            
+            new_dataset_id = f"dataset_{uuid.uuid4().hex[:12]}"
+            now = datetime.now().isoformat()
+            dataset = parent.copy(update={
+                'dataset_id': new_dataset_id,
+                'name': request.name or f"{lineage[0].name} v{version}",
+                'description': request.description if request.description is not None else parent.description,
+                'tags': request.tags if request.tags is not None else parent.tags,
+                'file_path': str(self._dataset_file_path(new_dataset_id)),
+                'segments': [],
+                'status': 'processing',
+                'progress': 0.0,
+                'error': None,
+                'created_at': now,
+                'last_modified': now,
+                'usage_count': 0,
+                'last_used': None,
+                'version': version,
+                'parent_id': parent.dataset_id,
+                'root_id': root_id,
+                'derivation': {
+                    'type': 'version',
+                    'filters': [dataset_filter.dict() for dataset_filter in request.filters],
+                    'sample_size': request.sample_size,
+                    'seed': request.seed if request.sample_size is not None else None,
+                    'appended_examples': len(request.append_examples)
+                }
+            })
+            
+            self._save_dataset_metadata(dataset)
+            
+            self._build_executor.submit(self._build_version, new_dataset_id, parent.dataset_id, request)
+            
+            return {
+                'success': True,
+                'dataset_id': new_dataset_id,
+                'dataset': dataset
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Failed to create dataset version: {str(e)}'
+            }
+    
+    def _build_version(self, dataset_id: str, parent_id: str, request: DatasetVersionRequest):
+        """Write a derived version's segments (runs on the build executor)"""
+        ref = self._content_ref(dataset_id)
+        segments: List[DatasetSegment] = []
+        try:
+            parent = self.get_dataset(parent_id)
+            if parent:
+                parent = self._ensure_segments(parent)
+            if not parent or not parent.segments:
+                raise ValueError('Parent dataset data not accessible')
+            
+            file_size = 0
+            if request.filters or (request.sample_size is not None and request.sample_size < parent.total_examples):
+                for segment, size in self._select_examples(dataset_id, parent.segments, request):
+                    segments.append(segment)
+                    file_size += size
+            else:
+                for sha256 in self._segment_blobs(parent.segments):
+                    self.store.add_ref(sha256, ref)
+                segments.extend(parent.segments)
+                file_size += parent.file_size
+            
+            if request.append_examples:
+                # The appended examples are the only new data
+                segment = self._write_segment(dataset_id, (
+                    json.dumps(example.dict(), ensure_ascii=False, default=str) + "\n"
+                    for example in request.append_examples
+                ))
+                segments.append(segment)
+                file_size += self._segments_size([segment])
+            
+            dataset_file_path = self._dataset_file_path(dataset_id)
+            block = self._single_block(segments)
+            if block:
+                self.store.link(block, str(dataset_file_path), ref)
+            
+            ready = self._update_dataset(dataset_id, {
+                'status': 'ready',
+                'progress': 100.0,
+                'segments': [segment.dict() for segment in segments],
+                'total_examples': sum(segment.rows for segment in segments),
+                'rows_processed': sum(segment.rows for segment in segments),
+                'file_size': file_size,
+                'last_modified': datetime.now().isoformat()
+            })
+            if ready is None:
+                # Deleted while building
+                dataset_file_path.unlink(missing_ok=True)
+                for sha256 in self._segment_blobs(segments):
+                    self.store.release(sha256, ref)
+            
+        except Exception as e:
+            print(f"Error building dataset version {dataset_id}: {e}")
+            for sha256 in self._segment_blobs(segments):
+                self.store.release(sha256, ref)
+            self._update_dataset(dataset_id, {
+                'status': 'failed',
+                'error': f'Failed to create dataset version: {str(e)}'
+            })
+    
+    def _select_examples(self, dataset_id: str, segments: List[DatasetSegment],
+                         request: DatasetVersionRequest) -> Iterator[Tuple[DatasetSegment, int]]:
+        """
+        Segments keeping the parent examples that pass the filters, then the random sample
+        
+        One pass over the parent records the byte offset and length of every
+        matching line. Each parent block is then either reused whole, left out,
+        or referenced through a manifest of the offsets kept from it.
+        
+        Yields:
+            (segment, bytes of the examples it keeps)
+        """
+        ref = self._content_ref(dataset_id)
+        keep = self._compile_filters(request.filters)
+        
+        matches = []
+        for f, offsets in self._open_segments(segments):
+            with f:
+                kept = [
+                    (offset, len(line)) for offset, line in self._block_lines(f, offsets)
+                    if keep is None or keep(json.loads(line))
+                ]
+            matches.append(np.array(kept, dtype=np.int64).reshape(-1, 2))
+        
+        total = sum(len(kept) for kept in matches)
+        if request.sample_size is not None and request.sample_size < total:
+            chosen = np.sort(np.array(random.Random(request.seed).sample(range(total), request.sample_size), dtype=np.int64))
+            start = 0
+            for position, kept in enumerate(matches):
+                end = start + len(kept)
+                matches[position] = kept[chosen[np.searchsorted(chosen, start):np.searchsorted(chosen, end)] - start]
+                start = end
+        
+        for segment, kept in zip(segments, matches):
+            if not len(kept):
+                continue
+            size = int(kept[:, 1].sum())
+            if len(kept) == segment.rows and not segment.manifest:
+                # Every line of a whole block: shared as it is
+                self.store.add_ref(segment.sha256, ref)
+                yield segment, size
+            else:
+                manifest = self._write_manifest(dataset_id, kept[:, 0])
+                self.store.add_ref(segment.sha256, ref)
+                yield DatasetSegment(sha256=segment.sha256, rows=len(kept), manifest=manifest), size
+    
+    @staticmethod
+    def _compile_filters(filters: List[DatasetFilter]) -> Optional[Callable[[Dict[str, Any]], bool]]:
+        """A predicate on example records that is true when all filters match (None without filters)"""
+        if not filters:
+            return None
+        
+        def field_text(record: Dict[str, Any], field: str) -> str:
+            value = record.get(field, "")
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        
+        checks = []
+        for dataset_filter in filters:
+            operator, value = dataset_filter.operator, dataset_filter.value
+            if operator == FilterOperator.CONTAINS:
+                check = lambda text, value=value: value in text
+            elif operator == FilterOperator.NOT_CONTAINS:
+                check = lambda text, value=value: value not in text
+            elif operator == FilterOperator.EQUALS:
+                check = lambda text, value=value: text == value
+            elif operator == FilterOperator.NOT_EQUALS:
+                check = lambda text, value=value: text != value
+            elif operator == FilterOperator.MATCHES:
+                check = re.compile(value).search
+            else:
+                try:
+                    length = int(value)
+                except ValueError:
+                    raise ValueError(f"{operator.value} needs a whole number, got {value!r}")
+                if operator == FilterOperator.MIN_LENGTH:
+                    check = lambda text, length=length: len(text) >= length
+                else:
+                    check = lambda text, length=length: len(text) <= length
+            checks.append((dataset_filter.field, check))
+        
+        return lambda record: all(check(field_text(record, field)) for field, check in checks)
+    
+    def list_versions(self, dataset_id: str) -> Optional[List[ProcessedDataset]]:
+        """All versions in a dataset's lineage, oldest first (None if the dataset does not exist)"""
+        dataset = self.get_dataset(dataset_id)
+        if not dataset:
+            return None
+        return self._lineage(dataset.root_id or dataset.dataset_id)
+    
+    def _lineage(self, root_id: str) -> List[ProcessedDataset]:
+        datasets = [
+            ProcessedDataset(**metadata) for metadata in self._load_datasets_index().values()
+            if (metadata.get('root_id') or metadata['dataset_id']) == root_id
+        ]
+        return sorted(datasets, key=lambda dataset: (dataset.version, dataset.created_at))
+    
     def track_usage(self, dataset_id: str) -> Dict[str, Any]:
         """Track dataset usage for analytics"""
         try:
@@ -327,10 +1016,15 @@ class DatasetService:
                     'error': 'Dataset not found'
                 }
             
-            dataset.usage_count += 1
-            dataset.last_used = datetime.now().isoformat()
-            
-            self._save_dataset_metadata(dataset)
+            dataset = self._update_dataset(dataset_id, {
+                'usage_count': dataset.usage_count + 1,
+                'last_used': datetime.now().isoformat()
+            })
+            if not dataset:
+                return {
+                    'success': False,
+                    'error': 'Dataset not found'
+                }
             
             return {
                 'success': True,
@@ -345,62 +1039,6 @@ class DatasetService:
                 'error': f'Failed to track usage: {str(e)}'
             }
     
-    def _load_data_file(self, file_path: str):
-        """Load data from file - reuse logic from file_routes"""
-        import pandas as pd
-        import json
-        
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension == '.csv':
-            return pd.read_csv(file_path)
-        elif file_extension == '.json':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Convert complex nested objects to JSON strings before creating DataFrame
-            def serialize_complex_objects(obj):
-                if isinstance(obj, list):
-                    return [serialize_complex_objects(item) for item in obj]
-                elif isinstance(obj, dict):
-                    return {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in obj.items()}
-                else:
-                    return obj
-            
-            if isinstance(data, list):
-                # Process each record to handle nested objects
-                processed_data = [serialize_complex_objects(record) for record in data]
-                return pd.DataFrame(processed_data)
-            elif isinstance(data, dict):
-                # Check if it's a dict with list values (columnar format)
-                if data and all(isinstance(v, list) for v in data.values()):
-                    return pd.DataFrame(data)
-                else:
-                    # Single object, wrap in list and process
-                    processed_data = [serialize_complex_objects(data)]
-                    return pd.DataFrame(processed_data)
-            else:
-                raise ValueError("Invalid JSON format")
-        elif file_extension == '.jsonl':
-            data = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        data.append(json.loads(line))
-            return pd.DataFrame(data)
-        elif file_extension in ['.xlsx', '.xls']:
-            # Read Excel file, using first sheet by default
-            return pd.read_excel(file_path, sheet_name=0)
-        elif file_extension in ['.pkl', '.pickle']:
-            # Read pickle file using pandas
-            df = pd.read_pickle(file_path)
-            # Ensure it's a DataFrame
-            if not isinstance(df, pd.DataFrame):
-                raise ValueError("Pickle file must contain a pandas DataFrame")
-            return df
-        else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-    
     def _load_datasets_index(self) -> Dict[str, Any]:
         """Load datasets index from file"""
         try:
@@ -410,15 +1048,55 @@ class DatasetService:
             return {}
     
     def _save_datasets_index(self, index: Dict[str, Any]):
-        """Save datasets index to file"""
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
+        """Save datasets index to file (replaced atomically; readers do not take the lock)"""
+        self._write_index_file(self.metadata_file, index)
+    
+    @staticmethod
+    def _write_index_file(path: Path, index: Dict[str, Any]):
+        temp_file = path.with_name(path.name + ".tmp")
+        with open(temp_file, 'w', encoding='utf-8') as f:
             json.dump(index, f, indent=2, ensure_ascii=False)
+        os.replace(temp_file, path)
     
     def _save_dataset_metadata(self, dataset: ProcessedDataset):
         """Save dataset metadata to index"""
-        datasets_index = self._load_datasets_index()
-        datasets_index[dataset.dataset_id] = dataset.dict()
-        self._save_datasets_index(datasets_index)
+        with self._index_lock:
+            datasets_index = self._load_datasets_index()
+            datasets_index[dataset.dataset_id] = dataset.dict()
+            self._save_datasets_index(datasets_index)
+    
+    def _update_dataset(self, dataset_id: str, updates: Dict[str, Any]) -> Optional[ProcessedDataset]:
+        """Update some fields of a dataset's metadata; returns None if it no longer exists"""
+        with self._index_lock:
+            datasets_index = self._load_datasets_index()
+            if dataset_id not in datasets_index:
+                return None
+            datasets_index[dataset_id].update(updates)
+            self._save_datasets_index(datasets_index)
+            return ProcessedDataset(**datasets_index[dataset_id])
+    
+    def fail_interrupted_builds(self):
+        """
+        Mark datasets left "processing" by a previous server run as failed
+        
+        Called once from application startup, not from the constructor: build
+        worker processes must never run it while the server is building.
+        """
+        with self._index_lock:
+            datasets_index = self._load_datasets_index()
+            interrupted = [
+                dataset_id for dataset_id, metadata in datasets_index.items()
+                if metadata.get('status') == 'processing'
+            ]
+            for dataset_id in interrupted:
+                datasets_index[dataset_id].update({
+                    'status': 'failed',
+                    'error': 'Dataset build was interrupted by a server restart'
+                })
+                for temp_path in (self.datasets_dir / "data").glob(f"{dataset_id}.*.tmp"):
+                    temp_path.unlink(missing_ok=True)
+            if interrupted:
+                self._save_datasets_index(datasets_index)
     
     def _load_templates_index(self) -> Dict[str, Any]:
         """Load templates index from file"""
@@ -430,8 +1108,7 @@ class DatasetService:
     
     def _save_templates_index(self, index: Dict[str, Any]):
         """Save templates index to file"""
-        with open(self.templates_file, 'w', encoding='utf-8') as f:
-            json.dump(index, f, indent=2, ensure_ascii=False)
+        self._write_index_file(self.templates_file, index)
 
 
 # Global instance
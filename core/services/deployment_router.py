@@ -0,0 +1,256 @@
+"""
+Routing of prediction rows across running vLLM deployments.
+
+When one or more healthy deployments serve the model a prediction job asks
+for, each batch is split into shards that are sent to the replica with the
+fewest outstanding requests. A shard whose replica fails is retried on the
+replicas it has not tried yet, and results are put back in row order.
+
+One router is kept per model and shared by all of its jobs, so outstanding
+counts balance load across jobs; it is refreshed with the model's current
+deployments whenever a job starts. Completions are streamed, so a request
+still in flight when its job is cancelled is closed instead of running on.
+"""
+
+import asyncio
+import json
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from deployment_manager import DeploymentInfo, get_health_check_url
+from structured_decoding import is_structured_schema, to_json_schema
+
+# Concurrent HTTP requests kept in flight per replica
+REQUESTS_PER_REPLICA = 8
+
+# Per-host connection pools kept by a router's session
+MAX_REPLICA_POOLS = 32
+
+
+@dataclass
+class Replica:
+    """One deployment, its request workers and the number of rows currently sent to it"""
+    deployment: DeploymentInfo
+    outstanding: int = 0
+    retired: bool = False
+    executor: ThreadPoolExecutor = field(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=REQUESTS_PER_REPLICA)
+    )
+
+    @property
+    def base_url(self) -> str:
+        return get_health_check_url(self.deployment)
+
+
+class ReplicaError(Exception):
+    """A replica could not serve a request (connection error or non-200 response)"""
+
+
+class GenerationStopped(Exception):
+    """The job's stop event was set while its request was in flight"""
+
+
+class DeploymentRouter:
+    """Least-outstanding-requests router over the healthy deployments of one model"""
+
+    def __init__(self, deployments: List[DeploymentInfo], output_schema: Optional[Dict[str, Any]] = None,
+                 request_timeout: float = 120.0):
+        self.replicas: List[Replica] = []
+        self.request_timeout = request_timeout
+        self.guided_json: Optional[Dict[str, Any]] = None
+
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_REPLICA_POOLS, pool_maxsize=REQUESTS_PER_REPLICA)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self.refresh(deployments, output_schema)
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def refresh(self, deployments: List[DeploymentInfo], output_schema: Optional[Dict[str, Any]] = None):
+        """Route over deployments from now on, keeping the load counts of replicas that stay
+
+        Replicas that are no longer listed take no new rows and shut their
+        workers down once their outstanding requests finish.
+        """
+        with self._lock:
+            current = {replica.deployment.deployment_id: replica for replica in self.replicas}
+            replicas = []
+            for deployment in deployments:
+                replica = current.pop(deployment.deployment_id, None)
+                if replica is None:
+                    replica = Replica(deployment)
+                else:
+                    replica.deployment = deployment
+                replicas.append(replica)
+            for replica in current.values():
+                replica.retired = True
+                if replica.outstanding == 0:
+                    replica.executor.shutdown(wait=False)
+            self.replicas = replicas
+            self.guided_json = to_json_schema(output_schema) if is_structured_schema(output_schema) else None
+
+    def close(self):
+        with self._lock:
+            for replica in self.replicas:
+                replica.retired = True
+                replica.executor.shutdown(wait=False)
+            self.replicas = []
+        self._session.close()
+
+    async def generate_batch(self,
+                             messages: List[str],
+                             max_tokens: int = 150,
+                             temperature: float = 0.7,
+                             stop_event: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
+        """Generate responses for messages across the replicas; one result dict per message, in order"""
+        if not messages:
+            return []
+        if not self.replicas:
+            return [{"status": "error", "message": "No healthy deployment available", "response": ""}
+                    for _ in messages]
+
+        shard_size = math.ceil(len(messages) / len(self.replicas))
+        shards = [range(start, min(start + shard_size, len(messages)))
+                  for start in range(0, len(messages), shard_size)]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        await asyncio.gather(*(
+            self._run_shard(shard, messages, results, max_tokens, temperature, stop_event)
+            for shard in shards
+        ))
+        return results
+
+    async def _run_shard(self, shard: range, messages: List[str], results: List[Optional[Dict[str, Any]]],
+                         max_tokens: int, temperature: float, stop_event: Optional[threading.Event]):
+        """Send a shard to the least loaded replica, moving failed rows to untried replicas"""
+        pending = list(shard)
+        tried = set()
+        last_error = "No healthy deployment available"
+
+        while pending:
+            if stop_event is not None and stop_event.is_set():
+                last_error = "Generation stopped"
+                break
+            replica = self._acquire(tried, len(pending))
+            if replica is None:
+                break
+            tried.add(replica.deployment.deployment_id)
+
+            loop = asyncio.get_event_loop()
+            try:
+                responses = await asyncio.gather(*(
+                    loop.run_in_executor(replica.executor, self._complete, replica, messages[index],
+                                         max_tokens, temperature, stop_event)
+                    for index in pending
+                ), return_exceptions=True)
+            finally:
+                self._release(replica, len(pending))
+
+            failed = []
+            for index, response in zip(pending, responses):
+                if isinstance(response, GenerationStopped):
+                    results[index] = {"status": "error", "message": "Generation stopped", "response": ""}
+                elif isinstance(response, Exception):
+                    last_error = f"Deployment {replica.deployment.deployment_id} failed: {response}"
+                    failed.append(index)
+                else:
+                    results[index] = response
+            pending = failed
+            if failed:
+                print(f"Retrying {len(failed)} rows on another replica: {last_error}")
+
+        for index in pending:
+            results[index] = {"status": "error", "message": last_error, "response": ""}
+
+    def _acquire(self, exclude: set, rows: int) -> Optional[Replica]:
+        with self._lock:
+            candidates = [
+                replica for replica in self.replicas
+                if replica.deployment.deployment_id not in exclude and replica.deployment.status == "running"
+            ]
+            if not candidates:
+                return None
+            replica = min(candidates, key=lambda candidate: candidate.outstanding)
+            replica.outstanding += rows
+            return replica
+
+    def _release(self, replica: Replica, rows: int):
+        with self._lock:
+            replica.outstanding -= rows
+            if replica.retired and replica.outstanding == 0:
+                replica.executor.shutdown(wait=False)
+
+    def _complete(self, replica: Replica, message: str, max_tokens: int, temperature: float,
+                  stop_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """One streamed chat completion on a replica (runs on a worker thread)
+
+        The stream is read chunk by chunk; once stop_event is set the
+        response is closed, which drops the connection and makes vLLM abort
+        the request.
+        """
+        if stop_event is not None and stop_event.is_set():
+            raise GenerationStopped()
+
+        payload = {
+            "model": replica.deployment.model_path,
+            "messages": [{"role": "user", "content": message}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if self.guided_json is not None:
+            payload["guided_json"] = self.guided_json
+
+        try:
+            response = self._session.post(
+                f"{replica.base_url}/v1/chat/completions",
+                json=payload,
+                stream=True,
+                timeout=self.request_timeout
+            )
+        except requests.RequestException as e:
+            raise ReplicaError(str(e)) from e
+
+        with response:
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                # The request itself was rejected (e.g. prompt too long); another replica would too
+                return {"status": "error", "message": f"HTTP {response.status_code}: {response.text[:200]}", "response": ""}
+            if response.status_code != 200:
+                raise ReplicaError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+            content = []
+            usage: Dict[str, Any] = {}
+            try:
+                for line in response.iter_lines():
+                    if stop_event is not None and stop_event.is_set():
+                        raise GenerationStopped()
+                    if not line or not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get("usage") or usage
+                    for choice in chunk.get("choices") or []:
+                        content.append((choice.get("delta") or {}).get("content") or "")
+            except requests.RequestException as e:
+                raise ReplicaError(str(e)) from e
+
+        return {
+            "status": "success",
+            "message": "Response generated successfully",
+            "response": "".join(content),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "generated_tokens": usage.get("completion_tokens"),
+            "deployment_id": replica.deployment.deployment_id
+        }
@@ -0,0 +1,347 @@
+"""
+SQLite-backed store for prediction job metadata.
+
+Each job is one row, so a progress update rewrites a single job instead of
+the whole index. The database runs in WAL mode: readers never block the
+writer, and concurrent writers (several running jobs, or several server
+processes) serialize on SQLite's own lock instead of overwriting each
+other's copy of a shared JSON file.
+
+Per-job result aggregates are stored in their own columns, and triggers
+keep a (model_id, status) rollup table in step with every insert, update
+and delete. Dashboards read the rollups, whose size depends on the number
+of models rather than the number of jobs.
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [10, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Aggregate columns shared by prediction_jobs and prediction_rollups
+_STAT_COLUMNS = [
+    "result_count",
+    "error_count",
+    "confidence_count",
+    "confidence_sum",
+    "processing_time_count",
+    "processing_time_sum",
+]
+
+
+def _text(value: Any) -> str:
+    """Column value for enums and plain values alike"""
+    return str(getattr(value, "value", value))
+
+
+def _latency_bucket(ms: float) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if ms <= bound:
+            return f"<={bound}ms"
+    return f">{LATENCY_BUCKETS_MS[-1]}ms"
+
+
+def summarize_results(results: Iterable[Any]) -> Dict[str, Any]:
+    """Aggregate prediction results (models or dicts) into job statistics"""
+    stats = {
+        "result_count": 0,
+        "error_count": 0,
+        "confidence_count": 0,
+        "confidence_sum": 0.0,
+        "confidence_min": None,
+        "confidence_max": None,
+        "processing_time_count": 0,
+        "processing_time_sum": 0.0,
+        "processing_time_min": None,
+        "processing_time_max": None,
+        "latency_histogram": {},
+        "deduplicated_count": 0,
+        "dedup_ratio": None,
+    }
+
+    for result in results:
+        get = result.get if isinstance(result, dict) else lambda name: getattr(result, name, None)
+        stats["result_count"] += 1
+        if get("error_message"):
+            stats["error_count"] += 1
+        if get("deduplicated"):
+            stats["deduplicated_count"] += 1
+
+        for name, value in (("confidence", get("confidence")), ("processing_time", get("processing_time_ms"))):
+            if value is None:
+                continue
+            stats[f"{name}_count"] += 1
+            stats[f"{name}_sum"] += value
+            if stats[f"{name}_min"] is None or value < stats[f"{name}_min"]:
+                stats[f"{name}_min"] = value
+            if stats[f"{name}_max"] is None or value > stats[f"{name}_max"]:
+                stats[f"{name}_max"] = value
+
+        processing_time = get("processing_time_ms")
+        if processing_time is not None:
+            bucket = _latency_bucket(processing_time)
+            stats["latency_histogram"][bucket] = stats["latency_histogram"].get(bucket, 0) + 1
+
+    if stats["result_count"]:
+        stats["dedup_ratio"] = round(stats["deduplicated_count"] / stats["result_count"], 4)
+    return stats
+
+
+class PredictionJobStore:
+    """Persists prediction jobs as JSON documents with indexed lookup columns"""
+
+    def __init__(self, db_path: Union[str, Path], legacy_index_file: Optional[Union[str, Path]] = None):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.db_path,
+            timeout=30.0,
+            check_same_thread=False,
+            isolation_level=None  # autocommit; transactions are explicit
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._initialize()
+
+        if legacy_index_file is not None:
+            self._import_legacy_index(Path(legacy_index_file))
+
+    def _initialize(self):
+        rollup_columns = ",\n".join(f"{column} REAL NOT NULL DEFAULT 0" for column in _STAT_COLUMNS)
+
+        def rollup_delta(row: str, sign: str) -> str:
+            """Upsert adding (sign '+') or removing (sign '-') one job row from its rollup"""
+            values = ", ".join(f"{sign}COALESCE({row}.{column}, 0)" for column in _STAT_COLUMNS)
+            updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in _STAT_COLUMNS)
+            return f"""
+                INSERT INTO prediction_rollups (model_id, status, jobs, total_rows, {", ".join(_STAT_COLUMNS)})
+                VALUES ({row}.model_id, {row}.status, {sign}1, {sign}COALESCE({row}.total_rows, 0), {values})
+                ON CONFLICT (model_id, status) DO UPDATE SET
+                    jobs = jobs + excluded.jobs,
+                    total_rows = total_rows + excluded.total_rows,
+                    {updates};
+            """
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=30000")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS prediction_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    model_id TEXT NOT NULL,
+                    file_id TEXT,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_prediction_jobs_status ON prediction_jobs (status);
+                CREATE INDEX IF NOT EXISTS idx_prediction_jobs_model_id ON prediction_jobs (model_id);
+                CREATE INDEX IF NOT EXISTS idx_prediction_jobs_created_at ON prediction_jobs (created_at);
+            """)
+
+            # Aggregate columns (added to databases created before they existed)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(prediction_jobs)")}
+            for column in ["total_rows"] + _STAT_COLUMNS:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE prediction_jobs ADD COLUMN {column} REAL")
+
+            has_rollups = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prediction_rollups'"
+            ).fetchone() is not None
+
+            self._conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS prediction_rollups (
+                    model_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    jobs INTEGER NOT NULL DEFAULT 0,
+                    total_rows REAL NOT NULL DEFAULT 0,
+                    {rollup_columns},
+                    PRIMARY KEY (model_id, status)
+                );
+                CREATE TRIGGER IF NOT EXISTS prediction_jobs_rollup_insert
+                AFTER INSERT ON prediction_jobs BEGIN {rollup_delta("NEW", "+")} END;
+                CREATE TRIGGER IF NOT EXISTS prediction_jobs_rollup_delete
+                AFTER DELETE ON prediction_jobs BEGIN {rollup_delta("OLD", "-")} END;
+                CREATE TRIGGER IF NOT EXISTS prediction_jobs_rollup_update
+                AFTER UPDATE ON prediction_jobs BEGIN {rollup_delta("OLD", "-")} {rollup_delta("NEW", "+")} END;
+            """)
+
+            if not has_rollups:
+                # First run with rollups: seed them from the jobs already stored
+                sums = ", ".join(f"COALESCE(SUM({column}), 0)" for column in _STAT_COLUMNS)
+                self._conn.execute(f"""
+                    INSERT INTO prediction_rollups (model_id, status, jobs, total_rows, {", ".join(_STAT_COLUMNS)})
+                    SELECT model_id, status, COUNT(*), COALESCE(SUM(total_rows), 0), {sums}
+                    FROM prediction_jobs GROUP BY model_id, status
+                """)
+
+    def _import_legacy_index(self, index_file: Path):
+        """One-time migration from the old jobs_index.json"""
+        if not index_file.exists():
+            return
+
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                jobs_index = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading legacy jobs index {index_file}: {e}")
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for job_data in jobs_index.values():
+                    # Old indexes embedded the results; keep only their aggregates
+                    results = job_data.pop("results", None)
+                    if results and not job_data.get("stats"):
+                        job_data["stats"] = summarize_results(results)
+                    self._upsert(job_data, replace=False)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        index_file.rename(index_file.with_name(index_file.name + ".migrated"))
+
+    @staticmethod
+    def _row(job_data: Dict[str, Any]):
+        """Column names and values of one job row"""
+        stats = job_data.get("stats") or {}
+        columns = ["job_id", "model_id", "file_id", "status", "created_at", "updated_at", "data", "total_rows"] + _STAT_COLUMNS
+        values = [
+            job_data["job_id"],
+            job_data["model_id"],
+            job_data.get("file_id"),
+            _text(job_data.get("status")),
+            str(job_data.get("created_at")),
+            datetime.now().isoformat(),
+            json.dumps(job_data, default=str),
+            job_data.get("total_rows"),
+        ] + [stats.get(column) for column in _STAT_COLUMNS]
+        return columns, values
+
+    def _upsert(self, job_data: Dict[str, Any], replace: bool = True):
+        columns, values = self._row(job_data)
+
+        # An UPSERT (not INSERT OR REPLACE) so the update trigger sees the old row
+        conflict = (
+            "DO UPDATE SET " + ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+            if replace else "DO NOTHING"
+        )
+        self._conn.execute(
+            f"""INSERT INTO prediction_jobs ({", ".join(columns)})
+                VALUES ({", ".join("?" for _ in columns)})
+                ON CONFLICT (job_id) {conflict}""",
+            values
+        )
+
+    def save(self, job_data: Dict[str, Any]):
+        """Insert or replace one job"""
+        with self._lock:
+            self._upsert(job_data)
+
+    def update(self, job_data: Dict[str, Any], unless_status: Iterable[str] = ()) -> bool:
+        """Replace a stored job unless its stored status is one of ``unless_status``
+
+        Never inserts, so a deleted job stays deleted. Returns False if
+        nothing was written.
+        """
+        columns, values = self._row(job_data)
+        query = (
+            f"UPDATE prediction_jobs SET {', '.join(f'{column} = ?' for column in columns[1:])} "
+            "WHERE job_id = ?"
+        )
+        params = values[1:] + [values[0]]
+        statuses = [_text(status) for status in unless_status]
+        if statuses:
+            query += f" AND status NOT IN ({', '.join('?' for _ in statuses)})"
+            params += statuses
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM prediction_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def list(self,
+             status: Optional[str] = None,
+             model_id: Optional[str] = None,
+             limit: Optional[int] = 50,
+             offset: int = 0) -> List[Dict[str, Any]]:
+        """Jobs matching the filters, newest first"""
+        where, params = self._filters(status, model_id)
+        query = f"SELECT data FROM prediction_jobs{where} ORDER BY created_at DESC"
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def count(self, status: Optional[str] = None, model_id: Optional[str] = None) -> int:
+        where, params = self._filters(status, model_id)
+        with self._lock:
+            row = self._conn.execute(f"SELECT COUNT(*) FROM prediction_jobs{where}", params).fetchone()
+        return row[0]
+
+    def rollups(self, model_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Aggregates per status, across all models or for one model"""
+        query = f"""
+            SELECT status, SUM(jobs) AS jobs, SUM(total_rows) AS total_rows,
+                   {", ".join(f"SUM({column}) AS {column}" for column in _STAT_COLUMNS)}
+            FROM prediction_rollups
+        """
+        params: List[Any] = []
+        if model_id:
+            query += " WHERE model_id = ?"
+            params.append(model_id)
+        query += " GROUP BY status"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {row["status"]: dict(row) for row in rows if row["jobs"]}
+
+    def models_used(self) -> int:
+        """Number of models with at least one stored job"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(DISTINCT model_id) FROM prediction_rollups WHERE jobs > 0"
+            ).fetchone()
+        return row[0]
+
+    def jobs_missing_stats(self, status: str) -> List[str]:
+        """Ids of jobs in ``status`` that have no stored aggregates yet"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM prediction_jobs WHERE status = ? AND result_count IS NULL",
+                (status,)
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM prediction_jobs WHERE job_id = ?", (job_id,))
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _filters(status: Optional[str], model_id: Optional[str]):
+        clauses = []
+        params: List[Any] = []
+        if status:
+            clauses.append("status = ?")
+            params.append(_text(status))
+        if model_id:
+            clauses.append("model_id = ?")
+            params.append(model_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
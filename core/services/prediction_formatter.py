@@ -0,0 +1,133 @@
+"""
+Per-model input formatting and output parsing for predictions.
+
+A ``ModelFormatter`` is compiled once from a model's ``ModelInfo`` (input
+schema, output schema, static instruction) and then applied to every row:
+the prompt is filled into precomputed section headers in the training
+order, and output fields are recovered with precompiled patterns.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Pattern, Tuple
+
+from models.prediction_models import ModelInfo
+
+DEFAULT_CONFIDENCE = 0.85
+
+# Schema fields that are formatted specially or are not model outputs
+INSTRUCTION_FIELD = "instruction"
+INPUT_FIELD = "input"
+UNSTRUCTURED_OUTPUT_FIELDS = ("response", "confidence")
+
+_CONFIDENCE_PATTERN = re.compile(r"confidence:\s*(\S+)", re.IGNORECASE)
+
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else ("" if value is None else str(value))
+
+
+class ModelFormatter:
+    """Compiled prompt template and output parser for one model"""
+
+    def __init__(self, model_info: ModelInfo):
+        input_schema = model_info.input_schema or {}
+        metadata = model_info.metadata or {}
+
+        self.static_instruction: str = _text(metadata.get("static_instruction", ""))
+        self.uses_dynamic_instruction = INSTRUCTION_FIELD in input_schema
+        self.uses_input = INPUT_FIELD in input_schema
+        # (field, section header) for the remaining input fields, in schema order
+        self.extra_sections: List[Tuple[str, str]] = [
+            (field, f"### {field.replace('_', ' ').title()}:\n")
+            for field in input_schema
+            if field not in (INSTRUCTION_FIELD, INPUT_FIELD)
+        ]
+
+        self.model_version = model_info.version or "1.0"
+        self.structured_fields: List[str] = [
+            field for field in (model_info.output_schema or {})
+            if field not in UNSTRUCTURED_OUTPUT_FIELDS
+        ]
+        # Output key -> patterns tried in order when the response is not JSON
+        self.output_patterns: Dict[str, List[Pattern]] = {
+            field: [
+                re.compile(pattern, re.IGNORECASE)
+                for pattern in (
+                    rf"{re.escape(field)}:\s*([^\n]+)",
+                    rf'"{re.escape(field)}":\s*"([^"]+)"',
+                    rf"'{re.escape(field)}':\s*'([^']+)'",
+                    rf"{re.escape(field.replace('_', ' '))}:\s*([^\n]+)",
+                )
+            ]
+            for field in self.structured_fields
+        }
+
+    def format_input(self, input_data: Dict[str, Any]) -> str:
+        """Build the prompt in the same format used during training"""
+        parts = []
+
+        # Dynamic instruction takes precedence, falling back to the static one
+        instruction = ""
+        if self.uses_dynamic_instruction:
+            instruction = _text(input_data.get(INSTRUCTION_FIELD, ""))
+        instruction = instruction or self.static_instruction
+        if instruction.strip():
+            parts.append("### Instruction:\n" + instruction)
+
+        if self.uses_input:
+            input_text = _text(input_data.get(INPUT_FIELD, ""))
+            if input_text.strip():
+                parts.append("### Input:\n" + input_text)
+
+        for field, header in self.extra_sections:
+            value = input_data.get(field)
+            if value and _text(value).strip():
+                parts.append(header + _text(value))
+
+        parts.append("### Response:")
+        return "\n\n".join(parts)
+
+    def parse_output(self, response: str) -> Dict[str, Any]:
+        """Parse a model response into the model's output fields"""
+        confidence = self._extract_confidence(response)
+
+        if self.structured_fields:
+            try:
+                parsed_json = json.loads(response)
+                if isinstance(parsed_json, dict):
+                    parsed_json.setdefault("confidence", confidence)
+                    return parsed_json
+            except json.JSONDecodeError:
+                pass
+
+            # Not JSON: look for "field: value" style patterns in the text
+            result: Dict[str, Any] = {"confidence": confidence}
+            for field, patterns in self.output_patterns.items():
+                for pattern in patterns:
+                    match = pattern.search(response)
+                    if match:
+                        result[field] = match.group(1).strip()
+                        break
+
+            if len(result) > 1:
+                return result
+
+        return self.fallback_output(response, confidence)
+
+    def fallback_output(self, response: str, confidence: float = DEFAULT_CONFIDENCE) -> Dict[str, Any]:
+        return {
+            "response": response,
+            "confidence": confidence,
+            "model_version": self.model_version
+        }
+
+    @staticmethod
+    def _extract_confidence(response: str) -> float:
+        match = _CONFIDENCE_PATTERN.search(response)
+        if match:
+            try:
+                return float(match.group(1).replace("%", "")) / 100
+            except ValueError:
+                pass
+        return DEFAULT_CONFIDENCE
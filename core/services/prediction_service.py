@@ -4,21 +4,112 @@ Prediction service for managing model inference and prediction jobs.
 
 import os
 import json
+import hashlib
 import uuid
 import asyncio
+import numpy as np
 import pandas as pd
-import re
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, Iterator, List, Any, Optional, Tuple, Union
 from pathlib import Path
 import time
+import threading
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
 
 from models.prediction_models import (
-    ModelInfo, PredictionJob, PredictionResult, PredictionMapping,
+    ModelInfo, PredictionJob, PredictionJobStats, PredictionResult, PredictionMapping,
     PredictionStatus, ModelStatus, ValidationResult
 )
 from file_manager import file_manager
 from model_manager import model_manager
+from services.job_store import PredictionJobStore, summarize_results
+from services.prediction_formatter import ModelFormatter
+from services.deployment_router import DeploymentRouter
+from deployment_manager import deployment_manager
+
+# Job statuses a job never leaves
+TERMINAL_STATUSES = (PredictionStatus.COMPLETED, PredictionStatus.FAILED, PredictionStatus.CANCELLED)
+
+# Bytes per entry in a results offset index (array typecode 'Q')
+RESULT_OFFSET_SIZE = array('Q').itemsize
+
+# Distinct inputs per job whose predictions are kept for reuse by repeated rows
+DEDUP_CACHE_SIZE = 10_000
+
+
+@dataclass
+class JobControl:
+    """Cooperative stop signals for one running prediction job"""
+    cancel: threading.Event = field(default_factory=threading.Event)
+    pause: threading.Event = field(default_factory=threading.Event)
+    # Set when the job was deleted while running, so the task must not save it again
+    deleted: bool = False
+    task: Optional[asyncio.Task] = None
+
+
+class DedupCache:
+    """Recent predictions by mapped-input hash, bounded (least recently used entries go first)
+    
+    Only what a duplicate row copies is kept (source row, prediction,
+    confidence, model version), not the source row's inputs, so a job's
+    memory stays bounded however many distinct rows its file has.
+    """
+    
+    def __init__(self, max_entries: int = DEDUP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, Any, Optional[float], Optional[str]]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[PredictionResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        row_index, prediction, confidence, model_version = entry
+        return PredictionResult(
+            row_index=row_index,
+            input_data={},
+            prediction=prediction,
+            confidence=confidence,
+            model_version=model_version
+        )
+    
+    def put(self, key: str, result: PredictionResult):
+        self._entries[key] = (result.row_index, result.prediction, result.confidence, result.model_version)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+@dataclass
+class PreparedInputs:
+    """Model inputs for every row of a job, preprocessed column-wise"""
+    columns: Dict[str, List[Any]]
+    # Per model field: rows whose missing value is left out of the input ("skip")
+    skipped: Dict[str, np.ndarray]
+    # Per row: preprocessing error message, or None
+    errors: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.errors)
+    
+    def rows(self, start: int, stop: int) -> Tuple[List[Dict[str, Any]], Dict[int, str]]:
+        """Input dicts for rows [start, stop) and the batch positions that failed preprocessing"""
+        inputs = []
+        for row in range(start, stop):
+            inputs.append({
+                model_field: column[row]
+                for model_field, column in self.columns.items()
+                if not (model_field in self.skipped and self.skipped[model_field][row])
+            })
+        
+        batch_errors = self.errors[start:stop]
+        row_errors = {
+            int(position): batch_errors[position]
+            for position in np.flatnonzero(np.not_equal(batch_errors, None))
+        }
+        return inputs, row_errors
 
 
 class PredictionService:
@@ -34,40 +125,44 @@ class PredictionService:
         (self.jobs_dir / "active").mkdir(exist_ok=True)
         (self.jobs_dir / "completed").mkdir(exist_ok=True)
         
-        self.jobs_index_file = self.jobs_dir / "jobs_index.json"
         self.models_index_file = self.models_dir / "models_index.json"
         
+        # Job metadata lives in SQLite; an old jobs_index.json is imported once
+        self.job_store = PredictionJobStore(
+            self.jobs_dir / "jobs.db",
+            legacy_index_file=self.jobs_dir / "jobs_index.json"
+        )
+        self._backfill_job_stats()
+        
         # Initialize index files
-        if not self.jobs_index_file.exists():
-            self._save_jobs_index({})
         if not self.models_index_file.exists():
             self._save_models_index({})
         
         # Cache for loaded models
         self._model_cache = {}
         self._running_jobs = {}
+        self._job_controls: Dict[str, JobControl] = {}
+        
+        # In-memory copy of the models index, reloaded only when the file changes
+        self._models_index_cache: Dict[str, Any] = {}
+        self._models_index_signature = None
+        self._model_infos: Optional[Dict[str, ModelInfo]] = None
+        # Compiled input formatters / output parsers by model ID (dropped with the parsed index)
+        self._formatters: Dict[str, ModelFormatter] = {}
+        self._path_exists_cache: Dict[str, tuple] = {}
+        self._path_exists_ttl = 5.0
+        # Deployment routers by model path, shared by every job of the model
+        self._routers: Dict[str, DeploymentRouter] = {}
+        self._routers_lock = threading.Lock()
     
     def get_available_models(self) -> List[ModelInfo]:
         """Get list of available trained models"""
         try:
-            models_index = self._load_models_index()
             models = []
-            
-            for model_id, model_data in models_index.items():
-                try:
-                    model = ModelInfo(**model_data)
-                    # Check if model file exists
-                    if model.model_path and os.path.exists(model.model_path):
-                        model.status = ModelStatus.READY
-                    elif model.model_path == "/fake/path/for/testing":
-                        # Special case for test models
-                        model.status = ModelStatus.READY
-                    else:
-                        model.status = ModelStatus.UNAVAILABLE
-                    models.append(model)
-                except Exception as e:
-                    print(f"Error loading model {model_id}: {e}")
-                    continue
+            for model_info in self._get_model_infos().values():
+                model = model_info.copy()
+                model.status = self._resolve_model_status(model)
+                models.append(model)
             
             return models
         except Exception as e:
@@ -77,26 +172,69 @@ class PredictionService:
     def get_model(self, model_id: str) -> Optional[ModelInfo]:
         """Get details of a specific model"""
         try:
-            models_index = self._load_models_index()
-            if model_id not in models_index:
+            model_info = self._get_model_infos().get(model_id)
+            if model_info is None:
                 return None
             
-            model = ModelInfo(**models_index[model_id])
-            
-            # Check model availability
-            if model.model_path and os.path.exists(model.model_path):
-                model.status = ModelStatus.READY
-            elif model.model_path == "/fake/path/for/testing":
-                # Special case for test models
-                model.status = ModelStatus.READY
-            else:
-                model.status = ModelStatus.UNAVAILABLE
-            
+            model = model_info.copy()
+            model.status = self._resolve_model_status(model)
             return model
         except Exception as e:
             print(f"Error getting model {model_id}: {e}")
             return None
     
+    @staticmethod
+    def _decoding_schema(model_info: ModelInfo) -> Optional[Dict[str, Any]]:
+        """Output schema to constrain decoding with, or None for free decoding (the default)"""
+        return dict(model_info.output_schema) if model_info.constrained_decoding else None
+    
+    def get_decoding_schema_for_path(self, model_path: str) -> Optional[Dict[str, Any]]:
+        """Decoding schema (see _decoding_schema) of the model stored at (or named) model_path"""
+        if not model_path:
+            return None
+        model_name = os.path.basename(os.path.normpath(model_path))
+        for model_info in self._get_model_infos().values():
+            if model_info.model_path and (
+                model_info.model_path == model_path
+                or os.path.basename(os.path.normpath(model_info.model_path)) == model_name
+            ):
+                return self._decoding_schema(model_info)
+        return None
+    
+    def _get_model_infos(self) -> Dict[str, ModelInfo]:
+        """Parsed models index, rebuilt only when the index file changes"""
+        models_index = self._load_models_index()
+        if self._model_infos is None:
+            model_infos = {}
+            for model_id, model_data in models_index.items():
+                try:
+                    model_infos[model_id] = ModelInfo(**model_data)
+                except Exception as e:
+                    print(f"Error loading model {model_id}: {e}")
+                    continue
+            self._model_infos = model_infos
+        return self._model_infos
+    
+    def _resolve_model_status(self, model: ModelInfo) -> ModelStatus:
+        """Check model availability"""
+        if model.model_path == "/fake/path/for/testing":
+            # Special case for test models
+            return ModelStatus.READY
+        if model.model_path and self._model_path_exists(model.model_path):
+            return ModelStatus.READY
+        return ModelStatus.UNAVAILABLE
+    
+    def _model_path_exists(self, model_path: str) -> bool:
+        """os.path.exists with a short-lived cache so listings do not stat every model"""
+        now = time.monotonic()
+        cached = self._path_exists_cache.get(model_path)
+        if cached and now - cached[0] < self._path_exists_ttl:
+            return cached[1]
+        
+        exists = os.path.exists(model_path)
+        self._path_exists_cache[model_path] = (now, exists)
+        return exists
+    
     def register_model(self, model_info: ModelInfo) -> bool:
         """Register a new trained model for predictions"""
         try:
@@ -108,6 +246,15 @@ class PredictionService:
             print(f"Error registering model: {e}")
             return False
     
+    def set_constrained_decoding(self, model_id: str, enabled: bool) -> Optional[ModelInfo]:
+        """Opt a model in to (or out of) decoding under its output schema"""
+        models_index = self._load_models_index()
+        if model_id not in models_index:
+            return None
+        models_index[model_id]['constrained_decoding'] = enabled
+        self._save_models_index(models_index)
+        return ModelInfo(**models_index[model_id])
+    
     
     async def start_prediction(
         self, 
@@ -136,10 +283,13 @@ class PredictionService:
             if not validation.is_valid:
                 raise ValueError(f"Invalid mapping: {'; '.join(validation.issues)}")
             
-            # Load data to get row count
-            file_path = file_manager.get_file_path(file_id)
-            data = self._load_data_file(file_path)
-            total_rows = len(data)
+            # Row count, from the Parquet copy's metadata when there is one
+            columnar = file_manager.get_columnar_info(file_id)
+            if columnar:
+                total_rows = columnar['rows']
+            else:
+                file_path = file_manager.get_file_path(file_id)
+                total_rows = len(file_manager.load_dataframe(file_path))
             
             # Create prediction job
             job_id = f"pred_{uuid.uuid4().hex[:12]}"
@@ -159,7 +309,7 @@ class PredictionService:
             self._save_job(job)
             
             # Start processing in background
-            asyncio.create_task(self._process_prediction_job(job))
+            self._start_job_task(job)
             
             return job
             
@@ -167,138 +317,324 @@ class PredictionService:
             print(f"Error starting prediction: {e}")
             return None
     
-    async def _process_prediction_job(self, job: PredictionJob):
-        """Process a prediction job in the background"""
+    def _get_router(self, model_info: ModelInfo) -> Optional[DeploymentRouter]:
+        """The model's shared router, refreshed with its running deployments, or None if it has none"""
+        if not model_info.model_path:
+            return None
+        deployments = deployment_manager.get_healthy_deployments(model_info.model_path)
+        key = os.path.normpath(model_info.model_path)
+        with self._routers_lock:
+            router = self._routers.get(key)
+            if router is None:
+                if not deployments:
+                    return None
+                router = DeploymentRouter(deployments, self._decoding_schema(model_info))
+                self._routers[key] = router
+            else:
+                router.refresh(deployments, self._decoding_schema(model_info))
+            return router if deployments else None
+    
+    def _start_job_task(self, job: PredictionJob):
+        """Run a job (from its checkpoint) as a background task with its own control signals"""
+        control = JobControl()
+        self._job_controls[job.job_id] = control
+        control.task = asyncio.create_task(self._process_prediction_job(job, control))
+    
+    async def _process_prediction_job(self, job: PredictionJob, control: "JobControl"):
+        """Process a prediction job in the background
+        
+        Cancel and pause requests are checked between batches. Each finished
+        batch is appended to the job's partial results file before the
+        checkpoint advances, so a paused job resumes where it stopped.
+        Rows are sharded across the model's running vLLM deployments when
+        it has any; otherwise the model is loaded into this process.
+        """
+        router: Optional[DeploymentRouter] = None
         try:
             # Update job status
             job.status = PredictionStatus.RUNNING
-            job.started_at = datetime.now()
-            self._save_job(job)
+            job.started_at = job.started_at or datetime.now()
+            self._update_job(job, control)
             self._running_jobs[job.job_id] = job
             
-            # Load model
-            model = self._load_model(job.model_id)
+            # Shard rows across running deployments of the model if there are any,
+            # otherwise load it into this process
+            model = self.get_model(job.model_id)
+            router = self._get_router(model) if model else None
+            if router is not None:
+                print(f"Routing job {job.job_id} across {len(router)} deployment(s)")
+                self._get_formatter(model)
+            else:
+                model = self._load_model(job.model_id)
 
             if not model:
                 raise Exception(f"Failed to load model {job.model_id}")
             
-            # Load data
+            # Load only the mapped columns
             file_path = file_manager.get_file_path(job.file_id)
-            data = self._load_data_file(file_path)
+            data = file_manager.load_dataframe(file_path, columns=sorted(set(job.mapping.input_columns.values())))
             
-            # Process predictions in batches
-            batch_size = job.mapping.preprocessing_options.batch_size or 32
-            results = []
+            # Drop partial results past the checkpoint (or all of them on a fresh start)
+            self._trim_partial_results(job.job_id, job.checkpoint_row)
+            
+            # Preprocess every input column once for the whole job
+            prepared = self._preprocess_inputs(data, job.mapping)
             
-            for i in range(0, len(data), batch_size):
-                batch = data.iloc[i:i + batch_size]
+            # Recent predictions by mapped-input hash, reused for rows that repeat an earlier payload
+            dedup_cache = DedupCache()
+            
+            # Process predictions in batches (one batch per replica when routed)
+            batch_size = job.mapping.preprocessing_options.batch_size or 32
+            if router is not None:
+                batch_size *= len(router)
+            
+            for i in range(job.checkpoint_row, len(prepared), batch_size):
+                if control.cancel.is_set():
+                    break
+                if control.pause.is_set():
+                    job.status = PredictionStatus.PAUSED
+                    self._update_job(job, control)
+                    return
+                
+                batch_end = min(i + batch_size, len(prepared))
                 batch_results = await self._process_batch(
-                    batch, model, job.mapping, i
+                    prepared, model, i, batch_end, stop_event=control.cancel, router=router,
+                    dedup_cache=dedup_cache
                 )
-                results.extend(batch_results)
+                
+                # A cancelled batch was cut short mid-generation; its rows are discarded
+                if control.cancel.is_set():
+                    break
+                
+                self._append_partial_results(job.job_id, batch_results)
                 
                 # Update progress
-                job.processed_rows = min(i + batch_size, len(data))
+                job.checkpoint_row = batch_end
+                job.processed_rows = job.checkpoint_row
                 job.progress = (job.processed_rows / job.total_rows) * 100
-                self._save_job(job)
-                
-                # Small delay to prevent overwhelming the system
-                await asyncio.sleep(0.1)
+                self._update_job(job, control)
+            
+            if control.cancel.is_set():
+                # Cancelled jobs are never resumed, so their partial results are not kept;
+                # the canceller (or deleter) has already recorded the job's status
+                self._remove_partial_results(job.job_id)
+                return
             
             # Complete job
             job.status = PredictionStatus.COMPLETED
             job.completed_at = datetime.now()
-            job.results = results
             job.progress = 100.0
             job.processed_rows = job.total_rows
+            job.checkpoint_row = job.total_rows
             
-            # Save final results
-            self._save_job(job)
-            self._save_job_results(job.job_id, results)
-            
-            # Remove from running jobs
-            if job.job_id in self._running_jobs:
-                del self._running_jobs[job.job_id]
+            # Save final results (before the job row flips to completed)
+            self._finalize_job_results(job.job_id)
+            job.stats = PredictionJobStats(**summarize_results(self.iter_job_results(job.job_id)))
+            self._update_job(job, control)
             
         except Exception as e:
-            # Handle job failure
+            # Handle job failure (a cancelled or deleted job's row is left to the canceller)
             job.status = PredictionStatus.FAILED
             job.error_message = str(e)
             job.completed_at = datetime.now()
-            self._save_job(job)
-            
-            if job.job_id in self._running_jobs:
-                del self._running_jobs[job.job_id]
+            self._update_job(job, control)
             
             print(f"Prediction job {job.job_id} failed: {e}")
+        
+        finally:
+            self._running_jobs.pop(job.job_id, None)
+            if self._job_controls.get(job.job_id) is control:
+                del self._job_controls[job.job_id]
     
     async def _process_batch(
         self, 
-        batch: pd.DataFrame, 
+        prepared: PreparedInputs, 
         model: Any, 
-        mapping: PredictionMapping, 
-        start_index: int
+        start_index: int,
+        stop_index: int,
+        stop_event: Optional[threading.Event] = None,
+        router: Optional[DeploymentRouter] = None,
+        dedup_cache: Optional[DedupCache] = None
     ) -> List[PredictionResult]:
-        """Process a batch of data for predictions"""
-        results = []
+        """Process a batch of preprocessed rows for predictions
+        
+        Every row is submitted in one batched generate call that runs on a
+        worker thread, so the event loop stays free while the model works.
+        With a router, the batch is sharded across the model's deployments.
+        
+        Rows whose mapped inputs repeat an earlier row (in this batch, or in
+        ``dedup_cache``, recent earlier batches of the job) are not sent to the
+        model; they get a copy of that row's result marked as deduplicated.
+        """
+        inputs, row_errors = prepared.rows(start_index, stop_index)
+        results: List[Optional[PredictionResult]] = [None] * len(inputs)
+        
+        for position, error in row_errors.items():
+            results[position] = PredictionResult(
+                row_index=start_index + position,
+                input_data={},
+                prediction=None,
+                error_message=error
+            )
         
-        for idx, row in batch.iterrows():
+        positions = []
+        messages = []
+        keys: Dict[int, str] = {}
+        first_in_batch: Dict[str, int] = {}
+        duplicates: List[Tuple[int, int]] = []
+        for position, input_data in enumerate(inputs):
+            if position in row_errors:
+                continue
+            
+            key = self._payload_key(input_data)
+            source = dedup_cache.get(key) if dedup_cache is not None else None
+            if source is not None:
+                results[position] = self._duplicate_result(source, start_index + position, input_data)
+                continue
+            if key in first_in_batch:
+                duplicates.append((position, first_in_batch[key]))
+                continue
+            first_in_batch[key] = position
+            keys[position] = key
+            
             try:
-                start_time = time.time()
-                
-                # Prepare input data
-                input_data = {}
-                for model_field, file_column in mapping.input_columns.items():
-                    if file_column in row:
-                        value = row[file_column]
-                        
-                        # Handle missing values
-                        if pd.isna(value) or value is None:
-                            if mapping.preprocessing_options.handle_missing_values == "skip":
-                                continue
-                            elif mapping.preprocessing_options.handle_missing_values == "error":
-                                raise ValueError(f"Missing value in column {file_column}")
-                            else:  # default
-                                value = mapping.preprocessing_options.default_values.get(
-                                    model_field, ""
-                                )
-                        
-                        # Text normalization
-                        if mapping.preprocessing_options.normalize_text and isinstance(value, str):
-                            value = value.strip()
-                        
-                        input_data[model_field] = value
-                
-                # Make prediction
-                prediction = self._make_prediction(model, input_data)
-                
-                processing_time = (time.time() - start_time) * 1000
-                
-                result = PredictionResult(
-                    row_index=start_index + len(results),
-                    input_data=input_data,
-                    prediction=prediction,
-                    processing_time_ms=processing_time
-                )
-                
-                # Extract confidence if available
-                if isinstance(prediction, dict) and 'confidence' in prediction:
-                    result.confidence = prediction['confidence']
-                
-                results.append(result)
-                
+                messages.append(self._format_input_for_model(model, input_data))
+                positions.append(position)
             except Exception as e:
-                # Add error result
-                result = PredictionResult(
-                    row_index=start_index + len(results),
-                    input_data={},
+                results[position] = PredictionResult(
+                    row_index=start_index + position,
+                    input_data=input_data,
                     prediction=None,
                     error_message=str(e)
                 )
-                results.append(result)
+        
+        if messages:
+            start_time = time.time()
+            if router is not None:
+                responses = await router.generate_batch(
+                    messages,
+                    max_tokens=150,
+                    temperature=0.7,
+                    stop_event=stop_event
+                )
+            else:
+                # Models opted in to constrained decoding decode straight into their output schema
+                responses = await model_manager.generate_batch_async(
+                    messages,
+                    max_tokens=150,
+                    temperature=0.7,
+                    output_schema=self._decoding_schema(model),
+                    stop_event=stop_event
+                )
+            # The batch is generated together; each row is charged its share
+            processing_time = (time.time() - start_time) * 1000 / len(messages)
+            
+            for position, response in zip(positions, responses):
+                input_data = inputs[position]
+                try:
+                    if response["status"] != "success":
+                        raise Exception(f"Model inference failed: {response.get('message', 'Unknown error')}")
+                    
+                    prediction = self._parse_model_output(model, response["response"])
+                    result = PredictionResult(
+                        row_index=start_index + position,
+                        input_data=input_data,
+                        prediction=prediction,
+                        processing_time_ms=processing_time
+                    )
+                    
+                    # Extract confidence if available
+                    if isinstance(prediction, dict) and 'confidence' in prediction:
+                        result.confidence = prediction['confidence']
+                    
+                except Exception as e:
+                    result = PredictionResult(
+                        row_index=start_index + position,
+                        input_data=input_data,
+                        prediction=None,
+                        error_message=f"Prediction failed: {e}",
+                        processing_time_ms=processing_time
+                    )
+                results[position] = result
+                if dedup_cache is not None and result.error_message is None:
+                    dedup_cache.put(keys[position], result)
+        
+        for position, source_position in duplicates:
+            results[position] = self._duplicate_result(
+                results[source_position], start_index + position, inputs[position]
+            )
         
         return results
     
+    @staticmethod
+    def _payload_key(input_data: Dict[str, Any]) -> str:
+        """Hash of a row's mapped inputs; rows with equal keys get the same prediction"""
+        payload = json.dumps(input_data, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _duplicate_result(source: PredictionResult, row_index: int, input_data: Dict[str, Any]) -> PredictionResult:
+        """Result for a row that repeats ``source``'s inputs (no model call of its own)"""
+        return source.copy(update={
+            "row_index": row_index,
+            "input_data": input_data,
+            "processing_time_ms": None,
+            "deduplicated": True,
+            "duplicate_of": source.row_index
+        })
+    
+    def _preprocess_inputs(
+        self,
+        data: pd.DataFrame,
+        mapping: PredictionMapping
+    ) -> PreparedInputs:
+        """Apply the mapping's preprocessing options to the whole DataFrame, column by column
+        
+        Missing values are detected, defaulted or flagged with vectorized
+        operations; rows that fail ``handle_missing_values="error"`` get their
+        error message here, so per-row work is reduced to the model call.
+        """
+        options = mapping.preprocessing_options
+        columns: Dict[str, List[Any]] = {}
+        skipped: Dict[str, np.ndarray] = {}
+        errors = np.full(len(data), None, dtype=object)
+        
+        for model_field, file_column in mapping.input_columns.items():
+            if file_column not in data.columns:
+                continue
+            
+            values = data[file_column]
+            missing = values.isna().to_numpy()
+            
+            if missing.any():
+                if options.handle_missing_values == "skip":
+                    skipped[model_field] = missing
+                elif options.handle_missing_values == "error":
+                    # Keep the first failing column's message for each row
+                    errors = np.where(
+                        missing & np.equal(errors, None),
+                        f"Missing value in column {file_column}",
+                        errors
+                    )
+                else:  # default
+                    values = values.astype(object).where(
+                        ~missing, options.default_values.get(model_field, "")
+                    )
+            
+            # Text normalization (non-string values are left untouched)
+            if options.normalize_text and values.dtype == object:
+                try:
+                    stripped = values.str.strip()
+                    values = stripped.where(stripped.notna(), values)
+                except AttributeError:
+                    # No string values in this column
+                    pass
+            
+            # Plain Python values: cheap to index per row and JSON friendly
+            columns[model_field] = values.tolist()
+        
+        return PreparedInputs(columns=columns, skipped=skipped, errors=errors)
+    
     def _make_prediction(self, model_info: ModelInfo, input_data: Dict[str, Any]) -> Any:
         """Make a prediction using the loaded model with dynamic input formatting"""
         try:            
@@ -306,10 +642,12 @@ class PredictionService:
             message = self._format_input_for_model(model_info, input_data)
             # Use the model manager to generate response
             print("this is message", message)
+            # Models opted in to constrained decoding decode straight into their output schema
             result = model_manager.generate_response(
                 message=message,
                 max_tokens=150,
-                temperature=0.7
+                temperature=0.7,
+                output_schema=self._decoding_schema(model_info)
             )
 
             print("this is model response in _make_prediction", result)
@@ -328,146 +666,26 @@ class PredictionService:
             raise Exception(f"Prediction failed: {e}")
     
     
+    def _get_formatter(self, model_info: ModelInfo) -> ModelFormatter:
+        """Compiled formatter/parser for a model, built once and reused for every row"""
+        formatter = self._formatters.get(model_info.model_id)
+        if formatter is None:
+            formatter = ModelFormatter(model_info)
+            self._formatters[model_info.model_id] = formatter
+        return formatter
+    
     def _format_input_for_model(self, model_info: ModelInfo, input_data: Dict[str, Any]) -> str:
         """Format input data according to the model's training format"""
-        try:
-            # Get the model's input schema
-            input_schema = model_info.input_schema
-            
-            # Build the message in the same format used during training
-            message_parts = []
-            
-            # ALWAYS check for static instruction first, regardless of input schema
-            static_instruction = ""
-            if model_info.metadata and "static_instruction" in model_info.metadata:
-                static_instruction = model_info.metadata["static_instruction"]
-                print(f"Found static instruction in metadata: {static_instruction[:100]}...")  # Debug log
-            
-            # Get dynamic instruction from input data (if input schema has instruction field)
-            dynamic_instruction = ""
-            if "instruction" in input_schema:
-                dynamic_instruction = input_data.get("instruction", "")
-                print(f"Found dynamic instruction in input data: {dynamic_instruction[:100] if dynamic_instruction else 'None'}")  # Debug log
-            
-            # Combine instructions - dynamic takes precedence, fallback to static
-            final_instruction = dynamic_instruction or static_instruction
-            
-            # Add instruction if we have one (either static or dynamic)
-            if final_instruction and final_instruction.strip():
-                message_parts.append(f"### Instruction:\n{final_instruction}")
-                print(f"Using final instruction: {final_instruction[:100]}...")  # Debug log
-            else:
-                print("No instruction found - neither static nor dynamic")  # Debug log
-            
-            # Check if there's an input field
-            if "input" in input_schema:
-                input_text = input_data.get("input", "")
-                if input_text and input_text.strip():
-                    message_parts.append(f"### Input:\n{input_text}")
-            
-            # Handle other input fields (for custom models)
-            for field_name in input_schema.keys():
-                if field_name not in ["instruction", "input"] and field_name in input_data:
-                    value = input_data[field_name]
-                    if value and str(value).strip():
-                        # Format as a labeled section
-                        field_label = field_name.replace("_", " ").title()
-                        message_parts.append(f"### {field_label}:\n{value}")
-            
-            # Add the response prompt
-            message_parts.append("### Response:")
-            
-            formatted_message = "\n\n".join(message_parts)
-            print(f"Final formatted message for model: {formatted_message[:300]}...")  # Debug log
-            
-            return formatted_message
-            
-        except Exception as e:
-            print(f"Error formatting input for model: {e}")
-            # Fallback to simple concatenation with static instruction support
-            static_instruction = ""
-            if model_info.metadata and "static_instruction" in model_info.metadata:
-                static_instruction = model_info.metadata["static_instruction"]
-                print(f"Using static instruction in fallback: {static_instruction[:100]}...")  # Debug log
-            
-            instruction = input_data.get("instruction", "") or static_instruction
-            input_text = input_data.get("input", "")
-            
-            fallback_message = f"{instruction}\n{input_text}" if instruction else input_text
-            print(f"Fallback message: {fallback_message[:200]}...")  # Debug log
-            
-            return fallback_message
+        return self._get_formatter(model_info).format_input(input_data)
     
     def _parse_model_output(self, model_info: ModelInfo, response: str) -> Dict[str, Any]:
         """Parse model output according to the expected output schema"""
+        formatter = self._get_formatter(model_info)
         try:
-            output_schema = model_info.output_schema
-            
-            # Default confidence
-            confidence = 0.85
-            
-            # Try to extract confidence from response if it contains it
-            if "confidence:" in response.lower():
-                try:
-                    conf_part = response.lower().split("confidence:")[1].split()[0]
-                    confidence = float(conf_part.replace("%", "")) / 100
-                except:
-                    pass
-            
-            # Check if the model expects structured JSON output
-            structured_fields = [field for field in output_schema.keys() 
-                               if field not in ["response", "confidence"]]
-            
-            if structured_fields:
-                # Try to parse as JSON first
-                try:
-                    parsed_json = json.loads(response)
-                    if isinstance(parsed_json, dict):
-                        # Add confidence if not present
-                        if "confidence" not in parsed_json:
-                            parsed_json["confidence"] = confidence
-                        return parsed_json
-                except json.JSONDecodeError:
-                    pass
-                
-                # If JSON parsing fails, try to extract structured data from text
-                result = {"confidence": confidence}
-                
-                # Look for field patterns in the response
-                for field in structured_fields:
-                    # Try different patterns to extract field values
-                    patterns = [
-                        rf"{field}:\s*([^\n]+)",
-                        rf'"{field}":\s*"([^"]+)"',
-                        rf"'{field}':\s*'([^']+)'",
-                        rf"{field.replace('_', ' ')}:\s*([^\n]+)",
-                    ]
-                    
-                    for pattern in patterns:
-                        match = re.search(pattern, response, re.IGNORECASE)
-                        if match:
-                            result[field] = match.group(1).strip()
-                            break
-                
-                # If we extracted any structured fields, return the structured result
-                if any(field in result for field in structured_fields):
-                    return result
-            
-            # Fallback to simple response format
-            return {
-                "response": response,
-                "confidence": confidence,
-                "model_version": model_info.version or "1.0"
-            }
-            
+            return formatter.parse_output(response)
         except Exception as e:
             print(f"Error parsing model output: {e}")
-            # Fallback to simple response
-            return {
-                "response": response,
-                "confidence": 0.85,
-                "model_version": model_info.version or "1.0"
-            }
+            return formatter.fallback_output(response)
     
     def _load_model(self, model_id: str) -> Optional[ModelInfo]:
         """Load a model for predictions using the model manager"""
@@ -477,6 +695,9 @@ class PredictionService:
             if not model_info or not model_info.model_path:
                 return None
             
+            # Compile the model's input formatter and output parser up front
+            self._get_formatter(model_info)
+            
             # Special handling for test models
             if model_info.model_path == "/fake/path/for/testing":
                 print(f"Using test model {model_id} (no actual model loading required)")
@@ -526,14 +747,14 @@ class PredictionService:
                 return ValidationResult(is_valid=False, issues=issues)
             
             # Check if all required model inputs are mapped
-            for field in model.input_schema.keys():
-                if field not in mapping.input_columns:
+            for model_field in model.input_schema.keys():
+                if model_field not in mapping.input_columns:
                     # Special case: if this is the "instruction" field and we have a static instruction,
                     # we don't need it to be mapped from file columns
-                    if field == "instruction" and model.metadata and "static_instruction" in model.metadata:
+                    if model_field == "instruction" and model.metadata and "static_instruction" in model.metadata:
                         print(f"Skipping instruction field validation - using static instruction from model metadata")
                         continue
-                    issues.append(f"Required model input '{field}' is not mapped")
+                    issues.append(f"Required model input '{model_field}' is not mapped")
             
             # Get file info and check columns exist
             file_info = file_manager.get_file_info(file_id)
@@ -541,10 +762,12 @@ class PredictionService:
                 issues.append(f"File {file_id} not found")
                 return ValidationResult(is_valid=False, issues=issues)
             
-            # Load file to check columns
+            # Load file to check columns (a Parquet copy lists them without reading any rows)
             file_path = file_manager.get_file_path(file_id)
-            data = self._load_data_file(file_path)
-            available_columns = list(data.columns)
+            columnar = file_manager.get_columnar_info(file_id)
+            mapped_columns = sorted(set(mapping.input_columns.values()))
+            data = file_manager.load_dataframe(file_path, columns=mapped_columns)
+            available_columns = columnar['columns'] if columnar else list(data.columns)
             
             for model_field, file_column in mapping.input_columns.items():
                 if file_column not in available_columns:
@@ -568,18 +791,21 @@ class PredictionService:
             issues.append(f"Validation error: {str(e)}")
             return ValidationResult(is_valid=False, issues=issues)
     
-    def get_prediction_job(self, job_id: str) -> Optional[PredictionJob]:
-        """Get a prediction job by ID"""
+    def get_prediction_job(self, job_id: str, include_results: bool = False) -> Optional[PredictionJob]:
+        """Get a prediction job by ID
+        
+        Only the job's metadata is read unless ``include_results`` is set; use
+        ``get_prediction_results`` to page through the results instead.
+        """
         try:
-            jobs_index = self._load_jobs_index()
-            if job_id not in jobs_index:
+            job_data = self.job_store.get(job_id)
+            if job_data is None:
                 return None
             
-            job_data = jobs_index[job_id]
             job = PredictionJob(**job_data)
             
-            # Load results if completed
-            if job.status == PredictionStatus.COMPLETED and not job.results:
+            # Load all results only when explicitly asked for
+            if include_results and job.status == PredictionStatus.COMPLETED and not job.results:
                 job.results = self._load_job_results(job_id)
             
             return job
@@ -591,150 +817,391 @@ class PredictionService:
         self, 
         status: Optional[str] = None,
         model_id: Optional[str] = None,
-        limit: int = 50
+        limit: int = 50,
+        offset: int = 0
     ) -> List[PredictionJob]:
-        """Get list of prediction jobs with optional filtering"""
+        """Get list of prediction jobs with optional filtering (newest first)"""
         try:
-            jobs_index = self._load_jobs_index()
             jobs = []
-            
-            for job_id, job_data in jobs_index.items():
+            for job_data in self.job_store.list(status=status, model_id=model_id, limit=limit, offset=offset):
                 try:
-                    job = PredictionJob(**job_data)
-                    
-                    # Apply filters
-                    if status and job.status != status:
-                        continue
-                    if model_id and job.model_id != model_id:
-                        continue
-                    
-                    jobs.append(job)
+                    jobs.append(PredictionJob(**job_data))
                 except Exception as e:
-                    print(f"Error loading job {job_id}: {e}")
+                    print(f"Error loading job {job_data.get('job_id')}: {e}")
                     continue
             
-            # Sort by creation date (newest first)
-            jobs.sort(key=lambda x: x.created_at, reverse=True)
-            
-            return jobs[:limit]
+            return jobs
         except Exception as e:
             print(f"Error getting prediction jobs: {e}")
             return []
     
+    def count_prediction_jobs(
+        self,
+        status: Optional[str] = None,
+        model_id: Optional[str] = None
+    ) -> int:
+        """Number of prediction jobs matching the filters"""
+        try:
+            return self.job_store.count(status=status, model_id=model_id)
+        except Exception as e:
+            print(f"Error counting prediction jobs: {e}")
+            return 0
+    
+    def get_prediction_overview(self, recent_limit: int = 10) -> Dict[str, Any]:
+        """Overview numbers for all prediction activity, read from the stored rollups"""
+        rollups = self.job_store.rollups()
+        completed = rollups.get(PredictionStatus.COMPLETED.value, {})
+        
+        def jobs_with(*statuses):
+            return int(sum(rollups.get(status.value, {}).get("jobs", 0) for status in statuses))
+        
+        return {
+            "total_jobs": int(sum(rollup["jobs"] for rollup in rollups.values())),
+            "active_jobs": jobs_with(PredictionStatus.PENDING, PredictionStatus.RUNNING),
+            "completed_jobs": jobs_with(PredictionStatus.COMPLETED),
+            "failed_jobs": jobs_with(PredictionStatus.FAILED),
+            "total_predictions": int(completed.get("total_rows", 0)),
+            "avg_processing_time": self._rollup_average(completed, "processing_time"),
+            "models_used": self.job_store.models_used(),
+            "recent_activity": self.get_prediction_jobs(limit=recent_limit)
+        }
+    
+    def get_model_prediction_stats(self, model_id: str, recent_limit: int = 5) -> Dict[str, Any]:
+        """Prediction statistics for one model, read from the stored rollups"""
+        rollups = self.job_store.rollups(model_id=model_id)
+        completed = rollups.get(PredictionStatus.COMPLETED.value, {})
+        total_jobs = sum(rollup["jobs"] for rollup in rollups.values())
+        
+        return {
+            "total_predictions": int(completed.get("total_rows", 0)),
+            "avg_confidence": self._rollup_average(completed, "confidence"),
+            "avg_processing_time": self._rollup_average(completed, "processing_time"),
+            "success_rate": completed.get("jobs", 0) / total_jobs if total_jobs else 0.0,
+            "recent_jobs": self.get_prediction_jobs(model_id=model_id, limit=recent_limit)
+        }
+    
+    @staticmethod
+    def _rollup_average(rollup: Dict[str, Any], name: str) -> Optional[float]:
+        count = rollup.get(f"{name}_count")
+        return rollup[f"{name}_sum"] / count if count else None
+    
+    def _backfill_job_stats(self):
+        """Compute aggregates for completed jobs stored before they were tracked"""
+        for job_id in self.job_store.jobs_missing_stats(PredictionStatus.COMPLETED.value):
+            try:
+                job = self.get_prediction_job(job_id, include_results=False)
+                if job is None:
+                    continue
+                job.stats = PredictionJobStats(**summarize_results(self.iter_job_results(job_id)))
+                self._save_job(job)
+            except Exception as e:
+                print(f"Error computing stats for job {job_id}: {e}")
+    
     def cancel_prediction_job(self, job_id: str) -> bool:
-        """Cancel a running prediction job"""
+        """Cancel a pending, running or paused prediction job
+        
+        A running job stops at once: its in-flight generate call is ended at
+        the next token and no further batches are started.
+        """
         try:
-            job = self.get_prediction_job(job_id)
+            job = self.get_prediction_job(job_id, include_results=False)
             if not job:
                 return False
             
-            if job.status in [PredictionStatus.COMPLETED, PredictionStatus.FAILED]:
+            if job.status in TERMINAL_STATUSES:
                 return False
             
+            # Recorded before the task is signalled, and only if the job has not
+            # finished meanwhile; the task saves nothing once cancel is set
             job.status = PredictionStatus.CANCELLED
             job.completed_at = datetime.now()
-            self._save_job(job)
+            if not self.job_store.update(job.dict(exclude={"results"}), unless_status=TERMINAL_STATUSES):
+                return False
+            
+            control = self._job_controls.get(job_id)
+            if control is not None:
+                control.cancel.set()
             
-            # Remove from running jobs
-            if job_id in self._running_jobs:
-                del self._running_jobs[job_id]
+            # Cancelled jobs are never resumed; a running job removes its
+            # partial results again once its current batch stops
+            self._remove_partial_results(job_id)
             
             return True
         except Exception as e:
             print(f"Error cancelling job {job_id}: {e}")
             return False
     
+    def pause_prediction_job(self, job_id: str) -> bool:
+        """Ask a running job to stop after its current batch, keeping its checkpoint"""
+        try:
+            control = self._job_controls.get(job_id)
+            if control is None or control.cancel.is_set():
+                return False
+            
+            control.pause.set()
+            return True
+        except Exception as e:
+            print(f"Error pausing job {job_id}: {e}")
+            return False
+    
+    def resume_prediction_job(self, job_id: str) -> bool:
+        """Continue a paused job from its checkpoint row"""
+        try:
+            job = self.get_prediction_job(job_id, include_results=False)
+            if not job or job.status != PredictionStatus.PAUSED:
+                return False
+            
+            if job_id in self._job_controls:
+                # Still winding down from the pause request
+                return False
+            
+            self._start_job_task(job)
+            return True
+        except Exception as e:
+            print(f"Error resuming job {job_id}: {e}")
+            return False
+    
     def delete_prediction_job(self, job_id: str) -> bool:
         """Delete a prediction job and its results"""
         try:
-            jobs_index = self._load_jobs_index()
-            if job_id not in jobs_index:
+            # Stop it first if it is still running, so its task saves nothing more
+            control = self._job_controls.get(job_id)
+            if control is not None:
+                control.deleted = True
+                control.cancel.set()
+            
+            # Remove from the job store
+            if not self.job_store.delete(job_id):
                 return False
             
-            # Remove from index
-            del jobs_index[job_id]
-            self._save_jobs_index(jobs_index)
-            
-            # Remove results file
-            results_file = self.jobs_dir / "completed" / f"{job_id}_results.json"
-            if results_file.exists():
-                results_file.unlink()
+            # Remove results files (current, offset index, partial and legacy format)
+            for results_file in (self._results_file(job_id), self._results_index_file(job_id),
+                                 self._partial_results_file(job_id), self._legacy_results_file(job_id)):
+                if results_file.exists():
+                    results_file.unlink()
             
             return True
         except Exception as e:
             print(f"Error deleting job {job_id}: {e}")
             return False
     
-    def _load_data_file(self, file_path: str) -> pd.DataFrame:
-        """Load data from file into DataFrame"""
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension == '.csv':
-            return pd.read_csv(file_path)
-        elif file_extension == '.json':
-            return pd.read_json(file_path)
-        elif file_extension == '.jsonl':
-            data = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        data.append(json.loads(line))
-            return pd.DataFrame(data)
-        else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-    
     def _save_job(self, job: PredictionJob):
-        """Save job to index"""
-        jobs_index = self._load_jobs_index()
-        jobs_index[job.job_id] = job.dict()
-        self._save_jobs_index(jobs_index)
+        """Save one job's row in the job store (results are stored separately)"""
+        self.job_store.save(job.dict(exclude={"results"}))
+    
+    def _update_job(self, job: PredictionJob, control: "JobControl") -> bool:
+        """Save a job from its own task, unless it was cancelled or deleted meanwhile
+        
+        Only an existing row that has not reached a terminal status is
+        updated, so a deleted job is never re-inserted and a cancelled one
+        is never overwritten by a stale copy.
+        """
+        if control.deleted or control.cancel.is_set():
+            return False
+        return self.job_store.update(job.dict(exclude={"results"}), unless_status=TERMINAL_STATUSES)
+    
+    def _results_file(self, job_id: str) -> Path:
+        """Job results, one JSON object per line"""
+        return self.jobs_dir / "completed" / f"{job_id}_results.jsonl"
+    
+    def _results_index_file(self, job_id: str) -> Path:
+        """Byte offset of every line of the results file, as native uint64 values"""
+        return self.jobs_dir / "completed" / f"{job_id}_results.idx"
+    
+    def _legacy_results_file(self, job_id: str) -> Path:
+        """Job results written by older versions as a single JSON array"""
+        return self.jobs_dir / "completed" / f"{job_id}_results.json"
+    
+    def _partial_results_file(self, job_id: str) -> Path:
+        """Results of a job that has not completed yet, appended batch by batch"""
+        return self.jobs_dir / "active" / f"{job_id}_results.jsonl"
+    
+    def _remove_partial_results(self, job_id: str):
+        self._partial_results_file(job_id).unlink(missing_ok=True)
+    
+    def _append_partial_results(self, job_id: str, results: List[PredictionResult]):
+        with open(self._partial_results_file(job_id), 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result.dict(), default=str))
+                f.write("\n")
+    
+    def _trim_partial_results(self, job_id: str, checkpoint_row: int):
+        """Drop partial results at or past the checkpoint (left over from an interrupted batch)"""
+        partial_file = self._partial_results_file(job_id)
+        if not partial_file.exists():
+            return
+        if checkpoint_row == 0:
+            partial_file.unlink()
+            return
+        
+        trimmed_file = partial_file.with_name(partial_file.name + ".tmp")
+        with open(partial_file, 'r', encoding='utf-8') as src, open(trimmed_file, 'w', encoding='utf-8') as dst:
+            for line in src:
+                if line.strip() and json.loads(line).get("row_index", 0) < checkpoint_row:
+                    dst.write(line)
+        os.replace(trimmed_file, partial_file)
+    
+    def _finalize_job_results(self, job_id: str):
+        """Move a finished job's partial results into place as its results file"""
+        partial_file = self._partial_results_file(job_id)
+        if partial_file.exists():
+            os.replace(partial_file, self._results_file(job_id))
+            self._write_results_index(job_id)
+        else:
+            self._save_job_results(job_id, [])
     
     def _save_job_results(self, job_id: str, results: List[PredictionResult]):
         """Save job results to separate file"""
-        results_file = self.jobs_dir / "completed" / f"{job_id}_results.json"
+        results_file = self._results_file(job_id)
         with open(results_file, 'w', encoding='utf-8') as f:
-            json.dump([result.dict() for result in results], f, indent=2, default=str)
+            for result in results:
+                f.write(json.dumps(result.dict(), default=str))
+                f.write("\n")
+        self._write_results_index(job_id)
+    
+    def _write_results_index(self, job_id: str):
+        """Record where each line of the results file starts, so pages can be read with one seek"""
+        offsets = array('Q')
+        position = 0
+        with open(self._results_file(job_id), 'rb') as f:
+            for line in f:
+                if line.strip():
+                    offsets.append(position)
+                position += len(line)
+        
+        index_file = self._results_index_file(job_id)
+        temp_file = index_file.with_name(index_file.name + ".tmp")
+        with open(temp_file, 'wb') as f:
+            offsets.tofile(f)
+        os.replace(temp_file, index_file)
+    
+    def _ensure_results_index(self, job_id: str) -> bool:
+        """Make sure a completed job has a results file and an up-to-date offset index
+        
+        Results written by older versions (a single JSON array) are converted
+        to the line-delimited format once. Returns False if the job has no
+        stored results.
+        """
+        results_file = self._results_file(job_id)
+        if not results_file.exists():
+            legacy_file = self._legacy_results_file(job_id)
+            if not legacy_file.exists():
+                return False
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy_results = json.load(f)
+            temp_file = results_file.with_name(results_file.name + ".tmp")
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                for result in legacy_results:
+                    f.write(json.dumps(result, default=str))
+                    f.write("\n")
+            os.replace(temp_file, results_file)
+            legacy_file.unlink()
+        
+        index_file = self._results_index_file(job_id)
+        if not index_file.exists() or index_file.stat().st_mtime < results_file.stat().st_mtime:
+            self._write_results_index(job_id)
+        return True
+    
+    def get_prediction_results(
+        self,
+        job_id: str,
+        offset: int = 0,
+        limit: int = 50
+    ) -> Tuple[List[PredictionResult], int]:
+        """One page of a completed job's results and the total number of results
+        
+        The offset index gives the total from its size and the page's start
+        position from a single 8-byte read; only the requested lines are parsed.
+        """
+        if not self._ensure_results_index(job_id):
+            return [], 0
+        
+        index_file = self._results_index_file(job_id)
+        total = index_file.stat().st_size // RESULT_OFFSET_SIZE
+        if offset >= total or limit <= 0:
+            return [], total
+        
+        start = array('Q')
+        with open(index_file, 'rb') as f:
+            f.seek(offset * RESULT_OFFSET_SIZE)
+            start.frombytes(f.read(RESULT_OFFSET_SIZE))
+        
+        results = []
+        with open(self._results_file(job_id), 'rb') as f:
+            f.seek(start[0])
+            for line in f:
+                if not line.strip():
+                    continue
+                results.append(PredictionResult(**json.loads(line)))
+                if len(results) >= limit:
+                    break
+        return results, total
+    
+    def iter_job_result_lines(self, job_id: str) -> Iterator[str]:
+        """Yield the stored results of a job as raw JSON lines, reading the file incrementally"""
+        results_file = self._results_file(job_id)
+        if results_file.exists():
+            with open(results_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield line.rstrip("\n")
+            return
+        
+        legacy_file = self._legacy_results_file(job_id)
+        if legacy_file.exists():
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                for result in json.load(f):
+                    yield json.dumps(result, default=str)
+    
+    def iter_job_results(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        """Yield the stored results of a job as dicts, one at a time"""
+        for line in self.iter_job_result_lines(job_id):
+            yield json.loads(line)
     
     def _load_job_results(self, job_id: str) -> List[PredictionResult]:
         """Load job results from file"""
         try:
-            results_file = self.jobs_dir / "completed" / f"{job_id}_results.json"
-            if not results_file.exists():
-                return []
-            
-            with open(results_file, 'r', encoding='utf-8') as f:
-                results_data = json.load(f)
-            
-            return [PredictionResult(**result) for result in results_data]
+            return [PredictionResult(**result) for result in self.iter_job_results(job_id)]
         except Exception as e:
             print(f"Error loading results for job {job_id}: {e}")
             return []
     
-    def _load_jobs_index(self) -> Dict[str, Any]:
-        """Load jobs index from file"""
-        try:
-            with open(self.jobs_index_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_jobs_index(self, index: Dict[str, Any]):
-        """Save jobs index to file"""
-        with open(self.jobs_index_file, 'w', encoding='utf-8') as f:
-            json.dump(index, f, indent=2, default=str)
-    
     def _load_models_index(self) -> Dict[str, Any]:
-        """Load models index from file"""
+        """Load models index from file (served from memory until the file changes)"""
+        signature = self._file_signature(self.models_index_file)
+        if signature is not None and signature == self._models_index_signature:
+            return dict(self._models_index_cache)
+        
         try:
             with open(self.models_index_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                models_index = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
             return {}
+        
+        self._models_index_cache = models_index
+        self._models_index_signature = signature
+        self._model_infos = None
+        self._formatters = {}
+        return dict(models_index)
     
     def _save_models_index(self, index: Dict[str, Any]):
         """Save models index to file"""
         with open(self.models_index_file, 'w', encoding='utf-8') as f:
             json.dump(index, f, indent=2, default=str)
+        
+        # Drop the in-memory copy; the next read re-parses the saved file
+        self._models_index_signature = None
+        self._model_infos = None
+        self._formatters = {}
+    
+    @staticmethod
+    def _file_signature(path: Path):
+        """Cheap change fingerprint for a file (None if it does not exist)"""
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
 
 
 # Global instance
@@ -0,0 +1,154 @@
+"""
+Streaming exports of prediction job results.
+
+Every exporter reads the job's results file incrementally through
+``PredictionService.iter_job_results`` and yields encoded chunks, so memory
+use stays flat regardless of how many rows a job produced.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Rows encoded per yielded chunk
+CHUNK_ROWS = 1000
+
+
+def _prediction_text(prediction: Any) -> str:
+    return json.dumps(prediction) if isinstance(prediction, dict) else str(prediction)
+
+
+def iter_csv(results: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """CSV with one line per result; input columns come from the first result"""
+    results = iter(results)
+    first = next(results, None)
+    input_keys = list((first or {}).get("input_data", {}).keys())
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        ["row_index", "prediction", "confidence", "processing_time_ms"]
+        + [f"input_{key}" for key in input_keys]
+    )
+
+    rows = 0
+    for result in chain([first], results) if first is not None else ():
+        input_data = result.get("input_data") or {}
+        writer.writerow(
+            [
+                result.get("row_index"),
+                _prediction_text(result.get("prediction")),
+                result.get("confidence") or "",
+                result.get("processing_time_ms") or "",
+            ]
+            + [input_data.get(key, "") for key in input_keys]
+        )
+        rows += 1
+        if rows % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode()
+
+
+def iter_ndjson(result_lines: Iterable[str]) -> Iterator[bytes]:
+    """Newline-delimited JSON, passed through from the stored lines without re-encoding"""
+    chunk: List[str] = []
+    for line in result_lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_ROWS:
+            yield ("\n".join(chunk) + "\n").encode()
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode()
+
+
+def iter_json(job_fields: Dict[str, Any], result_lines: Iterable[str]) -> Iterator[bytes]:
+    """The JSON document the download endpoint always produced, written out as a stream"""
+    header = json.dumps(job_fields, indent=2, default=str)
+    # Reopen the object to append the results array; total_results follows it
+    yield (header[:-2] + ',\n  "results": [').encode()
+
+    total = 0
+    chunk: List[str] = []
+    for line in result_lines:
+        chunk.append(("\n    " if total == 0 else ",\n    ") + line)
+        total += 1
+        if len(chunk) >= CHUNK_ROWS:
+            yield "".join(chunk).encode()
+            chunk = []
+    chunk.append(f'\n  ],\n  "total_results": {total}\n}}')
+    yield "".join(chunk).encode()
+
+
+def write_parquet(results: Iterable[Dict[str, Any]], row_group_rows: int = 10000) -> str:
+    """Write results to a temporary Parquet file in row groups; returns its path.
+
+    Parquet needs a footer written after all row groups, so the file is
+    built on disk (constant memory) and then streamed by the caller.
+    """
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("Parquet export requires pyarrow to be installed")
+
+    schema = pa.schema([
+        ("row_index", pa.int64()),
+        ("prediction", pa.string()),
+        ("confidence", pa.float64()),
+        ("processing_time_ms", pa.float64()),
+        ("error_message", pa.string()),
+        ("input_data", pa.string()),
+    ])
+
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+
+    def flush(writer, rows: Dict[str, list]):
+        writer.write_table(pa.Table.from_pydict(rows, schema=schema))
+
+    try:
+        with pq.ParquetWriter(path, schema) as writer:
+            rows = {name: [] for name in schema.names}
+            for result in results:
+                prediction = result.get("prediction")
+                rows["row_index"].append(result.get("row_index"))
+                rows["prediction"].append(None if prediction is None else _prediction_text(prediction))
+                rows["confidence"].append(result.get("confidence"))
+                rows["processing_time_ms"].append(result.get("processing_time_ms"))
+                rows["error_message"].append(result.get("error_message"))
+                rows["input_data"].append(json.dumps(result.get("input_data") or {}, default=str))
+                if len(rows["row_index"]) >= row_group_rows:
+                    flush(writer, rows)
+                    rows = {name: [] for name in schema.names}
+            if rows["row_index"]:
+                flush(writer, rows)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return path
+
+
+def iter_file(path: str, chunk_size: int = 1024 * 1024, delete: bool = False) -> Iterator[bytes]:
+    """Stream a file from disk, optionally removing it afterwards"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if delete and os.path.exists(path):
+            os.remove(path)
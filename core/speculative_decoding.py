@@ -0,0 +1,154 @@
+"""
+Speculative decoding configuration and per-request statistics.
+
+Two drafting strategies are supported through transformers' assisted
+generation:
+
+- ``prompt_lookup``: candidate tokens are copied from n-gram matches in the
+  prompt. This suits extraction, where most output values appear verbatim
+  in the OCR text, and needs no extra model.
+- ``draft_model``: a small model with the same tokenizer proposes tokens.
+
+The target model verifies every candidate, so outputs follow the same
+distribution as normal decoding (identical for greedy decoding).
+"""
+
+import time
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+SPECULATIVE_METHODS = ("none", "prompt_lookup", "draft_model")
+
+
+@dataclass
+class SpeculativeConfig:
+    """Speculative decoding settings for local generation"""
+    method: str = "none"  # none, prompt_lookup, draft_model
+    num_draft_tokens: int = 10
+    max_ngram_size: int = 2
+    draft_model_path: Optional[str] = None
+
+    def validate(self):
+        if self.method not in SPECULATIVE_METHODS:
+            raise ValueError(f"Unknown speculative method '{self.method}'. Use one of: {', '.join(SPECULATIVE_METHODS)}")
+        if self.num_draft_tokens < 1:
+            raise ValueError("num_draft_tokens must be at least 1")
+        if self.max_ngram_size < 1:
+            raise ValueError("max_ngram_size must be at least 1")
+        if self.method == "draft_model" and not self.draft_model_path:
+            raise ValueError("draft_model_path is required for draft_model speculative decoding")
+
+    @property
+    def enabled(self) -> bool:
+        return self.method != "none"
+
+    def generate_kwargs(self, draft_model=None) -> Dict[str, Any]:
+        """Extra keyword arguments for model.generate()"""
+        if self.method == "prompt_lookup":
+            return {
+                "prompt_lookup_num_tokens": self.num_draft_tokens,
+                "max_matching_ngram_size": self.max_ngram_size,
+            }
+        if self.method == "draft_model" and draft_model is not None:
+            return {"assistant_model": draft_model}
+        return {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _innermost_model(model):
+    """The module whose forward() generate() actually calls (unwraps PEFT wrappers)"""
+    get_base_model = getattr(model, "get_base_model", None)
+    return get_base_model() if callable(get_base_model) else model
+
+
+class ForwardPassCounter:
+    """Counts forward passes (and their input widths) of a model during one generate() call
+
+    The model is shared, so the hook also sees passes from generate() calls
+    on other threads (streaming workers, concurrent requests); only passes
+    made on the thread that entered the counter are counted.
+    """
+
+    def __init__(self, model):
+        self.module = _innermost_model(model)
+        self.input_widths: List[int] = []
+        self._handle = None
+        self._thread_id: Optional[int] = None
+
+    def _hook(self, module, args, kwargs):
+        if threading.get_ident() != self._thread_id:
+            return
+        input_ids = kwargs.get("input_ids")
+        if input_ids is None and args:
+            input_ids = args[0]
+        if input_ids is not None and hasattr(input_ids, "shape"):
+            self.input_widths.append(int(input_ids.shape[-1]))
+
+    @property
+    def passes(self) -> int:
+        return len(self.input_widths)
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._handle = self.module.register_forward_pre_hook(self._hook, with_kwargs=True)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._handle is not None:
+            self._handle.remove()
+            self._handle = None
+        return False
+
+
+class SpeculativeRun:
+    """Wraps one generate() call and reports acceptance and speedup for it"""
+
+    def __init__(self, config: SpeculativeConfig, target_model, prompt_tokens: int):
+        self.config = config
+        self.prompt_tokens = prompt_tokens
+        self.counter = ForwardPassCounter(target_model)
+        self.started_at = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.counter.__enter__()
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.started_at
+        return self.counter.__exit__(exc_type, exc, tb)
+
+    def stats(self, generated_tokens: int, baseline_ms_per_token: Optional[float] = None) -> Dict[str, Any]:
+        """Per-request numbers.
+
+        With a KV cache, every verification pass feeds the target model the
+        last accepted token plus the draft candidates (the first pass also
+        carries the prompt), and yields one target token plus the accepted
+        candidates. That gives proposed and accepted draft counts from the
+        widths and number of target forward passes alone.
+        """
+        passes = self.counter.passes
+        proposed = max(sum(self.counter.input_widths) - self.prompt_tokens - max(passes - 1, 0), 0)
+        accepted = min(max(generated_tokens - passes, 0), proposed)
+        ms_per_token = (self.elapsed * 1000 / generated_tokens) if generated_tokens else None
+
+        stats = {
+            "method": self.config.method,
+            "generated_tokens": generated_tokens,
+            "target_forward_passes": passes,
+            "draft_tokens_proposed": proposed,
+            "draft_tokens_accepted": accepted,
+            "acceptance_rate": round(accepted / proposed, 4) if proposed else None,
+            "tokens_per_forward_pass": round(generated_tokens / passes, 3) if passes else None,
+            "generation_time_ms": round(self.elapsed * 1000, 2),
+            "ms_per_token": round(ms_per_token, 3) if ms_per_token is not None else None,
+            "speedup": None,
+        }
+        if baseline_ms_per_token and ms_per_token:
+            # Measured against the running average of non-speculative requests
+            stats["speedup"] = round(baseline_ms_per_token / ms_per_token, 3)
+        return stats
@@ -0,0 +1,298 @@
+"""
+JSON-schema constrained decoding for structured extraction models.
+
+Models registered for prediction carry an output schema such as
+``{"invoice_number": "string", "total": "number"}`` (see
+``extract_output_schema_from_training``). Models that opt in (see
+``ModelInfo.constrained_decoding``) and whose schema is flat, with only string,
+number and boolean fields, are decoded under it. Instead of letting the model write
+free text and recovering JSON from it afterwards, the decoder here walks the
+object skeleton itself:
+
+- keys, quotes, colons and commas are fed to the model as forced tokens
+  (one forward pass per literal, reusing the KV cache);
+- only values are sampled, with the vocabulary masked to tokens that are
+  valid for the field type;
+- generation stops as soon as the last value closes.
+
+The output is assembled with ``json.dumps`` so it always parses.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+
+# Field types produced by extract_output_schema_from_training
+STRING = "string"
+NUMBER = "number"
+BOOLEAN = "boolean"
+
+# Schemas that only describe free text ({"response": "string"}) are not constrained
+UNSTRUCTURED_FIELDS = {"response", "confidence"}
+
+_NUMBER_PREFIX = re.compile(r"^-?((0|[1-9][0-9]*)(\.[0-9]*)?([eE][+-]?[0-9]*)?)?$")
+_NUMBER_CHARS = set("0123456789-+.eE")
+
+
+def _is_boolean_prefix(text: str) -> bool:
+    return "true".startswith(text) or "false".startswith(text)
+
+
+def is_structured_schema(output_schema: Optional[Dict[str, Any]]) -> bool:
+    """True if the schema names real output fields that can all be decoded under constraint
+
+    Schemas with nested (object/array), null or mixed-type fields are left to
+    free decoding: forcing them into flat values would change the output.
+    """
+    if not output_schema:
+        return False
+    fields = {field: field_type for field, field_type in output_schema.items() if field not in UNSTRUCTURED_FIELDS}
+    return bool(fields) and all(field_type in (STRING, NUMBER, BOOLEAN) for field_type in fields.values())
+
+
+def to_json_schema(output_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a registered output schema to a JSON Schema object (for vLLM guided decoding)"""
+    properties = {}
+    for field, field_type in output_schema.items():
+        if field in UNSTRUCTURED_FIELDS:
+            continue
+        json_type = field_type if field_type in (STRING, NUMBER, BOOLEAN) else STRING
+        properties[field] = {"type": json_type}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties.keys()),
+        "additionalProperties": False,
+    }
+
+
+class VocabularyIndex:
+    """Decoded text of every token in a vocabulary, grouped by what JSON values they can extend"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        size = len(tokenizer)
+        self.texts: List[str] = [tokenizer.decode([token_id]) for token_id in range(size)]
+        special_ids = set(tokenizer.all_special_ids)
+
+        # Tokens that can appear inside a JSON string value (never the closing quote)
+        string_body = torch.zeros(size, dtype=torch.bool)
+        self.number_ids: List[int] = []
+        self.boolean_ids: List[int] = []
+        for token_id, text in enumerate(self.texts):
+            if not text or token_id in special_ids:
+                continue
+            if '"' not in text and "\\" not in text and "\n" not in text:
+                string_body[token_id] = True
+            # Number and boolean tokens may carry the space after the colon
+            bare = text[1:] if text.startswith(" ") else text
+            if bare and all(ch in _NUMBER_CHARS for ch in bare):
+                self.number_ids.append(token_id)
+            if bare and ("true".startswith(bare) or "false".startswith(bare)):
+                self.boolean_ids.append(token_id)
+        self.string_body = string_body
+        self._prefix_cache: Dict[str, List[int]] = {}
+        self._mask_cache: Dict[Tuple[str, torch.device], torch.Tensor] = {}
+
+    def ids_prefixing(self, literal: str, lead: str = "") -> List[int]:
+        """Token ids whose text is ``lead`` followed by a non-empty prefix of ``literal``"""
+        key = lead + "\0" + literal
+        cached = self._prefix_cache.get(key)
+        if cached is None:
+            cached = [
+                token_id for token_id, text in enumerate(self.texts)
+                if text and text.startswith(lead) and literal.startswith(text[len(lead):])
+            ]
+            self._prefix_cache[key] = cached
+        return cached
+
+    def string_body_mask(self, device: torch.device) -> torch.Tensor:
+        key = ("string_body", device)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = self.string_body.to(device)
+            self._mask_cache[key] = mask
+        return mask
+
+
+@dataclass
+class StructuredResult:
+    """Outcome of one constrained generation"""
+    values: Dict[str, Any]
+    generated_tokens: int
+    truncated_fields: List[str]
+
+    @property
+    def text(self) -> str:
+        return json.dumps(self.values, ensure_ascii=False)
+
+
+class JSONSchemaDecoder:
+    """Generates a flat JSON object with a fixed key order from a causal LM"""
+
+    def __init__(self, model, tokenizer, vocabulary: VocabularyIndex):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.vocabulary = vocabulary
+        self.device = next(model.parameters()).device
+
+    def generate(self,
+                 input_ids: List[int],
+                 output_schema: Dict[str, Any],
+                 max_tokens: int = 150,
+                 temperature: float = 0.7,
+                 do_sample: bool = True,
+                 max_value_tokens: int = 64) -> StructuredResult:
+        fields = [
+            (field, field_type if field_type in (STRING, NUMBER, BOOLEAN) else STRING)
+            for field, field_type in output_schema.items()
+            if field not in UNSTRUCTURED_FIELDS
+        ]
+
+        self._past = None
+        self._logits = None
+        self._generated = 0
+        self._budget = max_tokens
+        self._temperature = temperature
+        self._do_sample = do_sample
+
+        values: Dict[str, Any] = {}
+        truncated: List[str] = []
+
+        with torch.no_grad():
+            self._feed(input_ids)
+
+            pending = "{"
+            for index, (field, field_type) in enumerate(fields):
+                last = index == len(fields) - 1
+                closing = "}" if last else ", "
+                # Strings open with ' "'; numbers and booleans bring their own leading space
+                pending += f'{json.dumps(field)}: "' if field_type == STRING else f"{json.dumps(field)}:"
+                self._feed_text(pending)
+
+                if field_type == STRING:
+                    raw, pending, complete = self._sample_string(closing, max_value_tokens)
+                    values[field] = raw
+                elif field_type == NUMBER:
+                    raw, pending, complete = self._sample_number(closing, max_value_tokens)
+                    values[field] = self._parse_number(raw)
+                else:
+                    raw, pending, complete = self._sample_boolean(closing)
+                    values[field] = raw == "true" if raw in ("true", "false") else None
+
+                if not complete:
+                    truncated.append(field)
+
+        self._past = None
+        self._logits = None
+        return StructuredResult(values=values, generated_tokens=self._generated, truncated_fields=truncated)
+
+    # Model stepping
+
+    def _feed(self, token_ids: List[int]):
+        if not token_ids:
+            return
+        tensor = torch.tensor([token_ids], dtype=torch.long, device=self.device)
+        outputs = self.model(input_ids=tensor, past_key_values=self._past, use_cache=True)
+        self._past = outputs.past_key_values
+        self._logits = outputs.logits[0, -1]
+
+    def _feed_text(self, text: str):
+        self._feed(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _pick(self, allowed: torch.Tensor) -> int:
+        """Choose the next token among the allowed ones (bool mask over the vocabulary)"""
+        logits = self._logits[:allowed.shape[0]].float()
+        logits = logits.masked_fill(~allowed, float("-inf"))
+        if self._do_sample and self._temperature and self._temperature > 0:
+            probs = torch.softmax(logits / self._temperature, dim=-1)
+            token_id = int(torch.multinomial(probs, 1).item())
+        else:
+            token_id = int(torch.argmax(logits).item())
+        self._feed([token_id])
+        self._generated += 1
+        return token_id
+
+    def _mask(self, ids: List[int]) -> torch.Tensor:
+        mask = torch.zeros(len(self.vocabulary.texts), dtype=torch.bool, device=self.device)
+        if ids:
+            mask[torch.tensor(ids, dtype=torch.long, device=self.device)] = True
+        return mask
+
+    def _out_of_budget(self) -> bool:
+        return self._generated >= self._budget
+
+    # Value samplers. Each returns (value text, literal still to feed, completed)
+
+    def _sample_string(self, closing: str, max_value_tokens: int) -> Tuple[str, str, bool]:
+        # The closing quote may arrive merged with the start of the next literal (e.g. '",')
+        close_ids = self.vocabulary.ids_prefixing(closing, lead='"')
+        allowed = self.vocabulary.string_body_mask(self.device).clone()
+        allowed[torch.tensor(close_ids, dtype=torch.long, device=self.device)] = True
+
+        value_ids: List[int] = []
+        for _ in range(max_value_tokens):
+            if self._out_of_budget():
+                break
+            token_id = self._pick(allowed)
+            text = self.vocabulary.texts[token_id]
+            if text.startswith('"'):
+                return self.tokenizer.decode(value_ids), closing[len(text) - 1:], True
+            value_ids.append(token_id)
+        # Decode the ids together so multi-byte characters split across tokens survive
+        return self.tokenizer.decode(value_ids), '"' + closing, False
+
+    def _sample_number(self, closing: str, max_value_tokens: int) -> Tuple[str, str, bool]:
+        close_ids = self.vocabulary.ids_prefixing(closing)
+        value = ""
+        for _ in range(max_value_tokens):
+            if self._out_of_budget():
+                break
+            candidates = [
+                token_id for token_id in self.vocabulary.number_ids
+                if self._extends(value, self.vocabulary.texts[token_id], _NUMBER_PREFIX.match)
+            ]
+            if self._parse_number(value) is not None:
+                candidates += close_ids
+            if not candidates:
+                break
+            token_id = self._pick(self._mask(candidates))
+            text = self.vocabulary.texts[token_id]
+            if token_id in close_ids:
+                return value, closing[len(text):], True
+            value += text.lstrip(" ")
+        if self._parse_number(value) is None:
+            value = ""
+        return value, closing, False
+
+    def _sample_boolean(self, closing: str) -> Tuple[str, str, bool]:
+        value = ""
+        while value not in ("true", "false") and not self._out_of_budget():
+            candidates = [
+                token_id for token_id in self.vocabulary.boolean_ids
+                if self._extends(value, self.vocabulary.texts[token_id], _is_boolean_prefix)
+            ]
+            if not candidates:
+                break
+            value += self.vocabulary.texts[self._pick(self._mask(candidates))].lstrip(" ")
+        return value, closing, value in ("true", "false")
+
+    @staticmethod
+    def _extends(value: str, text: str, is_prefix) -> bool:
+        """Whether a token continues a value; only the first token may start with a space"""
+        if text.startswith(" "):
+            if value:
+                return False
+            text = text[1:]
+        return bool(is_prefix(value + text))
+
+    @staticmethod
+    def _parse_number(text: str) -> Optional[float]:
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+        return int(number) if re.fullmatch(r"-?[0-9]+", text) else number
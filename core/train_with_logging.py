@@ -9,7 +9,6 @@ from datasets import load_dataset
 from transformers import TrainingArguments
 from trl import SFTTrainer
 import torch
-import pandas as pd
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -23,6 +22,7 @@ from timezone_utils import get_ist_timestamp, get_ist_datetime, convert_to_ist_t
 
 # Import prediction service for model registration
 from services.prediction_service import prediction_service
+from file_manager import file_manager
 from models.prediction_models import ModelInfo, ModelStatus
 
 def setup_model_and_tokenizer():
@@ -50,44 +50,26 @@ def setup_model_and_tokenizer():
     
     return model, tokenizer
 
+def format_training_prompts(examples):
+    """Batched map function rendering instruction/input/output records as prompt text"""
+    instructions = examples["instruction"]
+    inputs = examples.get("input", [""] * len(instructions))  # Handle missing input column
+    outputs = examples["output"]
+    texts = []
+    
+    for instruction, input_text, output in zip(instructions, inputs, outputs):
+        text = f"### Instruction:\n{instruction}\n\n"
+        if input_text and str(input_text).strip() and str(input_text) != 'nan':  # Only add input if it exists and is not empty
+            text += f"### Input:\n{input_text}\n\n"
+        text += f"### Response:\n{output}"
+        texts.append(text)
+    
+    return {"text": texts}
+
 def prepare_dataset_from_file(file_path: str, tokenizer, max_sample_size: int = None):
     """Prepare dataset from CSV, JSON, or JSONL file with optional sampling"""
-    file_extension = os.path.splitext(file_path)[1].lower()
-    
-    if file_extension == '.csv':
-        # Load CSV data
-        df = pd.read_csv(file_path)
-    
-    elif file_extension == '.json':
-        # Load JSON data
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Handle different JSON structures
-        if isinstance(data, list):
-            # Array of objects: [{"instruction": "...", "output": "..."}, ...]
-            df = pd.DataFrame(data)
-        elif isinstance(data, dict):
-            # Check if it's object with arrays: {"instruction": [...], "output": [...]}
-            if all(isinstance(v, list) for v in data.values()):
-                df = pd.DataFrame(data)
-            else:
-                # Single object, convert to single-row DataFrame
-                df = pd.DataFrame([data])
-        else:
-            raise ValueError("Invalid JSON format. Expected array of objects or object with arrays.")
-    
-    elif file_extension == '.jsonl':
-        # Load JSONL data
-        data = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    data.append(json.loads(line))
-        df = pd.DataFrame(data)
-    
-    else:
-        raise ValueError(f"Unsupported file format: {file_extension}")
+    # Only the columns the prompt template uses are loaded
+    df = file_manager.load_dataframe(file_path, columns=["instruction", "input", "output"])
     
     # Apply sampling if max_sample_size is specified
     original_size = len(df)
@@ -100,27 +82,42 @@ def prepare_dataset_from_file(file_path: str, tokenizer, max_sample_size: int =
     else:
         print(f"Using all available data: {original_size} samples")
     
-    def formatting_prompts_func(examples):
-        instructions = examples["instruction"]
-        inputs = examples.get("input", [""] * len(instructions))  # Handle missing input column
-        outputs = examples["output"]
-        texts = []
-        
-        for instruction, input_text, output in zip(instructions, inputs, outputs):
-            text = f"### Instruction:\n{instruction}\n\n"
-            if input_text and str(input_text).strip() and str(input_text) != 'nan':  # Only add input if it exists and is not empty
-                text += f"### Input:\n{input_text}\n\n"
-            text += f"### Response:\n{output}"
-            texts.append(text)
-        
-        return {"text": texts}
-    
     # Convert DataFrame to HuggingFace Dataset
     from datasets import Dataset
     dataset = Dataset.from_pandas(df)
-    dataset = dataset.map(formatting_prompts_func, batched=True)
+    dataset = dataset.map(format_training_prompts, batched=True)
     return dataset
 
+def _stored_dataset_records(dataset_id: str):
+    """A library dataset's examples as records, streamed from its stored segments"""
+    from services.dataset_service import dataset_service
+    
+    lines = dataset_service.iter_data_lines(dataset_id)
+    if lines is None:
+        raise ValueError(f"Dataset with ID {dataset_id} not found or data not accessible")
+    for line in lines:
+        yield json.loads(line)
+
+def prepare_dataset_from_library(dataset_id: str, tokenizer, max_sample_size: int = None):
+    """Prepare a library dataset, read straight from its stored segments, with optional sampling"""
+    from datasets import Dataset
+    
+    # Written to the datasets Arrow cache in batches, keyed by the dataset id:
+    # library datasets never change, so later runs on the same dataset reuse it
+    dataset = Dataset.from_generator(_stored_dataset_records, gen_kwargs={"dataset_id": dataset_id})
+    
+    # Apply sampling if max_sample_size is specified
+    original_size = len(dataset)
+    if max_sample_size is not None and max_sample_size > 0 and max_sample_size < original_size:
+        dataset = dataset.shuffle(seed=42).select(range(max_sample_size))
+        print(f"Dataset sampled: Using {len(dataset)} samples out of {original_size} available ({(len(dataset)/original_size)*100:.1f}%)")
+    elif max_sample_size is not None and max_sample_size >= original_size:
+        print(f"Max sample size ({max_sample_size}) is greater than or equal to available data ({original_size}). Using all data.")
+    else:
+        print(f"Using all available data: {original_size} samples")
+    
+    return dataset.map(format_training_prompts, batched=True)
+
 def prepare_dataset_from_csv(csv_path: str, tokenizer):
     """Prepare dataset from CSV file (legacy function)"""
     return prepare_dataset_from_file(csv_path, tokenizer)
@@ -148,8 +145,8 @@ def prepare_dataset(tokenizer):
     dataset = dataset.map(formatting_prompts_func, batched=True)
     return dataset
 
-def train_with_config(csv_path: str = None, config: dict = None, session_id: str = None):
-    """Train model with configurable parameters and optional CSV data"""
+def train_with_config(csv_path: str = None, config: dict = None, session_id: str = None, dataset_id: str = None):
+    """Train model with configurable parameters and optional CSV data (or a library dataset)"""
     
     # Set default config if not provided
     if config is None:
@@ -424,7 +421,11 @@ def train_with_config(csv_path: str = None, config: dict = None, session_id: str
     
     # Prepare dataset (file or default)
     actual_file_path = None
-    if csv_path and os.path.exists(csv_path):
+    if dataset_id:
+        max_sample_size = config.get("max_sample_size")
+        dataset = prepare_dataset_from_library(dataset_id, tokenizer, max_sample_size)
+        dataset_source = f"Dataset: {dataset_id}"
+    elif csv_path and os.path.exists(csv_path):
         max_sample_size = config.get("max_sample_size")
         dataset = prepare_dataset_from_file(csv_path, tokenizer, max_sample_size)
         file_extension = os.path.splitext(csv_path)[1].upper()
@@ -671,7 +672,8 @@ def train_with_config(csv_path: str = None, config: dict = None, session_id: str
             dataset_info={
                 "source": dataset_source,
                 "size": len(dataset) if dataset else 0,
-                "actual_file_path": actual_file_path  # Pass the actual file path
+                "actual_file_path": actual_file_path,  # Pass the actual file path
+                "dataset_id": dataset_id
             }
         )
         print(f"✅ Model registration completed successfully!")
@@ -781,13 +783,13 @@ def extract_input_schema_from_training(config: dict, dataset_info: dict) -> dict
         dataset_source = dataset_info.get("source", "")
         actual_file_path = dataset_info.get("actual_file_path")
         
-        # If we have a file path, analyze the actual data
-        if "file:" in dataset_source:
+        # If we have a file path or a library dataset, analyze the actual data
+        if "file:" in dataset_source or dataset_info.get("dataset_id"):
             # Extract filename from source like "JSON file: sample_training_data.json"
             filename = dataset_source.split(": ")[-1] if ": " in dataset_source else None
             
             # Try to find and analyze the training data
-            sample_data = None
+            sample_data = _library_dataset_sample(dataset_info)
             possible_paths = []
             
             # First priority: use the actual file path if available
@@ -805,7 +807,7 @@ def extract_input_schema_from_training(config: dict, dataset_info: dict) -> dict
             ])
             
             for path in possible_paths:
-                if path and os.path.exists(path):
+                if sample_data is None and path and os.path.exists(path):
                     try:
                         with open(path, 'r', encoding='utf-8') as f:
                             if path.endswith('.json'):
@@ -897,6 +899,38 @@ def extract_input_schema_from_training(config: dict, dataset_info: dict) -> dict
     return input_schema
 
 
+# Training examples inspected when inferring a model's output schema
+OUTPUT_SCHEMA_SAMPLE_SIZE = 1000
+
+
+def _library_dataset_sample(dataset_info: dict):
+    """First training examples of the library dataset a model was trained on (None for file data)"""
+    dataset_id = dataset_info.get("dataset_id")
+    if not dataset_id:
+        return None
+    
+    from services.dataset_service import dataset_service
+    examples = dataset_service.iter_dataset_data(dataset_id, OUTPUT_SCHEMA_SAMPLE_SIZE)
+    return [example.dict() for example in examples] if examples is not None else None
+
+
+def _output_field_type(value) -> str:
+    """JSON type of an output field value (bool is checked first: it is a subclass of int)"""
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, list):
+        return "array"
+    if value is None:
+        return "null"
+    return "string"
+
+
 def extract_output_schema_from_training(config: dict, dataset_info: dict = None) -> dict:
     """Extract output schema from actual training data"""
     output_schema = {}
@@ -907,10 +941,10 @@ def extract_output_schema_from_training(config: dict, dataset_info: dict = None)
             dataset_source = dataset_info.get("source", "")
             actual_file_path = dataset_info.get("actual_file_path")
             
-            if "file:" in dataset_source:
+            if "file:" in dataset_source or dataset_info.get("dataset_id"):
                 filename = dataset_source.split(": ")[-1] if ": " in dataset_source else None
                 
-                sample_data = None
+                sample_data = _library_dataset_sample(dataset_info)
                 possible_paths = []
                 
                 # First priority: use the actual file path if available
@@ -927,7 +961,7 @@ def extract_output_schema_from_training(config: dict, dataset_info: dict = None)
                 ])
                 
                 for path in possible_paths:
-                    if path and os.path.exists(path):
+                    if sample_data is None and path and os.path.exists(path):
                         try:
                             with open(path, 'r', encoding='utf-8') as f:
                                 if path.endswith('.json'):
@@ -941,48 +975,29 @@ def extract_output_schema_from_training(config: dict, dataset_info: dict = None)
                         except Exception as e:
                             continue
                 
-                # Analyze output format
+                # Analyze output format over many examples, so fields missing
+                # from the first one are still part of the schema
                 if sample_data and isinstance(sample_data, list) and len(sample_data) > 0:
-                    first_example = sample_data[0]
-                    
-                    # Check the output field
-                    if "output" in first_example:
-                        output_value = first_example["output"]
+                    for example in sample_data[:OUTPUT_SCHEMA_SAMPLE_SIZE]:
+                        if not isinstance(example, dict) or "output" not in example:
+                            continue
+                        output_value = example["output"]
                         
-                        # If output is a string, check if it looks like JSON
+                        # If output is a string, check if it is JSON
                         if isinstance(output_value, str):
                             try:
-                                # Try to parse as JSON to see if it's structured
-                                parsed_output = json.loads(output_value)
-                                if isinstance(parsed_output, dict):
-                                    # It's structured JSON, extract schema
-                                    for key, value in parsed_output.items():
-                                        if isinstance(value, str):
-                                            output_schema[key] = "string"
-                                        elif isinstance(value, (int, float)):
-                                            output_schema[key] = "number"
-                                        elif isinstance(value, bool):
-                                            output_schema[key] = "boolean"
-                                        else:
-                                            output_schema[key] = "string"
-                                else:
-                                    # It's a JSON array or primitive
-                                    output_schema["response"] = "string"
+                                output_value = json.loads(output_value)
                             except json.JSONDecodeError:
-                                # It's plain text
-                                output_schema["response"] = "string"
-                        elif isinstance(output_value, dict):
-                            # Output is already a dictionary
+                                pass
+                        
+                        if isinstance(output_value, dict):
+                            # Structured output; a field seen with different types is "mixed"
                             for key, value in output_value.items():
-                                if isinstance(value, str):
-                                    output_schema[key] = "string"
-                                elif isinstance(value, (int, float)):
-                                    output_schema[key] = "number"
-                                elif isinstance(value, bool):
-                                    output_schema[key] = "boolean"
-                                else:
-                                    output_schema[key] = "string"
+                                field_type = _output_field_type(value)
+                                known_type = output_schema.get(key)
+                                output_schema[key] = field_type if known_type in (None, field_type) else "mixed"
                         else:
+                            # Plain text, a JSON array or a primitive
                             output_schema["response"] = "string"
     
     except Exception as e:
@@ -1013,10 +1028,10 @@ def extract_static_instruction_from_training(config: dict, dataset_info: dict =
             dataset_source = dataset_info.get("source", "")
             actual_file_path = dataset_info.get("actual_file_path")
             
-            if "file:" in dataset_source:
+            if "file:" in dataset_source or dataset_info.get("dataset_id"):
                 filename = dataset_source.split(": ")[-1] if ": " in dataset_source else None
                 
-                sample_data = None
+                sample_data = _library_dataset_sample(dataset_info)
                 possible_paths = []
                 
                 # First priority: use the actual file path if available
@@ -1033,7 +1048,7 @@ def extract_static_instruction_from_training(config: dict, dataset_info: dict =
                 ])
                 
                 for path in possible_paths:
-                    if path and os.path.exists(path):
+                    if sample_data is None and path and os.path.exists(path):
                         try:
                             with open(path, 'r', encoding='utf-8') as f:
                                 if path.endswith('.json'):
@@ -257,7 +257,7 @@ export const DataPreparation: React.FC = () => {
               </div>
               <div className="text-center">
                 <div className="text-xl font-bold text-green-600 dark:text-green-400">
-                  {dataset.processing_stats.success_rate.toFixed(1)}%
+                  {(dataset.processing_stats?.success_rate ?? 0).toFixed(1)}%
                 </div>
                 <div className="text-xs text-gray-500 dark:text-gray-400">Success Rate</div>
               </div>
@@ -446,7 +446,7 @@ export const DataPreparation: React.FC = () => {
               </div>
               <div className="bg-orange-50 dark:bg-orange-900/20 p-4 rounded-lg">
                 <div className="text-2xl font-bold text-orange-600 dark:text-orange-400">
-                  {(datasets.reduce((sum, d) => sum + d.processing_stats.success_rate, 0) / datasets.length).toFixed(1)}%
+                  {(datasets.reduce((sum, d) => sum + (d.processing_stats?.success_rate ?? 0), 0) / datasets.length).toFixed(1)}%
                 </div>
                 <div className="text-sm text-orange-800 dark:text-orange-200">
                   Avg Success Rate
@@ -557,13 +557,13 @@ export const DataPreparation: React.FC = () => {
                     </div>
                     <div className="flex items-center space-x-2">
                       <span className={`px-2 py-1 rounded-full text-xs ${
-                        dataset.processing_stats.success_rate >= 90 
+                        (dataset.processing_stats?.success_rate ?? 0) >= 90 
                           ? 'bg-green-100 dark:bg-green-900 text-green-800 dark:text-green-200'
-                          : dataset.processing_stats.success_rate >= 70
+                          : (dataset.processing_stats?.success_rate ?? 0) >= 70
                           ? 'bg-yellow-100 dark:bg-yellow-900 text-yellow-800 dark:text-yellow-200'
                           : 'bg-red-100 dark:bg-red-900 text-red-800 dark:text-red-200'
                       }`}>
-                        {dataset.processing_stats.success_rate.toFixed(1)}% success
+                        {(dataset.processing_stats?.success_rate ?? 0).toFixed(1)}% success
                       </span>
                       <Button
                         variant="outline"
@@ -891,7 +891,7 @@ export const DataPreparation: React.FC = () => {
                   
                   <div className="bg-blue-50 dark:bg-blue-900/20 p-4 rounded-lg">
                     <div className="text-2xl font-bold text-blue-600 dark:text-blue-400">
-                      {previewDataset.processing_stats.success_rate.toFixed(1)}%
+                      {(previewDataset.processing_stats?.success_rate ?? 0).toFixed(1)}%
                     </div>
                     <div className="text-sm text-blue-800 dark:text-blue-200">
                       Success Rate
@@ -914,25 +914,25 @@ export const DataPreparation: React.FC = () => {
                     <div>
                       <span className="text-gray-600 dark:text-gray-400">Input Rows:</span>
                       <span className="ml-2 font-medium">
-                        {previewDataset.processing_stats.total_input_rows.toLocaleString()}
+                        {(previewDataset.processing_stats?.total_input_rows ?? 0).toLocaleString()}
                       </span>
                     </div>
                     <div>
                       <span className="text-gray-600 dark:text-gray-400">Valid Outputs:</span>
                       <span className="ml-2 font-medium">
-                        {previewDataset.processing_stats.valid_output_rows.toLocaleString()}
+                        {(previewDataset.processing_stats?.valid_output_rows ?? 0).toLocaleString()}
                       </span>
                     </div>
                     <div>
                       <span className="text-gray-600 dark:text-gray-400">Skipped Rows:</span>
                       <span className="ml-2 font-medium">
-                        {previewDataset.processing_stats.skipped_rows.toLocaleString()}
+                        {(previewDataset.processing_stats?.skipped_rows ?? 0).toLocaleString()}
                       </span>
                     </div>
                     <div>
                       <span className="text-gray-600 dark:text-gray-400">Avg Instruction Length:</span>
                       <span className="ml-2 font-medium">
-                        {Math.round(previewDataset.processing_stats.instruction_stats.avg_length)} chars
+                        {Math.round(previewDataset.processing_stats?.instruction_stats.avg_length ?? 0)} chars
                       </span>
                     </div>
                   </div>
@@ -373,7 +373,7 @@ export const UploadData: React.FC = () => {
                         </div>
                         <div className="text-center">
                           <div className="text-xl font-bold text-green-600 dark:text-green-400">
-                            {dataset.processing_stats.success_rate.toFixed(1)}%
+                            {(dataset.processing_stats?.success_rate ?? 0).toFixed(1)}%
                           </div>
                           <div className="text-xs text-gray-500 dark:text-gray-400">Success Rate</div>
                         </div>
@@ -442,7 +442,7 @@ export const UploadData: React.FC = () => {
                 <div>
                   <span className="text-sm text-green-700 dark:text-green-300">Success Rate:</span>
                   <div className="text-lg font-bold text-green-800 dark:text-green-200">
-                    {selectedDataset.processing_stats.success_rate.toFixed(1)}%
+                    {(selectedDataset.processing_stats?.success_rate ?? 0).toFixed(1)}%
                   </div>
                 </div>
                 <div>
@@ -30,9 +30,16 @@ export interface ProcessedDataset {
   source_filename: string;
   column_mapping: ColumnMapping;
   total_examples: number;
-  processing_stats: ProcessingStats;
+  processing_stats?: ProcessingStats;
+  status: 'processing' | 'ready' | 'failed';
+  progress: number;
+  rows_processed: number;
+  error?: string;
   file_path: string;
   file_size: number;
+  version: number;
+  parent_id?: string;
+  root_id?: string;
   created_at: string;
   last_modified: string;
   created_by?: string;
@@ -100,9 +107,12 @@ class DatasetService {
   private baseUrl = `${API_BASE_URL_WITH_API}/datasets`;
 
   /**
-   * Create a new processed dataset
+   * Create a new processed dataset and wait for its background build to finish
    */
-  async createDataset(request: DatasetCreateRequest): Promise<DatasetCreateResponse> {
+  async createDataset(
+    request: DatasetCreateRequest,
+    onProgress?: (dataset: ProcessedDataset) => void
+  ): Promise<DatasetCreateResponse> {
     const response = await fetch(`${this.baseUrl}/create`, {
       method: 'POST',
       headers: {
@@ -116,7 +126,36 @@ class DatasetService {
       throw new Error(error.detail || 'Failed to create dataset');
     }
 
-    return response.json();
+    const result: DatasetCreateResponse = await response.json();
+    if (!result.success || !result.dataset_id) {
+      return result;
+    }
+
+    const dataset = await this.waitForDataset(result.dataset_id, onProgress);
+    return { ...result, message: `Dataset '${dataset.name}' created successfully`, dataset };
+  }
+
+  /**
+   * Poll a dataset until its build is no longer processing
+   */
+  async waitForDataset(
+    datasetId: string,
+    onProgress?: (dataset: ProcessedDataset) => void,
+    intervalMs: number = 1000
+  ): Promise<ProcessedDataset> {
+    for (;;) {
+      const { dataset } = await this.getDataset(datasetId);
+      onProgress?.(dataset);
+
+      if (dataset.status === 'failed') {
+        throw new Error(dataset.error || 'Failed to create dataset');
+      }
+      if (dataset.status !== 'processing') {
+        return dataset;
+      }
+
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
   }
 
   /**